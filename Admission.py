@@ -0,0 +1,138 @@
+# Admission.py
+# Kiểm soát tải cho BookingServer: giới hạn tốc độ theo địa chỉ client / số điện thoại
+# (token bucket) và hàng đợi công việc có giới hạn, ưu tiên yêu cầu ghi (đặt / hủy vé)
+# hơn yêu cầu đọc danh mục. Khi quá tải, yêu cầu bị từ chối ngay thay vì xếp hàng vô hạn.
+
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+
+OVERLOADED = {"status": "error", "message": "Máy chủ đang quá tải, vui lòng thử lại sau", "retry": True}
+
+
+def parse_rate(text):
+    """'RATE' hoặc 'RATE/BURST' (yêu cầu mỗi giây / số yêu cầu dồn tối đa) -> (rate, burst)"""
+    rate, _, burst = text.partition('/')
+    rate = float(rate)
+    burst = float(burst) if burst else max(rate, 1.0)
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"Giới hạn tốc độ không hợp lệ: {text}")
+    return rate, burst
+
+
+class RateLimiter:
+    """Token bucket cho từng key: mỗi giây nạp thêm `rate` lượt, dồn tối đa `burst` lượt.
+
+    Chỉ nhớ max_keys key dùng gần nhất; key bị quên coi như có bucket đầy.
+    """
+
+    def __init__(self, rate, burst=None, max_keys=100000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst or rate
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Lấy một lượt; trả về 0 nếu được phép, ngược lại số giây nên chờ"""
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = self.burst
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                self._buckets.move_to_end(key)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / self.rate
+            self._buckets[key] = (tokens - 1, now)
+            return 0
+
+
+class AdmissionControl:
+    """Giới hạn tốc độ theo địa chỉ client và theo số điện thoại; mỗi giới hạn là
+    (rate, burst) hoặc None (tắt)."""
+
+    def __init__(self, address_limit=None, phone_limit=None):
+        self.by_address = RateLimiter(*address_limit) if address_limit else None
+        self.by_phone = RateLimiter(*phone_limit) if phone_limit else None
+        self.rejected = Counter()
+
+    def check(self, address=None, phone=None):
+        """Phản hồi lỗi nếu vượt giới hạn, None nếu được phép"""
+        if self.by_address is not None and address is not None:
+            wait = self.by_address.take(address)
+            if wait:
+                self.rejected['address'] += 1
+                return _too_many(wait)
+        if self.by_phone is not None and isinstance(phone, str):
+            wait = self.by_phone.take(phone)
+            if wait:
+                self.rejected['phone'] += 1
+                return _too_many(wait)
+        return None
+
+
+def _too_many(wait):
+    return {"status": "error", "message": "Quá nhiều yêu cầu, vui lòng thử lại sau",
+            "retry_after": round(wait, 3)}
+
+
+class WorkQueue:
+    """Hàng đợi có ưu tiên với số thread xử lý cố định.
+
+    Yêu cầu ghi được lấy ra trước yêu cầu đọc. Hàng đợi có giới hạn: yêu cầu đọc bị
+    từ chối khi hàng đợi đã đầy read_share phần, yêu cầu ghi chỉ khi đầy hẳn, nên
+    lúc quá tải luôn còn chỗ cho lượt đặt / hủy vé.
+    """
+
+    def __init__(self, workers=32, max_pending=1024, read_share=0.75):
+        self.max_pending = max_pending
+        self.read_limit = int(max_pending * read_share)
+        self.rejected = Counter()
+        self._heap = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = [threading.Thread(target=self._work, name=f"booking-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def submit(self, fn, write=False):
+        """Xếp fn() vào hàng; trả về Future, hoặc None nếu hàng đợi đầy"""
+        with self._cond:
+            if len(self._heap) >= (self.max_pending if write else self.read_limit):
+                self.rejected['write' if write else 'read'] += 1
+                return None
+            future = Future()
+            heapq.heappush(self._heap, (0 if write else 1, next(self._order), fn, future))
+            self._cond.notify()
+        return future
+
+    def run(self, fn, write=False):
+        """Chạy fn() qua hàng đợi và chờ kết quả; OVERLOADED nếu bị từ chối"""
+        future = self.submit(fn, write)
+        return OVERLOADED if future is None else future.result()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, fn, future = heapq.heappop(self._heap)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
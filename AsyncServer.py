@@ -0,0 +1,83 @@
+# AsyncServer.py
+# Chế độ server dùng asyncio: một event loop phục vụ mọi kết nối thay vì
+# mỗi kết nối một thread. Dùng chung BookingServer.admit / process_request nên kết quả
+# trả về giống hệt chế độ threaded; yêu cầu chạy trên hàng đợi công việc có giới hạn.
+
+import asyncio
+
+from Admission import OVERLOADED, WorkQueue
+from Protocol import RECV_SIZE, FrameReader, ProtocolError
+from Subscriptions import StreamChannel
+
+
+class AsyncBookingServer:
+    def __init__(self, server, backlog=1024, max_connections=10000):
+        """server: một BookingServer giữ dữ liệu và xử lý yêu cầu"""
+        self.server = server
+        self.backlog = backlog
+        self.max_connections = max_connections
+        self.active_connections = 0
+        self.rejected_connections = 0
+        self.work_queue = None
+
+    async def handle_client(self, reader, writer):
+        if self.active_connections >= self.max_connections:
+            self.rejected_connections += 1
+            writer.close()
+            return
+
+        self.active_connections += 1
+        self.server.metrics.connection_opened()
+        frames = FrameReader()
+        loop = asyncio.get_running_loop()
+        channel = StreamChannel(loop, writer)
+        address = (writer.get_extra_info('peername') or ('',))[0]
+        try:
+            while True:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    break
+
+                frames.feed(data)
+                replies = [await self._handle_queued(payload, frames.mode, channel, address)
+                           for payload in frames.messages()]
+                if replies:
+                    writer.write(b''.join(replies))
+                    await writer.drain()
+
+        except ProtocolError as e:
+            print(f"❌ Lỗi giao thức từ client {writer.get_extra_info('peername')}: {e}")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.server.availability.unsubscribe(channel)
+            channel.closed = True
+            self.active_connections -= 1
+            self.server.metrics.connection_closed()
+            writer.close()
+
+    async def _handle_queued(self, payload, mode, channel, address):
+        """Mọi yêu cầu chạy qua hàng đợi công việc có giới hạn (nhóm thread), có DB hay không:
+        event loop không bị chặn khi chờ commit, nhiều kết nối cùng góp vào một đợt group commit,
+        và lúc quá tải yêu cầu bị từ chối ngay (ghi được ưu tiên) như ở chế độ threaded."""
+        codec = channel.codec
+        request, response = self.server.admit(payload, mode, channel, address)
+        if response is None:
+            future = self.work_queue.submit(lambda: self.server.process_request(request),
+                                            self.server.is_write(request))
+            response = OVERLOADED if future is None else await asyncio.wrap_future(future)
+        return self.server.encode_response(response, mode, codec)
+
+    async def serve(self):
+        self.work_queue = self.server.work_queue = WorkQueue(self.server.workers, self.server.max_pending)
+        server = await asyncio.start_server(
+            self.handle_client, self.server.host, self.server.port,
+            backlog=self.backlog, reuse_address=True
+        )
+        print(f"🎫 Server đặt vé (asyncio) đang chạy tại {self.server.host}:{self.server.port}")
+        print(f"Backlog: {self.backlog}, tối đa {self.max_connections} kết nối")
+        async with server:
+            await server.serve_forever()
+
+    def start_server(self):
+        asyncio.run(self.serve())
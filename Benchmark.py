@@ -0,0 +1,868 @@
+# Benchmark.py
+# Các bài đo / kiểm tra tải cho BookingServer, chạy trực tiếp trong tiến trình
+# hoặc qua socket thật với nhiều client đồng thời (load).
+#   python Benchmark.py stress --threads 64
+#   python Benchmark.py load --spawn async --clients 100 --duration 20 --output async.json
+#   python Benchmark.py codec --services 500 --bookings 2000
+#   python Benchmark.py search --services 10000
+#   python Benchmark.py inventory --services 200 --days 1 30 365
+#   python Benchmark.py report --bookings 1000000
+#   python Benchmark.py bookings --bookings 200000
+
+import argparse
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from Bookings import Booking, format_time
+from Codec import CODECS
+from Database import BookingStore
+from Inventory import Inventory
+from Protocol import FRAMED, LEGACY, Connection, ProtocolError
+from Search import CatalogIndex, fold
+from SeatMap import SeatGrid, SeatMap
+from Server import BOOK_ACTIONS, MAX_HOLD_TTL, SEARCH_FIELDS, SERVICE_KEYS, BookingServer, describe_bus
+
+
+def _customer(i):
+    return {'name': f"Khách {i}", 'phone': f"09{i:08d}", 'email': ""}
+
+
+# --- Đặt vé đồng thời: không được bán quá số ghế ---
+def stress_booking(threads=64, rounds=200, max_group=4, cancel_ratio=0.2, seed=None):
+    """Nhiều thread cùng đặt / hủy vé tất cả xe / phim, sau đó đối soát.
+
+    Trả về dict kết quả; 'oversold', 'duplicate_seats' và 'free_mismatch' phải bằng 0.
+    """
+    server = BookingServer()
+    services = [('book_bus', 'bus_id', bus_id) for bus_id in server.buses]
+    services += [('book_movie', 'movie_id', movie_id) for movie_id in server.movies]
+    start = threading.Barrier(threads)
+    results = Counter()
+    results_lock = threading.Lock()
+
+    # Đổi thread thật thường xuyên để lộ ra mọi xen kẽ giữa kiểm tra và ghi
+    old_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+
+    def worker(n):
+        rng = random.Random(None if seed is None else seed + n)
+        local = Counter()
+        mine = []
+        start.wait()
+        for i in range(rounds):
+            if mine and rng.random() < cancel_ratio:
+                response = server.process_request({'action': 'cancel_booking', 'booking_id': mine.pop()})
+                local['cancelled'] += response['status'] == 'success'
+                continue
+            action, key, service_id = rng.choice(services)
+            response = server.process_request({
+                'action': action,
+                key: service_id,
+                'seats': rng.randint(1, max_group),
+                'customer': _customer(n * rounds + i)
+            })
+            local[response['status']] += 1
+            if response['status'] == 'success':
+                mine.append(response['booking_info']['booking_id'])
+        with results_lock:
+            results.update(local)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    began = time.perf_counter()
+    try:
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+    finally:
+        sys.setswitchinterval(old_interval)
+    elapsed = time.perf_counter() - began
+
+    # Đối soát: ghế trong các booking phải khớp ghế đã đánh dấu, không trùng, không vượt tổng
+    oversold = 0
+    duplicate_seats = 0
+    free_mismatch = 0
+    today = server.inventory.today()
+    for kind, catalog in (('bus', server.buses), ('movie', server.movies)):
+        for service_id, service in catalog.items():
+            seats = [seat for booking in server.bookings.values()
+                     if booking.type == kind and booking.service_id == service_id
+                     for seat in booking.seats]
+            oversold += max(0, len(seats) - service['total_seats'])
+            duplicate_seats += len(seats) - len(set(seats))
+            # Số ghế trống phải khớp với số ghế còn nằm trong booking
+            free_mismatch += abs(service['total_seats'] - server.inventory.available(kind, service_id, today) - len(seats))
+
+    return {
+        'threads': threads,
+        'requests': threads * rounds,
+        'success': results['success'],
+        'rejected': results['error'],
+        'cancelled': results['cancelled'],
+        'bookings': len(server.bookings),
+        'oversold': oversold,
+        'duplicate_seats': duplicate_seats,
+        'free_mismatch': free_mismatch,
+        'seconds': round(elapsed, 3)
+    }
+
+
+
+# --- Kiểm tra nhanh: yêu cầu sai dạng, trường hợp biên ---
+def check_requests():
+    """Gửi các yêu cầu biên tới một BookingServer mới.
+
+    Trả về danh sách (tên kiểm tra, đạt hay không).
+    """
+    server = BookingServer()
+    bus_id = next(iter(server.buses))
+    checks = []
+
+    # Mã xe không phải chuỗi trong batch: chỉ yêu cầu đó hỏng, yêu cầu còn lại vẫn đặt được
+    response = server.process_request({'action': 'batch', 'requests': [
+        {'action': 'book_bus', 'bus_id': {}, 'seats': 1, 'customer': _customer(0)},
+        {'action': 'book_bus', 'bus_id': bus_id, 'seats': 1, 'customer': _customer(1)}]})
+    results = response.get('results') or [{}, {}]
+    checks.append(("batch: mã xe dạng dict", response['status'] == 'success'
+                   and results[0].get('message') == "Mã xe không tồn tại"
+                   and results[1].get('status') == 'success'))
+    response = server.process_request({'action': 'batch', 'atomic': True, 'requests': [
+        {'action': 'book_movie', 'movie_id': [], 'seats': 1, 'customer': _customer(2)},
+        {'action': 'book_bus', 'bus_id': bus_id, 'seats': 1, 'customer': _customer(3)}]})
+    checks.append(("batch atomic: mã phim dạng list", response.get('failed_index') == 0))
+    response = server.process_request({'action': 'book_bus', 'bus_id': {}, 'seats': 1, 'customer': _customer(4)})
+    checks.append(("book_bus: mã xe dạng dict", response.get('message') == "Mã xe không tồn tại"))
+
+    # Mã đặt vé / giữ chỗ không phải chuỗi: báo không tồn tại, kể cả trong batch
+    response = server.process_request({'action': 'cancel_booking', 'booking_id': {}})
+    checks.append(("cancel_booking: mã đặt vé dạng dict", response.get('message') == "Mã đặt vé không tồn tại"))
+    response = server.process_request({'action': 'batch', 'requests': [{'action': 'cancel_booking', 'booking_id': []}]})
+    results = response.get('results') or [{}]
+    checks.append(("batch: mã đặt vé dạng list", results[0].get('message') == "Mã đặt vé không tồn tại"))
+    response = server.process_request({'action': 'confirm_hold', 'hold_id': {}})
+    checks.append(("confirm_hold: mã giữ chỗ dạng dict", response['status'] == 'error'))
+
+    # Thời gian giữ chỗ ngoài 1-MAX_HOLD_TTL giây bị từ chối, kể cả số lẻ dưới 1
+    for ttl, ok in ((0.2, False), (0, False), (1, True), (MAX_HOLD_TTL, True), (MAX_HOLD_TTL + 1, False)):
+        response = server.process_request({'action': 'hold_bus', 'bus_id': bus_id, 'seats': 1, 'ttl': ttl,
+                                           'customer': _customer(6)})
+        checks.append((f"hold ttl={ttl}", (response['status'] == 'success') == ok))
+
+    # Báo cáo lọc theo loại: tổng và theo giờ chỉ tính vé của loại đó
+    movie_id = next(iter(server.movies))
+    server.process_request({'action': 'book_movie', 'movie_id': movie_id, 'seats': 2, 'customer': _customer(5)})
+    for kind in ('bus', 'movie'):
+        data = server.process_request({'action': 'report', 'type': kind})['data']
+        seats = sum(tally['seats'] for tally in data['by_service'].values())
+        checks.append((f"report type={kind}: tổng và theo giờ khớp theo dịch vụ",
+                       data['totals']['seats'] == seats == sum(tally['seats'] for tally in data['by_hour'].values())))
+    return checks
+
+# --- Sơ đồ ghế: bytearray so với list nhãn ghế ---
+def bench_seatmap(seats=50000, ops=20000, seed=1):
+    """Đặt / hủy ngẫu nhiên từng cặp ghế trên một sân lớn đã kín 90% chỗ"""
+    rng = random.Random(seed)
+    filled = seats * 9 // 10
+
+    seat_map = SeatMap(seats)
+    seat_map.allocate(filled)
+    began = time.perf_counter()
+    for _ in range(ops):
+        seat = rng.randrange(filled)
+        seat_map.release([seat, seat + 1])
+        seat_map.allocate(2)
+    seatmap_seconds = time.perf_counter() - began
+
+    # Cách cũ: list số ghế, hủy bằng list.remove
+    booked = list(range(1, filled + 1))
+    began = time.perf_counter()
+    for _ in range(ops):
+        seat = rng.randrange(1, filled)
+        booked.remove(seat)
+        booked.remove(seat + 1)
+        booked.append(seat)
+        booked.append(seat + 1)
+    list_seconds = time.perf_counter() - began
+
+    return {
+        'seats': seats,
+        'ops': ops,
+        'seatmap_us_per_op': round(seatmap_seconds / ops * 1e6, 2),
+        'list_us_per_op': round(list_seconds / ops * 1e6, 2),
+        'seatmap_bytes': len(seat_map._state),
+        'list_bytes': sys.getsizeof(booked) + sum(sys.getsizeof(s) for s in booked)
+    }
+
+
+# --- Tra cứu booking theo số điện thoại với 1 triệu booking trong bộ nhớ ---
+def bench_phone_index(bookings=1000000, phones=200000, queries=10000, scans=3, seed=1):
+    """So sánh get_bookings (dùng chỉ mục) với cách quét toàn bộ bảng như trước"""
+    rng = random.Random(seed)
+    server = BookingServer()
+    customers = [_customer(i) for i in range(phones)]
+
+    began = time.perf_counter()
+    for i in range(bookings):
+        server._add_booking(Booking(f"B{i:09d}", 'bus', 'XE001', server.buses['XE001']['route'], "2026-01-01",
+                                    customers[rng.randrange(phones)], [1], server.buses['XE001']['price']))
+    load_seconds = time.perf_counter() - began
+
+    lookups = [customers[rng.randrange(phones)]['phone'] for _ in range(queries)]
+    began = time.perf_counter()
+    found = 0
+    for phone in lookups:
+        found += server.get_bookings(phone)['count']
+    index_seconds = time.perf_counter() - began
+
+    # Cách cũ: duyệt mọi booking
+    began = time.perf_counter()
+    for phone in lookups[:scans]:
+        [b for b in server.bookings.values() if b.phone == phone]
+    scan_seconds = time.perf_counter() - began
+
+    return {
+        'bookings': bookings,
+        'phones': phones,
+        'load_seconds': round(load_seconds, 2),
+        'avg_bookings_per_phone': round(found / queries, 2),
+        'index_us_per_query': round(index_seconds / queries * 1e6, 2),
+        'scan_us_per_query': round(scan_seconds / scans * 1e6, 2)
+    }
+
+
+# --- Ghi booking bền vững vào SQLite với group commit ---
+def bench_store(path, threads=32, bookings=5000, synchronous='FULL'):
+    """Nhiều thread đặt / hủy vé với BookingStore; đo số lần ghi mỗi giây và số lần commit"""
+    store = BookingStore(path, synchronous=synchronous)
+    server = BookingServer(store=store)
+    per_thread = bookings // threads
+    start = threading.Barrier(threads)
+
+    def worker(n):
+        start.wait()
+        for i in range(per_thread):
+            response = server.book_bus('XE001', 1, _customer(n))
+            if response['status'] == 'success':
+                server.cancel_booking(response['booking_info']['booking_id'])
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    began = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - began
+    store.close()
+
+    return {
+        'threads': threads,
+        'writes': store.writes,
+        'commits': store.commits,
+        'writes_per_commit': round(store.writes / max(store.commits, 1), 1),
+        'writes_per_second': round(store.writes / elapsed),
+        'seconds': round(elapsed, 3)
+    }
+
+
+# --- Xếp nhóm ngồi liền nhau: chỉ mục dãy trống so với quét từng hàng ---
+def _naive_find_block(seat_map, count):
+    """Cách đơn giản: duyệt từng hàng, từng ghế để tìm `count` ghế trống liền nhau"""
+    cols = seat_map.seats_per_row
+    for row_start in range(0, seat_map.total, cols):
+        run = 0
+        for index in range(row_start, min(row_start + cols, seat_map.total)):
+            run = run + 1 if seat_map.is_free(index) else 0
+            if run == count:
+                return index - count + 1
+    return -1
+
+
+def bench_contiguous(rows=200, cols=50, occupancy=0.8, queries=2000, seed=1):
+    """Rạp lớn đã bán lẻ tẻ `occupancy` số ghế; tìm dãy ghế liền nhau cho nhóm 2-10 người"""
+    rng = random.Random(seed)
+    seat_map = SeatGrid(rows * cols, cols)
+    seat_map.take(rng.sample(range(rows * cols), int(rows * cols * occupancy)))
+    groups = [rng.randint(2, 10) for _ in range(queries)]
+
+    began = time.perf_counter()
+    indexed = [seat_map.find_block(n) for n in groups]
+    index_seconds = time.perf_counter() - began
+
+    began = time.perf_counter()
+    naive = [_naive_find_block(seat_map, n) for n in groups]
+    naive_seconds = time.perf_counter() - began
+
+    return {
+        'seats': rows * cols,
+        'occupancy': occupancy,
+        'longest_run': seat_map.longest_run(),
+        'same_result': indexed == naive,
+        'index_us_per_query': round(index_seconds / queries * 1e6, 2),
+        'naive_us_per_query': round(naive_seconds / queries * 1e6, 2)
+    }
+
+
+# --- Codec: kích thước và thời gian mã hóa / giải mã các thông điệp điển hình ---
+def _codec_messages(services, bookings):
+    """Thông điệp mẫu lấy khuôn từ phản hồi thật của server, nhân lên tới kích thước cần đo"""
+    server = BookingServer(port=0)
+    bus = server.get_buses()['data'][0]
+    booked = server.book_bus(bus['id'], 2, _customer(1))
+    info = booked['booking_info']
+    catalog = [dict(bus, id=f"XE{i:05d}", available_seats=i % 40) for i in range(services)]
+    history = [dict(info, booking_id=f"{info['booking_id'][:4]}{i:06d}", seats=[i % 40 + 1, i % 40 + 2])
+               for i in range(bookings)]
+    return {
+        'book_request': {'action': 'book_bus', 'bus_id': bus['id'], 'seats': 2, 'customer': _customer(1)},
+        'book_response': booked,
+        'catalog': {'status': 'success', 'data': catalog, 'version': 1},
+        'bookings': {'status': 'success', 'data': history, 'count': len(history)}
+    }
+
+
+def bench_codec(services=200, bookings=1000, min_seconds=0.2):
+    """Mỗi codec: số byte, µs mã hóa và giải mã cho từng thông điệp (lặp tới khi đủ min_seconds)"""
+    result = {}
+    for name, message in _codec_messages(services, bookings).items():
+        result[name] = {}
+        for codec in CODECS.values():
+            payload = codec.encode(message)
+            if codec.decode(payload) != message:
+                raise AssertionError(f"{codec.name} giải mã sai thông điệp {name}")
+            timings = []
+            for step in (lambda: codec.encode(message), lambda: codec.decode(payload)):
+                rounds = 0
+                began = time.perf_counter()
+                while time.perf_counter() - began < min_seconds:
+                    step()
+                    rounds += 1
+                timings.append((time.perf_counter() - began) / rounds)
+            result[name][codec.name] = {
+                'bytes': len(payload),
+                'encode_us': round(timings[0] * 1e6, 2),
+                'decode_us': round(timings[1] * 1e6, 2)
+            }
+    return result
+
+
+# --- Tìm kiếm danh mục: chỉ mục so với duyệt cả danh sách ---
+CITIES = ('Hà Nội', 'Hải Phòng', 'TP.HCM', 'Đà Lạt', 'Sapa', 'Đà Nẵng', 'Huế', 'Nha Trang',
+          'Cần Thơ', 'Vinh', 'Quy Nhơn', 'Hạ Long', 'Ninh Bình', 'Vũng Tàu', 'Buôn Ma Thuột', 'Lào Cai')
+
+
+def _naive_search(services, params):
+    """Cách cũ: duyệt mọi xe, so chuỗi đã bỏ dấu, rồi sắp xếp và cắt trang"""
+    words = fold(params.get('q', '')).split()
+    low, high = params.get('departure') or (None, None)
+    matched = [bus for bus in services.values()
+               if all(any(token.startswith(word) for token in fold(bus['route']).replace('-', ' ').split())
+                      for word in words)
+               and (low is None or bus['departure'] >= low) and (high is None or bus['departure'] <= high)
+               and bus['seat_map'].free_count >= params.get('min_available', 0)]
+    key = params.get('sort', 'id').lstrip('-')
+    matched.sort(key=lambda bus: (bus[key], bus['id']), reverse=params.get('sort', '').startswith('-'))
+    return [bus['id'] for bus in matched[:params.get('limit', 20)]]
+
+
+def bench_search(services=10000, queries=2000, seed=1):
+    """Danh mục `services` tuyến xe ngẫu nhiên; đo µs mỗi lượt tìm với vài kiểu truy vấn"""
+    rng = random.Random(seed)
+    buses = {}
+    for i in range(services):
+        origin, destination = rng.sample(CITIES, 2)
+        seat_map = SeatMap(40)
+        seat_map.allocate(rng.randint(0, 40))
+        buses[f"XE{i:05d}"] = {'id': f"XE{i:05d}", 'route': f"{origin} - {destination}",
+                               'departure': f"{rng.randrange(24):02d}:{rng.choice((0, 15, 30, 45)):02d}",
+                               'arrival': "", 'price': rng.randrange(100, 600) * 1000,
+                               'total_seats': 40, 'seat_map': seat_map}
+    began = time.perf_counter()
+    index = CatalogIndex(buses, *SEARCH_FIELDS['bus'])
+    build_seconds = time.perf_counter() - began
+
+    shapes = {
+        'route': lambda: {'q': fold(rng.choice(CITIES))},
+        'route_prefix': lambda: {'q': fold(rng.choice(CITIES))[:3]},
+        'two_cities': lambda: {'q': ' '.join(fold(city) for city in rng.sample(CITIES, 2))},
+        'departure_range': lambda: {'departure': ['06:00', '09:00'], 'sort': 'departure'},
+        'route_seats_sorted': lambda: {'q': fold(rng.choice(CITIES)), 'min_available': 5, 'sort': '-price'},
+        'all_by_price': lambda: {'sort': 'price'},
+    }
+    available = lambda service_id: buses[service_id]['seat_map'].free_count
+    describe = lambda service_id: describe_bus(buses[service_id], available(service_id))
+    result = {'services': services, 'build_ms': round(build_seconds * 1000, 1)}
+    for name, make in shapes.items():
+        params = [make() for _ in range(queries)]
+        began = time.perf_counter()
+        found = [index.search(p, available, describe) for p in params]
+        index_seconds = time.perf_counter() - began
+        sample = params[:max(1, queries // 20)]
+        began = time.perf_counter()
+        naive = [_naive_search(buses, p) for p in sample]
+        naive_seconds = time.perf_counter() - began
+        result[name] = {
+            'index_us': round(index_seconds / queries * 1e6, 1),
+            'naive_us': round(naive_seconds / len(sample) * 1e6, 1),
+            'avg_total': round(sum(r['total'] for r in found) / queries, 1),
+            'same_result': all([item['id'] for item in r['data']] == n for r, n in zip(found, naive))
+        }
+    return result
+
+
+# --- Báo cáo doanh thu: bộ đếm cộng dồn so với duyệt cả bảng booking ---
+def bench_report(bookings=1000000, queries=1000, scans=3, seed=1):
+    """Nạp `bookings` booking rải trên mọi dịch vụ và 48 giờ, hủy 10%, rồi so sánh action
+    'report' với cách cũ (duyệt self.bookings cộng total_price)"""
+    rng = random.Random(seed)
+    server = BookingServer()
+    services = [('bus', bus) for bus in server.buses.values()] + [('movie', movie) for movie in server.movies.values()]
+    start = int(time.mktime((2026, 1, 1, 0, 0, 0, 0, 0, -1)))
+
+    began = time.perf_counter()
+    for i in range(bookings):
+        kind, service = rng.choice(services)
+        seats = rng.randint(1, 4)
+        server._add_booking(Booking(f"B{i:09d}", kind, service['id'], service['id'], "2026-01-01",
+                                    _customer(i % 100000), list(range(seats)), service['price'] * seats,
+                                    start + i % 48 * 3600))
+    load_seconds = time.perf_counter() - began
+    for i in range(0, bookings, 10):
+        booking = server._remove_booking(f"B{i:09d}", persist=False)
+        server.report.refund(booking)
+
+    began = time.perf_counter()
+    for _ in range(queries):
+        report = server.process_request({'action': 'report', 'hours': 48})['data']
+    report_seconds = time.perf_counter() - began
+
+    # Cách cũ: duyệt mọi booking
+    began = time.perf_counter()
+    for _ in range(scans):
+        revenue = {}
+        for booking in server.bookings.values():
+            revenue[booking.service_id] = revenue.get(booking.service_id, 0) + booking.total_price
+    scan_seconds = time.perf_counter() - began
+
+    return {
+        'bookings': bookings,
+        'load_seconds': round(load_seconds, 2),
+        'report_us': round(report_seconds / queries * 1e6, 1),
+        'scan_ms': round(scan_seconds / scans * 1000, 1),
+        'same_result': all(report['by_service'][service_id]['net_revenue'] == total
+                           for service_id, total in revenue.items())
+    }
+
+
+# --- Bộ nhớ của bảng booking: dict như trước so với bản ghi Booking ---
+def bench_bookings(bookings=200000, customers=50000, seed=1):
+    """Dựng `bookings` booking từ yêu cầu đã giải mã JSON (như server nhận qua socket), một lần
+    bằng dict như trước, một lần bằng Booking; đo bộ nhớ còn giữ lại bằng tracemalloc"""
+    rng = random.Random(seed)
+    server = BookingServer()
+    services = [('bus', bus) for bus in server.buses.values()] + [('movie', movie) for movie in server.movies.values()]
+    booked_at = int(time.time())
+    requests = []
+    for i in range(bookings):
+        kind, service = rng.choice(services)
+        seat_map = server.inventory.seat_map(kind, service['id'], "2026-01-01")
+        seats = seat_map.labels(rng.sample(range(seat_map.total), rng.randint(1, 4)))
+        requests.append(json.dumps({'type': kind, 'service_id': service['id'], 'date': "2026-01-01",
+                                    'customer': _customer(rng.randrange(customers)), 'seats': seats}).encode('utf-8'))
+    prices = {service['id']: service['price'] for _, service in services}
+
+    def as_dict(i, request):
+        return {
+            'booking_id': f"B{i:09d}",
+            'type': request['type'],
+            'service_id': request['service_id'],
+            'service_name': request['service_id'],
+            'date': request['date'],
+            'customer': request['customer'],
+            'seats': request['seats'],
+            'total_price': prices[request['service_id']] * len(request['seats']),
+            'booking_time': format_time(booked_at)
+        }
+
+    def as_record(i, request):
+        return Booking(f"B{i:09d}", request['type'], request['service_id'], request['service_id'], request['date'],
+                       request['customer'], request['seats'],
+                       prices[request['service_id']] * len(request['seats']), booked_at)
+
+    result = {'bookings': bookings, 'customers': customers}
+    tables = {}
+    for name, build in (('dict', as_dict), ('record', as_record)):
+        tracemalloc.start()
+        began = time.perf_counter()
+        tables[name] = {f"B{i:09d}": build(i, json.loads(request)) for i, request in enumerate(requests)}
+        elapsed = time.perf_counter() - began
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        result[f"{name}_bytes_per_booking"] = round(size / bookings, 1)
+        result[f"{name}_build_seconds"] = round(elapsed, 2)
+    result['memory_ratio'] = round(result['dict_bytes_per_booking'] / result['record_bytes_per_booking'], 2)
+
+    began = time.perf_counter()
+    serialized = [booking.to_dict() for booking in tables['record'].values()]
+    result['to_dict_us'] = round((time.perf_counter() - began) / bookings * 1e6, 2)
+    result['same_response'] = serialized == list(tables['dict'].values())
+    return result
+
+
+# --- Tồn kho theo ngày: tra một chuyến không chậm đi khi lịch sử tích lũy ---
+def bench_inventory(services=200, days=(1, 30, 365), lookups=200000, seed=1):
+    """Mỗi ngày `services` chuyến đã có người đặt; đo µs tra sơ đồ ghế của một chuyến hôm nay
+    khi đã tích lũy 1 / 30 / 365 ngày, và thời gian gỡ ngày cũ nhất khỏi bộ nhớ"""
+    rng = random.Random(seed)
+    catalog = {'bus': {f"XE{i:05d}": {'id': f"XE{i:05d}", 'total_seats': 40} for i in range(services)}}
+    service_ids = list(catalog['bus'])
+    first = datetime.date(2025, 1, 1)
+    result = {'services': services}
+    for history in days:
+        today = first + datetime.timedelta(days=history - 1)
+        inventory = Inventory(catalog, lambda kind, service: SeatMap(service['total_seats']),
+                              retention_days=history, clock=lambda: today)
+        dates = [(first + datetime.timedelta(days=d)).isoformat() for d in range(history)]
+        for date in dates:
+            for service_id in service_ids:
+                inventory.seat_map('bus', service_id, date).allocate(rng.randint(0, 40))
+        targets = [rng.choice(service_ids) for _ in range(lookups)]
+        date = today.isoformat()
+
+        began = time.perf_counter()
+        for service_id in targets:
+            inventory.seat_map('bus', service_id, date)
+        lookup_seconds = time.perf_counter() - began
+        began = time.perf_counter()
+        inventory.evict_before(dates[1] if history > 1 else date)
+        evict_seconds = time.perf_counter() - began
+
+        result[f'{history}_days'] = {
+            'trips': history * services,
+            'lookup_us': round(lookup_seconds / lookups * 1e6, 3),
+            'evict_ms': round(evict_seconds * 1000, 3)
+        }
+    return result
+
+
+# --- Tạo tải qua socket thật: nhiều client đồng thời, đo độ trễ / thông lượng ---
+DEFAULT_MIX = "get_buses=30,get_movies=30,book_bus=10,book_movie=10,get_bookings=10,cancel_booking=10"
+LOAD_ACTIONS = ('get_buses', 'get_movies', 'book_bus', 'book_movie', 'get_bookings', 'cancel_booking')
+
+
+def _parse_mix(text):
+    """'get_buses=30,book_bus=10,...' -> [(action, trọng số)]"""
+    mix = []
+    for part in text.split(','):
+        action, _, weight = part.partition('=')
+        action = action.strip()
+        if action not in LOAD_ACTIONS:
+            raise ValueError(f"Hành động không hỗ trợ trong mix: {action}")
+        mix.append((action, float(weight or 1)))
+    return mix
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _latency_summary(latencies):
+    ordered = sorted(latencies)
+    return {
+        'count': len(ordered),
+        'p50_ms': round(_percentile(ordered, 0.50) * 1000, 3),
+        'p99_ms': round(_percentile(ordered, 0.99) * 1000, 3),
+        'p999_ms': round(_percentile(ordered, 0.999) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0
+    }
+
+
+def _booked_seats(conn):
+    """Số ghế đã bán của từng dịch vụ theo danh mục server, cùng tổng ghế"""
+    seats = {}
+    for action, kind in (('get_buses', 'bus'), ('get_movies', 'movie')):
+        for item in conn.request({'action': action})['data']:
+            seats[(kind, item['id'])] = (item['total_seats'] - item['available_seats'], item['total_seats'])
+    return seats
+
+
+def load_test(host='localhost', port=9999, clients=50, duration=10.0, mix=DEFAULT_MIX, max_group=2,
+              framing=FRAMED, seed=None, codec=None):
+    """Mỗi client là một thread với kết nối riêng, gửi yêu cầu theo tỉ lệ trong mix tới khi hết giờ.
+
+    Sau khi chạy, đối soát số ghế đã bán trên server với các lượt đặt / hủy thành công:
+    'oversold' (bán quá tổng ghế) và 'seat_mismatch' (lệch sổ) phải bằng 0.
+    codec: tên codec các client thỏa thuận với server (None: JSON).
+    """
+    actions, weights = zip(*_parse_mix(mix))
+    probe = Connection.open(host, port, framing, codec=codec)
+    catalog = {'bus': [item['id'] for item in probe.request({'action': 'get_buses'})['data']],
+               'movie': [item['id'] for item in probe.request({'action': 'get_movies'})['data']]}
+    before = _booked_seats(probe)
+
+    start = threading.Barrier(clients + 1)
+    latencies = {action: [] for action in actions}
+    counts = Counter()
+    seat_delta = Counter()
+    merge_lock = threading.Lock()
+
+    def client(n):
+        rng = random.Random(None if seed is None else seed + n)
+        customer = _customer(n)
+        mine = []
+        local_latency = {action: [] for action in actions}
+        local_counts = Counter()
+        local_delta = Counter()
+        conn = Connection.open(host, port, framing, codec=codec)
+        start.wait()
+        deadline = time.perf_counter() + duration
+        try:
+            while time.perf_counter() < deadline:
+                action = rng.choices(actions, weights)[0]
+                if action in ('book_bus', 'book_movie'):
+                    kind = BOOK_ACTIONS[action]
+                    request = {'action': action, SERVICE_KEYS[kind]: rng.choice(catalog[kind]),
+                               'seats': rng.randint(1, max_group), 'customer': customer}
+                elif action == 'cancel_booking':
+                    if not mine:
+                        continue
+                    booking = mine.pop(rng.randrange(len(mine)))
+                    request = {'action': action, 'booking_id': booking['booking_id']}
+                elif action == 'get_bookings':
+                    request = {'action': action, 'customer_phone': customer['phone']}
+                else:
+                    request = {'action': action}
+
+                began = time.perf_counter()
+                try:
+                    response = conn.request(request)
+                except (OSError, ProtocolError):
+                    local_counts['failed'] += 1
+                    conn.close()
+                    conn = Connection.open(host, port, framing, codec=codec)
+                    continue
+                local_latency[action].append(time.perf_counter() - began)
+
+                if response.get('status') != 'success':
+                    # Hết chỗ, mã không tồn tại...: lỗi nghiệp vụ hợp lệ, không phải lỗi server
+                    local_counts['rejected'] += 1
+                    continue
+                local_counts['ok'] += 1
+                if action in ('book_bus', 'book_movie'):
+                    info = response['booking_info']
+                    mine.append(info)
+                    local_delta[(info['type'], info['service_id'])] += len(info['seats'])
+                elif action == 'cancel_booking':
+                    local_delta[(booking['type'], booking['service_id'])] -= len(booking['seats'])
+        finally:
+            conn.close()
+            with merge_lock:
+                for action, values in local_latency.items():
+                    latencies[action].extend(values)
+                counts.update(local_counts)
+                seat_delta.update(local_delta)
+
+    threads = [threading.Thread(target=client, args=(n,), daemon=True) for n in range(clients)]
+    for t in threads:
+        t.start()
+    start.wait()
+    began = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+
+    after = _booked_seats(probe)
+    probe.close()
+    oversold = sum(max(0, booked - total) for booked, total in after.values())
+    seat_mismatch = sum(abs(after[key][0] - before[key][0] - seat_delta[key]) for key in after)
+
+    requests = sum(len(values) for values in latencies.values())
+    return {
+        'clients': clients,
+        'codec': codec or 'json',
+        'seconds': round(elapsed, 3),
+        'requests': requests,
+        'throughput_rps': round(requests / elapsed, 1),
+        'ok': counts['ok'],
+        'rejected': counts['rejected'],
+        'failed': counts['failed'],
+        'oversold': oversold,
+        'seat_mismatch': seat_mismatch,
+        'latency': _latency_summary([v for values in latencies.values() for v in values]),
+        'by_action': {action: _latency_summary(values) for action, values in latencies.items()}
+    }
+
+
+def _spawn_server(kind, port):
+    """Chạy server cần đo trong tiến trình riêng (không tranh GIL với bộ tạo tải)"""
+    script = 'Cluster.py' if kind == 'cluster' else 'Server.py'
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), script), '--port', str(port)]
+    if kind != 'cluster':
+        command += ['--mode', kind]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            Connection.open('localhost', port).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Server không khởi động được")
+
+
+def _compare(result, baseline):
+    """In chênh lệch so với một lần chạy đã lưu"""
+    print(f"\n{'so với lần trước':<24} {'trước':>12} {'nay':>12} {'thay đổi':>10}")
+    rows = [('throughput_rps', baseline['throughput_rps'], result['throughput_rps'])]
+    rows += [(key, baseline['latency'][key], result['latency'][key]) for key in ('p50_ms', 'p99_ms', 'p999_ms')]
+    for key, old, new in rows:
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "-"
+        print(f"{key:<24} {old:>12} {new:>12} {change:>10}")
+
+
+def _print_result(result, indent=0):
+    for key, value in result.items():
+        if isinstance(value, dict):
+            print(f"{' ' * indent}{key}")
+            _print_result(value, indent + 2)
+        else:
+            print(f"{' ' * indent}{key:<{24 - indent}} {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo hiệu năng / kiểm tra tải BookingServer")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('stress', help="Đặt vé đồng thời, kiểm tra không bán quá số ghế")
+    p.add_argument('--threads', type=int, default=64)
+    p.add_argument('--rounds', type=int, default=200)
+    p.add_argument('--max-group', type=int, default=4)
+    p.add_argument('--cancel-ratio', type=float, default=0.2)
+    p.add_argument('--seed', type=int)
+
+    commands.add_parser('check', help="Kiểm tra nhanh các yêu cầu sai dạng / trường hợp biên")
+
+    p = commands.add_parser('seatmap', help="So sánh SeatMap với danh sách ghế kiểu cũ")
+    p.add_argument('--seats', type=int, default=50000)
+    p.add_argument('--ops', type=int, default=20000)
+
+    p = commands.add_parser('phone-index', help="Tra cứu get_bookings với 1 triệu booking")
+    p.add_argument('--bookings', type=int, default=1000000)
+    p.add_argument('--phones', type=int, default=200000)
+    p.add_argument('--queries', type=int, default=10000)
+
+    p = commands.add_parser('store', help="Thông lượng ghi SQLite (WAL + group commit)")
+    p.add_argument('--db', default='bench_booking.db')
+    p.add_argument('--threads', type=int, default=32)
+    p.add_argument('--bookings', type=int, default=5000)
+    p.add_argument('--synchronous', default='FULL', choices=['OFF', 'NORMAL', 'FULL'])
+
+    p = commands.add_parser('contiguous', help="Tìm dãy ghế liền nhau: chỉ mục so với quét")
+    p.add_argument('--rows', type=int, default=200)
+    p.add_argument('--cols', type=int, default=50)
+    p.add_argument('--occupancy', type=float, default=0.8)
+    p.add_argument('--queries', type=int, default=2000)
+
+    p = commands.add_parser('codec', help="So sánh các codec: số byte, thời gian mã hóa / giải mã")
+    p.add_argument('--services', type=int, default=200, help="Số mục trong danh mục mẫu")
+    p.add_argument('--bookings', type=int, default=1000, help="Số vé trong danh sách mẫu")
+
+    p = commands.add_parser('search', help="Tìm kiếm danh mục: chỉ mục so với duyệt cả danh sách")
+    p.add_argument('--services', type=int, default=10000)
+    p.add_argument('--queries', type=int, default=2000)
+
+    p = commands.add_parser('report', help="Báo cáo doanh thu: bộ đếm cộng dồn so với duyệt cả bảng")
+    p.add_argument('--bookings', type=int, default=1000000)
+    p.add_argument('--queries', type=int, default=1000)
+
+    p = commands.add_parser('bookings', help="Bộ nhớ bảng booking: dict so với bản ghi Booking")
+    p.add_argument('--bookings', type=int, default=200000)
+    p.add_argument('--customers', type=int, default=50000)
+
+    p = commands.add_parser('inventory', help="Tra chuyến theo ngày khi lịch sử tích lũy, gỡ ngày cũ")
+    p.add_argument('--services', type=int, default=200)
+    p.add_argument('--days', type=int, nargs='+', default=[1, 30, 365])
+    p.add_argument('--lookups', type=int, default=200000)
+
+    p = commands.add_parser('load', help="Tạo tải qua socket: thông lượng, p50/p99/p999, bán quá số ghế")
+    p.add_argument('--host', default='localhost')
+    p.add_argument('--port', type=int, default=9999)
+    p.add_argument('--spawn', choices=['threaded', 'async', 'cluster'],
+                   help="Tự chạy server ở chế độ này trên --port thay vì dùng server có sẵn")
+    p.add_argument('--clients', type=int, default=50)
+    p.add_argument('--duration', type=float, default=10.0, help="Số giây chạy")
+    p.add_argument('--mix', default=DEFAULT_MIX, help="Tỉ lệ các hành động, ví dụ get_buses=50,book_bus=50")
+    p.add_argument('--max-group', type=int, default=2, help="Số vé tối đa mỗi lượt đặt")
+    p.add_argument('--legacy', action='store_true', help="Dùng giao thức cũ (JSON thô)")
+    p.add_argument('--codec', choices=list(CODECS), help="Codec thỏa thuận với server (mặc định: json)")
+    p.add_argument('--seed', type=int)
+    p.add_argument('--output', help="Lưu kết quả (JSON) vào file này")
+    p.add_argument('--compare', help="So sánh với kết quả đã lưu")
+
+    args = parser.parse_args()
+    if args.command == 'stress':
+        result = stress_booking(args.threads, args.rounds, args.max_group, args.cancel_ratio, args.seed)
+        _print_result(result)
+        if result['oversold'] or result['duplicate_seats']:
+            print("❌ Phát hiện bán quá số ghế!")
+            sys.exit(1)
+        if result['free_mismatch']:
+            print("❌ Số ghế trống không khớp với số ghế trong booking!")
+            sys.exit(1)
+        print("✅ Không có ghế nào bị bán quá / trùng, số ghế trống khớp")
+    elif args.command == 'check':
+        failed = 0
+        for name, ok in check_requests():
+            print(f"{'✅' if ok else '❌'} {name}")
+            failed += not ok
+        if failed:
+            sys.exit(1)
+    elif args.command == 'seatmap':
+        _print_result(bench_seatmap(args.seats, args.ops))
+    elif args.command == 'phone-index':
+        _print_result(bench_phone_index(args.bookings, args.phones, args.queries))
+    elif args.command == 'contiguous':
+        _print_result(bench_contiguous(args.rows, args.cols, args.occupancy, args.queries))
+    elif args.command == 'store':
+        _print_result(bench_store(args.db, args.threads, args.bookings, args.synchronous))
+    elif args.command == 'search':
+        _print_result(bench_search(args.services, args.queries))
+    elif args.command == 'report':
+        _print_result(bench_report(args.bookings, args.queries))
+    elif args.command == 'bookings':
+        _print_result(bench_bookings(args.bookings, args.customers))
+    elif args.command == 'inventory':
+        _print_result(bench_inventory(args.services, args.days, args.lookups))
+    elif args.command == 'codec':
+        _print_result(bench_codec(args.services, args.bookings))
+    elif args.command == 'load':
+        process = _spawn_server(args.spawn, args.port) if args.spawn else None
+        try:
+            result = load_test(args.host, args.port, args.clients, args.duration, args.mix, args.max_group,
+                               LEGACY if args.legacy else FRAMED, args.seed, args.codec)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+        _print_result(result)
+        if args.output:
+            config = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'config': config, 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'result': result},
+                          f, ensure_ascii=False, indent=2)
+            print(f"💾 Đã lưu kết quả vào {args.output}")
+        if args.compare:
+            with open(args.compare, encoding='utf-8') as f:
+                _compare(result, json.load(f)['result'])
+        if result['oversold'] or result['seat_mismatch']:
+            print("❌ Phát hiện bán quá / lệch số ghế!")
+            sys.exit(1)
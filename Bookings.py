@@ -0,0 +1,110 @@
+# Bookings.py
+# Bản ghi booking gọn cho bảng booking trong bộ nhớ. Mỗi booking trước đây là một dict
+# lồng dict khách hàng, list ghế và chuỗi thời gian đã định dạng; với hàng triệu booking,
+# phần lớn bộ nhớ là vỏ dict. Ở đây mỗi booking là một đối tượng __slots__:
+#   - mã dịch vụ, tên dịch vụ, ngày, nhãn ghế được intern (mọi booking dùng chung một chuỗi)
+#   - khách đặt nhiều lần dùng chung một bản ghi Customer
+#   - ghế là tuple, thời gian đặt là số giây epoch, chỉ định dạng khi trả cho client / ghi ra store
+# to_dict() trả về đúng dạng booking như trước nên giao thức và store không đổi.
+
+import sys
+import time
+import weakref
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+CUSTOMER_KEYS = frozenset(('name', 'phone', 'email'))
+
+
+class Customer:
+    """Thông tin khách (tên, số điện thoại, email), dùng chung giữa các booking của cùng khách"""
+
+    __slots__ = ('name', 'phone', 'email', '__weakref__')
+
+    def __init__(self, name, phone, email):
+        self.name = name
+        self.phone = phone
+        self.email = email
+
+    def to_dict(self):
+        return {'name': self.name, 'phone': self.phone, 'email': self.email}
+
+
+# Bản ghi khách còn được booking nào đó dùng; tự rời khỏi bảng khi không còn booking nào
+_customers = weakref.WeakValueDictionary()
+
+
+def intern_customer(customer):
+    """dict khách {'name', 'phone', 'email'} (đều là chuỗi) -> Customer dùng chung;
+    dữ liệu dạng khác được giữ nguyên để trả lại đúng như client đã gửi"""
+    if not isinstance(customer, dict) or customer.keys() != CUSTOMER_KEYS:
+        return customer
+    key = (customer['name'], customer['phone'], customer['email'])
+    if not all(isinstance(value, str) for value in key):
+        return customer
+    shared = _customers.get(key)
+    if shared is None:
+        shared = _customers.setdefault(key, Customer(*key))
+    return shared
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def format_time(epoch):
+    return time.strftime(TIME_FORMAT, time.localtime(epoch))
+
+
+class Booking:
+    """Một booking trong bảng của server; dùng to_dict() khi trả cho client"""
+
+    __slots__ = ('booking_id', 'type', 'service_id', 'service_name', 'date', 'customer',
+                 'seats', 'total_price', 'booked_at')
+
+    def __init__(self, booking_id, kind, service_id, service_name, date, customer, seats, total_price,
+                 booked_at=None):
+        self.booking_id = booking_id
+        self.type = _intern(kind)
+        self.service_id = _intern(service_id)
+        self.service_name = _intern(service_name)
+        self.date = _intern(date)
+        self.customer = intern_customer(customer)
+        self.seats = tuple(map(_intern, seats))
+        self.total_price = total_price
+        self.booked_at = int(time.time()) if booked_at is None else booked_at
+
+    @property
+    def booking_time(self):
+        return format_time(self.booked_at)
+
+    @property
+    def phone(self):
+        customer = self.customer
+        if type(customer) is Customer:
+            return customer.phone
+        return customer.get('phone') if isinstance(customer, dict) else None
+
+    def customer_info(self):
+        customer = self.customer
+        return customer.to_dict() if type(customer) is Customer else customer
+
+    def to_dict(self):
+        """Dạng booking trả cho client / ghi vào store (giống hệt dict trước đây)"""
+        return {
+            'booking_id': self.booking_id,
+            'type': self.type,
+            'service_id': self.service_id,
+            'service_name': self.service_name,
+            'date': self.date,
+            'customer': self.customer_info(),
+            'seats': list(self.seats),
+            'total_price': self.total_price,
+            'booking_time': self.booking_time
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Booking đã lưu (dạng to_dict) -> Booking; thời gian đặt đọc lại thành epoch"""
+        booked_at = int(time.mktime(time.strptime(data['booking_time'], TIME_FORMAT)))
+        return cls(data['booking_id'], data['type'], data['service_id'], data['service_name'], data['date'],
+                   data['customer'], data['seats'], data['total_price'], booked_at)
@@ -0,0 +1,71 @@
+# Cache.py
+# Cache phản hồi danh mục (get_buses / get_movies) đã mã hóa sẵn, gắn số phiên bản.
+# Chỉ thay đổi số ghế (đặt / hủy vé) mới làm mất hiệu lực, và chỉ mục bị đổi được
+# mã hóa lại; phần còn lại dùng lại đoạn JSON đã có.
+
+import json
+import threading
+import time
+
+from Protocol import PreEncoded
+
+
+class CatalogCache:
+    """Cache cho một danh mục (xe hoặc phim).
+
+    services: dict mã dịch vụ -> dịch vụ; describe(service) -> dict công khai trả cho client.
+    """
+
+    def __init__(self, services, describe):
+        self.services = services
+        self.describe = describe
+        # Bắt đầu từ thời điểm hiện tại (ms) để phiên bản không lặp lại sau khi khởi động lại server
+        self.version = time.time_ns() // 1_000_000
+        self.hits = 0
+        self.misses = 0
+        self._fragments = {}
+        self._response = None
+        self._lock = threading.Lock()
+
+    def invalidate(self, service_id=None):
+        """Đánh dấu một dịch vụ (hoặc cả danh mục nếu service_id=None) đã thay đổi"""
+        with self._lock:
+            self.version += 1
+            self._response = None
+            if service_id is None:
+                self._fragments.clear()
+            else:
+                self._fragments.pop(service_id, None)
+
+    def response(self, known_version=None):
+        """Phản hồi cho get_*; 'not_modified' nếu client đã có đúng phiên bản này"""
+        if known_version is not None and known_version == self.version:
+            self.hits += 1
+            return {"status": "not_modified", "version": known_version}
+
+        response = self._response
+        if response is not None:
+            self.hits += 1
+            return response
+
+        with self._lock:
+            if self._response is None:
+                self.misses += 1
+                self._response = self._build()
+            return self._response
+
+    def _build(self):
+        data = []
+        fragments = []
+        for service_id, service in self.services.items():
+            cached = self._fragments.get(service_id)
+            if cached is None:
+                info = self.describe(service)
+                cached = self._fragments[service_id] = (info, json.dumps(info, ensure_ascii=False))
+            data.append(cached[0])
+            fragments.append(cached[1])
+
+        # Ghép đúng như json.dumps({"status", "data", "version"}) nhưng không mã hóa lại từng mục
+        payload = ('{"status": "success", "data": [' + ', '.join(fragments) +
+                   f'], "version": {self.version}}}').encode('utf-8')
+        return PreEncoded({"status": "success", "data": data, "version": self.version}, payload)
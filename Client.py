@@ -1,40 +1,276 @@
-﻿import socket
-import json
-import os
+﻿import os
+import queue
+import threading
+import uuid
+from contextlib import contextmanager
+
+from Protocol import FRAMED, Connection, ProtocolError
+
+
+class ConnectionPool:
+    """Nhóm kết nối tới server dùng chung cho nhiều thread.
+
+    Tối đa `size` kết nối cùng lúc; kết nối được mở khi cần và dùng lại sau mỗi yêu cầu.
+    Kết nối gặp lỗi bị đóng hẳn, không trả lại nhóm.
+    codec: tên codec thỏa thuận cho mỗi kết nối mới (None: JSON).
+    """
+
+    def __init__(self, host, port, size=8, framing=FRAMED, timeout=None, codec=None):
+        self.host = host
+        self.port = port
+        self.framing = framing
+        self.timeout = timeout
+        self.codec = codec
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        conn = None
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = Connection.open(self.host, self.port, self.framing, self.timeout, self.codec)
+            yield conn
+            self._idle.put(conn)
+        except BaseException:
+            if conn is not None:
+                conn.close()
+            raise
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class Subscription:
+    """Kết nối riêng nhận tin đẩy số ghế trống từ server.
+
+    on_update(changes) được gọi trên thread đọc với danh sách
+    {'type', 'id', 'available_seats'} của các dịch vụ vừa đổi.
+    """
+
+    def __init__(self, conn, on_update):
+        self.conn = conn
+        self.on_update = on_update
+        self.thread = threading.Thread(target=self._run, name="subscription", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                message = self.conn.receive()
+                if message.get('event') == 'availability':
+                    self.on_update(message['changes'])
+        except (OSError, ProtocolError, ValueError):
+            pass  # kết nối đã đóng (client gọi close() hoặc server ngắt vì đọc quá chậm)
+
+    def close(self):
+        self.conn.close()
+
 
 class BookingClient:
-    def __init__(self, host='localhost', port=9999):
+    def __init__(self, host='localhost', port=9999, framing=FRAMED, pool_size=8, timeout=None, retries=2,
+                 codec=None):
         self.host = host
         self.port = port
-        self.socket = None
+        self.framing = framing
+        self.retries = retries
+        self.codec = codec
+        self.pool = ConnectionPool(host, port, pool_size, framing, timeout, codec)
+        
+        # Cache danh mục phía client: action -> (phiên bản, dữ liệu), xác thực lại bằng if_version
+        self._catalog = {}
+        self._catalog_lock = threading.Lock()
         
     def connect_to_server(self):
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
+            with self.pool.connection():
+                pass
             print(f"✅ Đã kết nối thành công đến server {self.host}:{self.port}")
             return True
         except Exception as e:
             print(f"❌ Không thể kết nối đến server: {e}")
             return False
     
+    def close(self):
+        self.pool.close()
+    
     def send_request(self, request):
         try:
-            message = json.dumps(request, ensure_ascii=False)
-            self.socket.send(message.encode('utf-8'))
-            
-            response = self.socket.recv(4096).decode('utf-8')
-            return json.loads(response)
+            with self.pool.connection() as conn:
+                return conn.request(request)
         except Exception as e:
             print(f"❌ Lỗi gửi yêu cầu: {e}")
             return {"status": "error", "message": "Lỗi kết nối"}
     
+    def send_write(self, request):
+        """Gửi yêu cầu ghi kèm idempotency_key; lỗi kết nối thì gửi lại với đúng khóa đó,
+        server trả lại kết quả lần trước thay vì đặt / hủy thêm lần nữa"""
+        request = dict(request, idempotency_key=uuid.uuid4().hex)
+        for attempt in range(self.retries + 1):
+            try:
+                with self.pool.connection() as conn:
+                    return conn.request(request)
+            except Exception as e:
+                error = e
+        print(f"❌ Lỗi gửi yêu cầu: {error}")
+        return {"status": "error", "message": "Lỗi kết nối"}
+    
+    def send_pipelined(self, requests):
+        """Gửi nhiều yêu cầu liên tiếp trên cùng kết nối, không chờ từng phản hồi"""
+        try:
+            with self.pool.connection() as conn:
+                return conn.pipeline(requests)
+        except Exception as e:
+            print(f"❌ Lỗi gửi yêu cầu: {e}")
+            return [{"status": "error", "message": "Lỗi kết nối"} for _ in requests]
+    
+    # --- API không tương tác (dùng được từ nhiều thread, không gọi input()) ---
+    def fetch_catalog(self, action, date=None):
+        """Danh mục xe / phim của một ngày ('YYYY-MM-DD', None: hôm nay) từ cache;
+        chỉ tải lại khi server báo phiên bản đã đổi"""
+        key = (action, date)
+        cached = self._catalog.get(key)
+        request = {'action': action}
+        if date is not None:
+            request['date'] = date
+        if cached is not None:
+            request['if_version'] = cached[0]
+        
+        response = self.send_request(request)
+        if response['status'] == 'not_modified':
+            return {"status": "success", "data": cached[1], "version": cached[0]}
+        if response['status'] == 'success' and 'version' in response:
+            with self._catalog_lock:
+                current = self._catalog.get(key)
+                if current is None or current[0] < response['version']:
+                    self._catalog[key] = (response['version'], response['data'])
+        return response
+    
+    def fetch_buses(self, date=None):
+        return self.fetch_catalog('get_buses', date)
+    
+    def fetch_movies(self, date=None):
+        return self.fetch_catalog('get_movies', date)
+    
+    def book_bus(self, bus_id, num_seats, customer_info, date=None):
+        request = {
+            'action': 'book_bus',
+            'bus_id': bus_id,
+            'seats': num_seats,
+            'customer': customer_info
+        }
+        if date is not None:
+            request['date'] = date
+        return self.send_write(request)
+    
+    def book_movie(self, movie_id, num_seats, customer_info, date=None):
+        request = {
+            'action': 'book_movie',
+            'movie_id': movie_id,
+            'seats': num_seats,
+            'customer': customer_info
+        }
+        if date is not None:
+            request['date'] = date
+        return self.send_write(request)
+    
+    def search_services(self, kind, **filters):
+        """Tìm xe / phim trên server thay vì tải cả danh mục, ví dụ
+        search_services('bus', q='hà nội', departure=['06:00', '12:00'], min_available=2, sort='price')"""
+        return self.send_request(dict(filters, action='search', type=kind))
+    
+    def fetch_bookings(self, phone):
+        return self.send_request({'action': 'get_bookings', 'customer_phone': phone})
+    
+    def cancel_ticket(self, booking_id):
+        return self.send_write({'action': 'cancel_booking', 'booking_id': booking_id})
+    
+    def hold_seats(self, kind, service_id, num_seats, customer_info, ttl=None, date=None):
+        """Giữ chỗ có thời hạn (kind: 'bus' hoặc 'movie'); xác nhận bằng confirm_hold"""
+        request = {
+            'action': f'hold_{kind}',
+            'bus_id' if kind == 'bus' else 'movie_id': service_id,
+            'seats': num_seats,
+            'customer': customer_info
+        }
+        if ttl is not None:
+            request['ttl'] = ttl
+        if date is not None:
+            request['date'] = date
+        return self.send_write(request)
+    
+    def confirm_hold(self, hold_id):
+        return self.send_write({'action': 'confirm_hold', 'hold_id': hold_id})
+    
+    def release_hold(self, hold_id):
+        return self.send_write({'action': 'release_hold', 'hold_id': hold_id})
+    
+    def batch(self, requests, atomic=False):
+        """Gửi nhiều yêu cầu đặt / hủy trong một lượt; atomic=True: tất cả hoặc không gì cả"""
+        return self.send_write({'action': 'batch', 'requests': requests, 'atomic': atomic})
+    
+    def fetch_stats(self, output_format=None):
+        """Số liệu vận hành của server; output_format='text' để lấy dạng từng dòng"""
+        request = {'action': 'stats'}
+        if output_format is not None:
+            request['format'] = output_format
+        return self.send_request(request)
+    
+    def fetch_report(self, kind=None, service_id=None, hours=None):
+        """Báo cáo doanh thu: tổng, theo loại, theo dịch vụ, theo giờ (kèm tiền hoàn do hủy vé)"""
+        request = {'action': 'report'}
+        for key, value in (('type', kind), ('service_id', service_id), ('hours', hours)):
+            if value is not None:
+                request[key] = value
+        return self.send_request(request)
+    
+    def subscribe(self, on_update, types=None, service_ids=None, dates=None):
+        """Đăng ký nhận số ghế trống thay đổi trên một kết nối riêng (ngoài nhóm kết nối).
+
+        Trả về (phản hồi, Subscription); phản hồi thành công chứa số ghế hiện tại trong 'data'.
+        """
+        request = {'action': 'subscribe'}
+        if types is not None:
+            request['types'] = types
+        if service_ids is not None:
+            request['service_ids'] = service_ids
+        if dates is not None:
+            request['dates'] = dates
+        try:
+            conn = Connection.open(self.host, self.port, FRAMED, codec=self.codec)
+            conn.send([request])
+            # Tin đẩy có thể tới trước phản hồi đăng ký
+            response = conn.receive()
+            while response.get('event') == 'availability':
+                on_update(response['changes'])
+                response = conn.receive()
+        except Exception as e:
+            print(f"❌ Lỗi gửi yêu cầu: {e}")
+            return {"status": "error", "message": "Lỗi kết nối"}, None
+        if response['status'] != 'success':
+            conn.close()
+            return response, None
+        return response, Subscription(conn, on_update)
+    
     def format_price(self, price):
         return f"{price:,}đ".replace(',', '.')
     
-    def view_buses(self):
-        request = {'action': 'get_buses'}
-        response = self.send_request(request)
+    def ask_date(self):
+        """Ngày đi / ngày xem khách nhập; None là hôm nay"""
+        date = input("Ngày (YYYY-MM-DD, Enter = hôm nay): ").strip()
+        return date or None
+    
+    def view_buses(self, date=None):
+        response = self.fetch_buses(date)
         
         if response['status'] == 'success':
             buses = response['data']
@@ -57,9 +293,8 @@ class BookingClient:
             print(f"❌ {response['message']}")
             return []
     
-    def view_movies(self):
-        request = {'action': 'get_movies'}
-        response = self.send_request(request)
+    def view_movies(self, date=None):
+        response = self.fetch_movies(date)
         
         if response['status'] == 'success':
             movies = response['data']
@@ -114,9 +349,11 @@ class BookingClient:
         print("\n🎫 ĐẶT VÉ XE KHÁCH")
         print("=" * 40)
         
-        buses = self.view_buses()
+        date = self.ask_date()
+        buses = self.view_buses(date)
         if not buses:
             return
+        buses_by_id = {bus['id']: bus for bus in buses}
         
         while True:
             bus_id = input("\nNhập mã xe (hoặc 'back' để quay lại): ").strip().upper()
@@ -124,12 +361,7 @@ class BookingClient:
                 return
                 
             # Kiểm tra xe có tồn tại
-            selected_bus = None
-            for bus in buses:
-                if bus['id'] == bus_id:
-                    selected_bus = bus
-                    break
-            
+            selected_bus = buses_by_id.get(bus_id)
             if selected_bus:
                 break
             else:
@@ -162,7 +394,7 @@ class BookingClient:
         print(f"\n📋 XÁC NHẬN THÔNG TIN")
         print("-" * 30)
         print(f"Tuyến: {selected_bus['route']}")
-        print(f"Khởi hành: {selected_bus['departure']}")
+        print(f"Khởi hành: {selected_bus['departure']} {date or 'hôm nay'}")
         print(f"Số vé: {num_seats}")
         print(f"Tổng tiền: {self.format_price(total_price)}")
         
@@ -172,14 +404,7 @@ class BookingClient:
             return
         
         # Gửi yêu cầu đặt vé
-        request = {
-            'action': 'book_bus',
-            'bus_id': bus_id,
-            'seats': num_seats,
-            'customer': customer_info
-        }
-        
-        response = self.send_request(request)
+        response = self.book_bus(bus_id, num_seats, customer_info, date)
         if response['status'] == 'success':
             booking = response['booking_info']
             print(f"\n🎉 {response['message']}")
@@ -193,21 +418,18 @@ class BookingClient:
         print("\n🎫 ĐẶT VÉ XEM PHIM")
         print("=" * 40)
         
-        movies = self.view_movies()
+        date = self.ask_date()
+        movies = self.view_movies(date)
         if not movies:
             return
+        movies_by_id = {movie['id']: movie for movie in movies}
         
         while True:
             movie_id = input("\nNhập mã phim (hoặc 'back' để quay lại): ").strip().upper()
             if movie_id.lower() == 'back':
                 return
                 
-            selected_movie = None
-            for movie in movies:
-                if movie['id'] == movie_id:
-                    selected_movie = movie
-                    break
-            
+            selected_movie = movies_by_id.get(movie_id)
             if selected_movie:
                 break
             else:
@@ -241,7 +463,7 @@ class BookingClient:
         print("-" * 30)
         print(f"Phim: {selected_movie['title']}")
         print(f"Rạp: {selected_movie['cinema']}")
-        print(f"Giờ chiếu: {selected_movie['showtime']}")
+        print(f"Giờ chiếu: {selected_movie['showtime']} {date or 'hôm nay'}")
         print(f"Số vé: {num_seats}")
         print(f"Tổng tiền: {self.format_price(total_price)}")
         
@@ -251,14 +473,7 @@ class BookingClient:
             return
         
         # Gửi yêu cầu đặt vé
-        request = {
-            'action': 'book_movie',
-            'movie_id': movie_id,
-            'seats': num_seats,
-            'customer': customer_info
-        }
-        
-        response = self.send_request(request)
+        response = self.book_movie(movie_id, num_seats, customer_info, date)
         if response['status'] == 'success':
             booking = response['booking_info']
             print(f"\n🎉 {response['message']}")
@@ -278,12 +493,7 @@ class BookingClient:
             print("❌ Vui lòng nhập số điện thoại!")
             return
         
-        request = {
-            'action': 'get_bookings',
-            'customer_phone': phone
-        }
-        
-        response = self.send_request(request)
+        response = self.fetch_bookings(phone)
         if response['status'] == 'success':
             bookings = response['data']
             
@@ -298,6 +508,8 @@ class BookingClient:
                 print(f"\n🎫 Mã đặt vé: {booking['booking_id']}")
                 print(f"Loại: {'Xe khách' if booking['type'] == 'bus' else 'Phim'}")
                 print(f"Dịch vụ: {booking['service_name']}")
+                if booking.get('date'):
+                    print(f"Ngày: {booking['date']}")
                 print(f"Ghế: {', '.join(map(str, booking['seats']))}")
                 print(f"Tổng tiền: {self.format_price(booking['total_price'])}")
                 print(f"Thời gian đặt: {booking['booking_time']}")
@@ -319,12 +531,7 @@ class BookingClient:
             print("Đã hủy thao tác.")
             return
         
-        request = {
-            'action': 'cancel_booking',
-            'booking_id': booking_id
-        }
-        
-        response = self.send_request(request)
+        response = self.cancel_ticket(booking_id)
         if response['status'] == 'success':
             print(f"✅ {response['message']}")
             print(f"Số tiền hoàn: {self.format_price(response['refund_amount'])}")
@@ -381,8 +588,7 @@ class BookingClient:
         except KeyboardInterrupt:
             print("\n👋 Đã thoát ứng dụng!")
         finally:
-            if self.socket:
-                self.socket.close()
+            self.close()
 
 if __name__ == "__main__":
     client = BookingClient()
@@ -0,0 +1,671 @@
+# Cluster.py
+# Chạy nhiều tiến trình BookingServer (mỗi tiến trình một core, tránh giới hạn GIL)
+# sau một tiến trình tiếp nhận (front) duy nhất mà client kết nối tới.
+#
+# Mỗi xe / phim (cùng mọi chuyến của nó ở mọi ngày) thuộc đúng một worker (băm mã dịch vụ),
+# nên ghế của nó chỉ được xử lý ở một nơi và không cần khóa giữa các tiến trình. Front chỉ giải mã yêu cầu
+# để biết gửi đi đâu, còn phản hồi của worker được chuyển nguyên về client:
+#   book_* / hold_*              -> worker sở hữu dịch vụ
+#   cancel_booking, *_hold       -> worker ghi trong bit shard của mã đặt vé / giữ chỗ
+#   get_bookings, get_buses/...  -> hỏi mọi worker rồi gộp kết quả (scatter-gather)
+#   report                       -> cộng bộ đếm doanh thu của mọi worker
+#   search                       -> front tự tìm trên danh mục đã gộp (số ghế lấy từ worker sở hữu)
+# Giữa front và worker luôn dùng JSON; client chọn codec khác thì front chuyển đổi ở biên.
+
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import zlib
+from collections import deque
+
+from Admission import AdmissionControl, parse_rate
+from AsyncServer import AsyncBookingServer
+from Codec import CODECS, JSON, negotiate
+from Database import BookingStore
+from Ids import MAX_SHARD, id_shard, normalize_id
+from Journal import BookingJournal
+from Protocol import (FRAMED, LEGACY, RECV_SIZE, FrameReader, ProtocolError,
+                      decode_message, encode_message, pack_frame)
+from Reports import DEFAULT_HOURS, merge_reports
+from Search import CatalogIndex
+from Server import (BATCH_READ_ACTIONS, BOOK_ACTIONS, HELLO_ACTION, HOLD_ACTIONS, MAX_BATCH_SIZE, SEARCH_FIELDS,
+                    SERVICE_KEYS, SUBSCRIPTION_ACTIONS, BookingServer, request_phone)
+from Subscriptions import MAX_PENDING_BYTES
+
+CATALOG_ACTIONS = ('get_buses', 'get_movies')
+KIND_CATALOGS = {'bus': 'get_buses', 'movie': 'get_movies'}
+SHARD_UNAVAILABLE = {"status": "error", "message": "Máy chủ phụ trách tạm thời không phản hồi"}
+UNKNOWN_SERVICE = {'bus': "Mã xe không tồn tại", 'movie': "Mã phim không tồn tại"}
+# Số lần thử mở lại kết nối tới worker đã đóng, và thời gian chờ giữa hai lần (tăng dần)
+RECONNECT_ATTEMPTS = 5
+RECONNECT_DELAY = 0.05
+# Số danh mục gộp (mỗi loại, mỗi ngày) front giữ lại; vượt quá thì bỏ danh mục cũ nhất
+MAX_CACHED_CATALOGS = 512
+
+
+def _is_write(action):
+    return action in BOOK_ACTIONS or action == 'cancel_booking'
+
+
+def _invalid_id(request):
+    """Lỗi của yêu cầu có mã xe / phim / đặt vé / giữ chỗ không phải chuỗi (ví dụ {} hay []),
+    đúng như worker trả; None nếu mã hợp lệ về kiểu"""
+    action = request.get('action')
+    kind = BOOK_ACTIONS.get(action) or HOLD_ACTIONS.get(action)
+    if kind is not None:
+        value, message = request.get(SERVICE_KEYS[kind]), UNKNOWN_SERVICE[kind]
+    elif action == 'cancel_booking':
+        value, message = request.get('booking_id'), "Mã đặt vé không tồn tại"
+    elif action in ('confirm_hold', 'release_hold'):
+        value, message = request.get('hold_id'), "Mã giữ chỗ không tồn tại hoặc đã hết hạn"
+    else:
+        return None
+    return None if isinstance(value, str) else {"status": "error", "message": message}
+
+
+def _renumber_error(response, indices):
+    """Lỗi của batch atomic con ("Yêu cầu thứ k: ...") -> đánh số theo batch gốc của client"""
+    position = response.get('failed_index')
+    if not isinstance(position, int) or not 0 <= position < len(indices):
+        return response
+    message = response.get('message', '')
+    prefix = f"Yêu cầu thứ {position + 1}: "
+    if message.startswith(prefix):
+        message = f"Yêu cầu thứ {indices[position] + 1}: {message[len(prefix):]}"
+    return dict(response, message=message, failed_index=indices[position])
+
+
+def service_owner(service_id, workers):
+    """Worker sở hữu một xe / phim (ổn định giữa các lần khởi động); None nếu mã không phải chuỗi"""
+    if not isinstance(service_id, str):
+        return None
+    return zlib.crc32(service_id.encode('utf-8')) % workers
+
+
+def _shard_path(path, index):
+    root, ext = os.path.splitext(path)
+    return f"{root}-shard{index}{ext}"
+
+
+def _transcode(payload, source, target):
+    """Đổi payload giữa hai codec; b'' (dữ liệu không hợp lệ) nếu không giải mã được"""
+    if source is target:
+        return payload
+    try:
+        return encode_message(decode_message(payload, source), target)
+    except ValueError:
+        return b''
+
+
+def run_worker(index, host, port, mode='threaded', db=None, journal=None, journal_durable=True,
+               slow_ms=None, profile_slow=None):
+    """Tiến trình worker: một BookingServer đầy đủ, mã đặt vé mang số shard = index"""
+    store = None
+    if db:
+        store = BookingStore(_shard_path(db, index))
+    elif journal:
+        store = BookingJournal(os.path.join(journal, f"shard-{index}"), durable=journal_durable)
+    server = BookingServer(host, port, store=store, shard=index)
+    if slow_ms:
+        server.metrics.set_profiling(False, slow_ms / 1000)
+    if profile_slow:
+        server.metrics.set_profiling(True, profile_slow / 1000)
+    if mode == 'async':
+        server = AsyncBookingServer(server)
+    try:
+        server.start_server()
+    except KeyboardInterrupt:
+        pass
+
+
+class Upstream:
+    """Một kết nối từ front tới worker. Nhiều yêu cầu nối đuôi nhau trên cùng kết nối
+    (worker trả lời đúng thứ tự nhận), phản hồi được khớp với yêu cầu theo hàng đợi.
+
+    Kết nối trong nhóm dùng chung bị worker đóng thì được mở lại khi có yêu cầu tiếp theo;
+    kết nối đăng ký (on_push) thì không, vì trạng thái đăng ký nằm ở worker.
+    """
+
+    def __init__(self, reader, writer, on_push=None, address=None):
+        self.reader = reader
+        self.writer = writer
+        self.on_push = on_push
+        self.address = address if on_push is None else None
+        self._waiting = deque()
+        self._queued = []
+        self._reconnecting = None
+        self._task = asyncio.ensure_future(self._read_loop())
+
+    @classmethod
+    async def open(cls, host, port, on_push=None):
+        reader, writer = await cls._connect(host, port)
+        return cls(reader, writer, on_push, (host, port))
+
+    @staticmethod
+    async def _connect(host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return reader, writer
+
+    def send(self, payload):
+        """Gửi ngay (không await) để thứ tự gửi đúng bằng thứ tự gọi; trả về future của phản hồi"""
+        future = asyncio.get_running_loop().create_future()
+        if self._task.done() or self._reconnecting is not None:
+            if self.address is None:
+                future.set_exception(ConnectionError("Worker đã đóng kết nối"))
+                return future
+            # Chờ mở lại kết nối; các yêu cầu chờ được gửi đi theo đúng thứ tự gọi
+            self._queued.append((payload, future))
+            if self._reconnecting is None:
+                self._reconnecting = asyncio.ensure_future(self._reconnect())
+            return future
+        self._waiting.append(future)
+        self.writer.write(pack_frame(payload))
+        return future
+
+    async def _reconnect(self):
+        """Mở lại kết nối, thử tối đa RECONNECT_ATTEMPTS lần. Chỉ gửi lại yêu cầu chưa từng tới worker:
+        yêu cầu đang chờ phản hồi lúc kết nối đứt đã báo lỗi, vì worker có thể đã xử lý nó"""
+        self.writer.close()
+        error = None
+        for attempt in range(RECONNECT_ATTEMPTS):
+            try:
+                self.reader, self.writer = await self._connect(*self.address)
+                error = None
+                break
+            except OSError as e:
+                error = e
+                await asyncio.sleep(RECONNECT_DELAY * (attempt + 1))
+        queued, self._queued = self._queued, []
+        self._reconnecting = None
+        if error is not None:
+            for _, future in queued:
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Không kết nối lại được worker: {error}"))
+            return
+        self._task = asyncio.ensure_future(self._read_loop())
+        for payload, future in queued:
+            self._waiting.append(future)
+            self.writer.write(pack_frame(payload))
+
+    async def _read_loop(self):
+        frames = FrameReader(FRAMED)
+        try:
+            while True:
+                data = await self.reader.read(RECV_SIZE)
+                if not data:
+                    break
+                frames.feed(data)
+                for payload in frames.messages():
+                    # Tin đẩy (subscribe) luôn bắt đầu bằng khóa "event", phản hồi bằng "status"
+                    if self.on_push is not None and payload.startswith(b'{"event"'):
+                        self.on_push(payload)
+                    else:
+                        self._waiting.popleft().set_result(payload)
+        except (ConnectionError, ProtocolError):
+            pass
+        finally:
+            while self._waiting:
+                future = self._waiting.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionError("Worker đã đóng kết nối"))
+
+    def close(self):
+        self.writer.close()
+
+
+class _Session:
+    """Trạng thái của một kết nối client tại front"""
+
+    def __init__(self, slot, writer, address=None):
+        self.slot = slot
+        self.writer = writer
+        self.address = address
+        self.mode = None
+        self.codec = JSON
+        self.subscriptions = None
+
+    def push(self, payload):
+        # Client đọc chậm bị ngắt như ở server đơn
+        if self.writer.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+            self.writer.transport.abort()
+            return
+        self.writer.write(pack_frame(_transcode(payload, JSON, self.codec)))
+
+    def close(self):
+        for upstream in self.subscriptions or ():
+            upstream.close()
+        self.subscriptions = None
+
+
+class ClusterFront:
+    """Tiến trình tiếp nhận: định tuyến yêu cầu của client tới các worker.
+
+    Mỗi worker có một nhóm kết nối dùng chung; mọi yêu cầu của cùng một client đi
+    qua cùng một kết nối tới mỗi worker, nên yêu cầu pipelining giữ nguyên thứ tự.
+
+    Giới hạn theo địa chỉ client và theo số điện thoại được áp ở front: worker chỉ thấy kết nối
+    từ front, và các yêu cầu của cùng một khách rải ra nhiều worker (mỗi worker tự đếm thì giới hạn
+    thật sẽ nhân lên theo số worker).
+    """
+
+    def __init__(self, host, port, worker_ports, worker_host='127.0.0.1', connections_per_worker=8,
+                 backlog=1024, address_limit=None, phone_limit=None):
+        self.host = host
+        self.port = port
+        self.worker_host = worker_host
+        self.worker_ports = worker_ports
+        self.workers = len(worker_ports)
+        self.connections_per_worker = connections_per_worker
+        self.backlog = backlog
+        self.active_connections = 0
+        self.admission = AdmissionControl(address_limit, phone_limit)
+        self.pools = []
+        self._catalogs = {}
+        self._search_indexes = {}
+        self._slots = itertools.count()
+
+    # --- Kết nối ---
+    async def connect_workers(self, retries=100):
+        """Mở nhóm kết nối tới mọi worker; chờ worker khởi động xong"""
+        for port in self.worker_ports:
+            for attempt in range(retries):
+                try:
+                    pool = [await Upstream.open(self.worker_host, port) for _ in range(self.connections_per_worker)]
+                    break
+                except OSError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise ConnectionError(f"Không kết nối được worker {self.worker_host}:{port}")
+            self.pools.append(pool)
+
+    async def handle_client(self, reader, writer):
+        self.active_connections += 1
+        peer = writer.get_extra_info('peername')
+        session = _Session(next(self._slots) % self.connections_per_worker, writer, peer[0] if peer else None)
+        frames = FrameReader()
+        try:
+            while True:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    break
+                frames.feed(data)
+                session.mode = frames.mode
+                payloads = list(frames.messages())
+                if not payloads:
+                    continue
+                # Các yêu cầu tới worker khác nhau chạy song song, trả lời theo thứ tự nhận.
+                # Cả loạt dùng codec lúc nhận; 'hello' đổi codec từ loạt sau
+                codec = session.codec
+                replies = await asyncio.gather(*[self.route(_transcode(payload, codec, JSON), session)
+                                                 for payload in payloads])
+                writer.write(b''.join(pack_frame(_transcode(reply, JSON, codec), session.mode) for reply in replies))
+                await writer.drain()
+        except ProtocolError as e:
+            print(f"❌ Lỗi giao thức từ client {writer.get_extra_info('peername')}: {e}")
+        except (ConnectionError, asyncio.CancelledError):
+            pass  # client ngắt, hoặc front đang tắt
+        finally:
+            session.close()
+            self.active_connections -= 1
+            writer.close()
+
+    # --- Định tuyến ---
+    def owner(self, service_id):
+        return service_owner(service_id, self.workers)
+
+    def _id_shard(self, value, prefix=''):
+        """Worker đã sinh ra mã đặt vé / giữ chỗ này, hoặc None nếu không đọc được (mã kiểu cũ)"""
+        if not isinstance(value, str):
+            return None
+        value = normalize_id(value)
+        if prefix and value.startswith(prefix):
+            value = value[len(prefix):]
+        try:
+            shard = id_shard(value)
+        except ValueError:
+            return None
+        return shard if shard < self.workers else None
+
+    async def route(self, payload, session):
+        """payload yêu cầu của client -> payload phản hồi"""
+        rejected = self.admission.check(session.address)
+        if rejected is not None:
+            return encode_message(rejected)
+        try:
+            request = decode_message(payload)
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            return await self._forward(0, payload, session)  # worker trả lỗi "Dữ liệu không hợp lệ"
+        rejected = self.admission.check(phone=request_phone(request))
+        if rejected is not None:
+            return encode_message(rejected)
+        return await self._dispatch(request, payload, session)
+
+    async def _dispatch(self, request, payload, session):
+        action = request.get('action')
+        invalid = _invalid_id(request)
+        if invalid is not None:
+            return encode_message(invalid)
+        if action in BOOK_ACTIONS or action in HOLD_ACTIONS:
+            kind = BOOK_ACTIONS.get(action) or HOLD_ACTIONS[action]
+            return await self._forward(self.owner(request.get(SERVICE_KEYS[kind])), payload, session)
+        if action == 'cancel_booking':
+            return await self._by_id(self._id_shard(request.get('booking_id')), payload, session)
+        if action in ('confirm_hold', 'release_hold'):
+            return await self._by_id(self._id_shard(request.get('hold_id'), 'H'), payload, session)
+        if action in CATALOG_ACTIONS:
+            return await self._catalog(action, request.get('if_version'), session, request.get('date'))
+        if action == 'get_bookings':
+            return await self._get_bookings(payload, session)
+        if action == 'batch':
+            return await self._batch(request, payload, session)
+        if action in SUBSCRIPTION_ACTIONS:
+            return await self._subscription(request, payload, session)
+        if action == 'stats':
+            return await self._stats(request, payload, session)
+        if action == 'report':
+            return await self._report(request, payload, session)
+        if action == 'search':
+            return await self._search(request, session)
+        if action == HELLO_ACTION:
+            return encode_message(self._hello(request.get('codecs'), session))
+        return await self._forward(0, payload, session)
+
+    async def _forward(self, index, payload, session):
+        return (await self._gather([self._send(index, payload, session)]))[0]
+
+    def _send(self, index, payload, session):
+        return self.pools[index][session.slot].send(payload)
+
+    async def _gather(self, futures):
+        """Chờ các phản hồi; worker không phản hồi được thay bằng thông báo lỗi"""
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        return [encode_message(SHARD_UNAVAILABLE) if isinstance(result, Exception) else result
+                for result in results]
+
+    async def _scatter(self, payload, session):
+        return await self._gather([self._send(i, payload, session) for i in range(self.workers)])
+
+    async def _by_id(self, shard, payload, session):
+        if shard is not None:
+            return await self._forward(shard, payload, session)
+        # Không biết worker nào giữ mã này: hỏi tất cả, lấy phản hồi thành công nếu có
+        replies = await self._scatter(payload, session)
+        for reply in replies:
+            if decode_message(reply).get('status') == 'success':
+                return reply
+        return replies[0]
+
+    async def _get_bookings(self, payload, session):
+        responses = [decode_message(reply) for reply in await self._scatter(payload, session)]
+        for response in responses:
+            if response.get('status') != 'success':
+                return encode_message(response)
+        # Mã đặt vé tăng dần theo thời gian: sắp theo mã là sắp theo lúc đặt
+        data = sorted((booking for response in responses for booking in response['data']),
+                      key=lambda booking: booking['booking_id'])
+        return encode_message({"status": "success", "data": data, "count": len(data)})
+
+    async def _stats(self, request, payload, session):
+        """Số liệu của từng worker, kèm số kết nối đang mở tại front"""
+        responses = [decode_message(reply) for reply in await self._scatter(payload, session)]
+        for response in responses:
+            if response.get('status') != 'success':
+                return encode_message(response)
+        if request.get('format') == 'text':
+            text = f"booking_front_connections_open {self.active_connections}\n"
+            text += f"booking_front_rejected_address {self.admission.rejected['address']}\n"
+            text += f"booking_front_rejected_phone {self.admission.rejected['phone']}\n"
+            text += ''.join(f"# shard {i}\n{response['text']}" for i, response in enumerate(responses))
+            return encode_message({"status": "success", "text": text})
+        return encode_message({"status": "success", "front_connections_open": self.active_connections,
+                               "front_rejected_address": self.admission.rejected['address'],
+                               "front_rejected_phone": self.admission.rejected['phone'],
+                               "shards": [response['data'] for response in responses]})
+
+    async def _report(self, request, payload, session):
+        """Cộng báo cáo doanh thu của các worker; mỗi worker đã lọc theo tham số của yêu cầu"""
+        responses = [decode_message(reply) for reply in await self._scatter(payload, session)]
+        for response in responses:
+            if response.get('status') != 'success':
+                return encode_message(response)
+        data = merge_reports([response['data'] for response in responses])
+        # Worker có thể có các ô giờ khác nhau: chỉ giữ `hours` ô gần nhất sau khi gộp
+        hours = request.get('hours') or DEFAULT_HOURS
+        data['by_hour'] = {bucket: data['by_hour'][bucket] for bucket in sorted(data['by_hour'])[-hours:]}
+        return encode_message({"status": "success", "data": data})
+
+    def _hello(self, codecs, session):
+        """Chọn codec giữa client và front, như BookingServer.hello"""
+        if not isinstance(codecs, list):
+            return {"status": "error", "message": "Danh sách codec không hợp lệ"}
+        if session.mode == LEGACY:
+            codecs = [name for name in codecs if name == JSON.name]
+        codec = negotiate(codecs)
+        if codec is None:
+            return {"status": "error", "message": "Không có codec chung", "codecs": list(CODECS)}
+        session.codec = codec
+        return {"status": "success", "codec": codec.name, "codecs": list(CODECS)}
+
+    async def _catalog(self, action, known_version, session, date=None):
+        """Gộp danh mục của một ngày: số ghế của mỗi dịch vụ lấy từ worker sở hữu nó.
+
+        Front nhớ phiên bản của từng worker và hỏi lại bằng if_version, nên danh mục
+        không đổi thì worker chỉ trả not_modified; phiên bản gộp là tổng các phiên bản.
+        """
+        key = (action, date)
+        cached = self._catalogs.get(key)
+        futures = []
+        for i in range(self.workers):
+            request = {'action': action}
+            if date is not None:
+                request['date'] = date
+            if cached is not None:
+                request['if_version'] = cached['versions'][i]
+            futures.append(self._send(i, encode_message(request), session))
+        responses = [decode_message(reply) for reply in await self._gather(futures)]
+        for response in responses:
+            if response.get('status') not in ('success', 'not_modified'):
+                return encode_message(response)
+
+        if cached is None or any(response['status'] == 'success' for response in responses):
+            owned = [dict(cached['owned'][i]) if cached else {} for i in range(self.workers)]
+            order = cached['order'] if cached else None
+            for i, response in enumerate(responses):
+                if response['status'] == 'success':
+                    owned[i] = {item['id']: item for item in response['data'] if self.owner(item['id']) == i}
+                    order = order or [item['id'] for item in response['data']]
+            versions = [response['version'] for response in responses]
+            version = sum(versions)
+            items = {service_id: owned[self.owner(service_id)][service_id] for service_id in order}
+            cached = {'versions': versions, 'owned': owned, 'order': order, 'version': version, 'items': items,
+                      'payload': encode_message({"status": "success", "data": list(items.values()),
+                                                 "version": version})}
+            if key not in self._catalogs and len(self._catalogs) >= MAX_CACHED_CATALOGS:
+                self._catalogs.pop(next(iter(self._catalogs)))
+            self._catalogs[key] = cached
+
+        if known_version is not None and known_version == cached['version']:
+            return encode_message({"status": "not_modified", "version": known_version})
+        return cached['payload']
+
+    async def _search(self, request, session):
+        """Tìm trên danh mục gộp của ngày được hỏi (đã xác thực lại với các worker bằng if_version);
+        chỉ mục dựng một lần cho mỗi loại vì danh mục giống nhau mọi ngày, chỉ số ghế thay đổi"""
+        kind = request.get('type')
+        if not isinstance(kind, str) or kind not in SEARCH_FIELDS:
+            return encode_message({"status": "error", "message": "Loại dịch vụ không hợp lệ"})
+        action = KIND_CATALOGS[kind]
+        date = request.get('date')
+        reply = await self._catalog(action, None, session, date)
+        cached = self._catalogs.get((action, date))
+        if cached is None or reply is not cached['payload']:
+            return reply  # worker lỗi
+        items = cached['items']
+        index = self._search_indexes.get(kind)
+        if index is None:
+            index = self._search_indexes[kind] = CatalogIndex(items, *SEARCH_FIELDS[kind])
+        return encode_message(index.search(request, lambda service_id: items[service_id]['available_seats'],
+                                           items.__getitem__))
+
+    async def _batch(self, request, payload, session):
+        requests = request.get('requests')
+        if not isinstance(requests, list) or not requests or len(requests) > MAX_BATCH_SIZE:
+            return await self._forward(0, payload, session)  # worker trả lỗi tương ứng
+
+        # Yêu cầu đọc chạy ở front sau khi ghi xong (dữ liệu gộp từ mọi worker), không quyết định
+        # batch thuộc worker nào; hành động không hợp lệ gửi kèm phần ghi để worker trả lỗi như server đơn
+        actions = [sub.get('action') if isinstance(sub, dict) else None for sub in requests]
+        # Mã không phải chuỗi không băm được ra worker: front trả lỗi của yêu cầu đó như worker
+        invalid = {}
+        for i, sub in enumerate(requests):
+            error = _invalid_id(sub) if isinstance(sub, dict) else None
+            if error is not None:
+                invalid[i] = error
+        if invalid and request.get('atomic'):
+            i = min(invalid)
+            return encode_message(dict(invalid[i], message=f"Yêu cầu thứ {i + 1}: {invalid[i]['message']}",
+                                       failed_index=i))
+        writes = [i for i, action in enumerate(actions) if action not in BATCH_READ_ACTIONS and i not in invalid]
+        shards = {i: self._batch_shard(requests[i]) for i in writes}
+        targets = {shards[i] for i in writes if _is_write(actions[i])}
+        if request.get('atomic'):
+            if None in targets or len(targets) > 1:
+                return encode_message({"status": "error", "message": "Batch atomic chỉ hỗ trợ các yêu cầu đặt / hủy "
+                                                                     "thuộc cùng một máy chủ phụ trách"})
+            if len(writes) == len(requests):
+                return await self._forward(next(iter(targets), 0), payload, session)
+            groups = {next(iter(targets), 0): writes} if writes else {}
+        else:
+            groups = {}
+            for i in writes:
+                if shards[i] is not None or not _is_write(actions[i]):
+                    groups.setdefault(shards[i] if shards[i] is not None else 0, []).append(i)
+            if len(groups) == 1 and len(next(iter(groups.values()))) == len(requests):
+                return await self._forward(next(iter(groups)), payload, session)
+
+        # Tách theo worker: mỗi worker nhận một batch con, yêu cầu đọc chạy sau khi ghi xong
+        results = [invalid.get(i) for i in range(len(requests))]
+        futures = [self._send(shard, encode_message(dict(request, requests=[requests[i] for i in indices])), session)
+                   for shard, indices in groups.items()]
+        for indices, reply in zip(groups.values(), await self._gather(futures)):
+            response = decode_message(reply)
+            if 'results' not in response and request.get('atomic'):
+                return encode_message(_renumber_error(response, indices))
+            for position, i in enumerate(indices):
+                results[i] = response['results'][position] if 'results' in response else response
+        for i, action in enumerate(actions):
+            if results[i] is None:
+                # Đọc, hoặc hủy vé mã kiểu cũ (không biết worker nào giữ: hỏi tất cả)
+                results[i] = decode_message(await self._dispatch(requests[i], encode_message(requests[i]), session))
+        return encode_message({"status": "success", "results": results, "count": len(results)})
+
+    def _batch_shard(self, request):
+        action = request.get('action') if isinstance(request, dict) else None
+        if action in BOOK_ACTIONS:
+            return self.owner(request.get(SERVICE_KEYS[BOOK_ACTIONS[action]]))
+        if action == 'cancel_booking':
+            return self._id_shard(request.get('booking_id'))
+        return None
+
+    async def _subscription(self, request, payload, session):
+        if session.mode == LEGACY:
+            return encode_message({"status": "error", "message": "Chỉ hỗ trợ đăng ký trên kết nối đóng khung (framed)"})
+        if request.get('action') == 'unsubscribe':
+            session.close()
+            return encode_message({"status": "success", "message": "Đã hủy đăng ký"})
+
+        # Mỗi client đăng ký có kết nối riêng tới từng worker để nhận tin đẩy
+        if session.subscriptions is None:
+            try:
+                session.subscriptions = [await Upstream.open(self.worker_host, port, session.push)
+                                         for port in self.worker_ports]
+            except OSError:
+                return encode_message(SHARD_UNAVAILABLE)
+        replies = await self._gather([upstream.send(payload) for upstream in session.subscriptions])
+        responses = [decode_message(reply) for reply in replies]
+        for response in responses:
+            if response.get('status') != 'success':
+                session.close()
+                return encode_message(response)
+        data = [item for i, response in enumerate(responses) for item in response['data']
+                if self.owner(item['id']) == i]
+        order = {(item['type'], item['id'], item['date']): n for n, item in enumerate(responses[0]['data'])}
+        data.sort(key=lambda item: order[(item['type'], item['id'], item['date'])])
+        return encode_message({"status": "success", "data": data, "tick": responses[0]['tick']})
+
+    # --- Chạy ---
+    async def serve(self):
+        await self.connect_workers()
+        server = await asyncio.start_server(self.handle_client, self.host, self.port,
+                                            backlog=self.backlog, reuse_address=True)
+        print(f"🎫 Cụm server đặt vé đang chạy tại {self.host}:{self.port} với {self.workers} worker")
+        async with server:
+            await server.serve_forever()
+
+    def start_server(self):
+        asyncio.run(self.serve())
+
+
+def start_cluster(host='localhost', port=9999, workers=None, worker_base_port=None, mode='threaded',
+                  db=None, journal=None, connections_per_worker=8, address_limit=None, phone_limit=None,
+                  journal_durable=True, slow_ms=None, profile_slow=None):
+    """Khởi động các tiến trình worker rồi chạy front trong tiến trình hiện tại"""
+    workers = workers or os.cpu_count() or 1
+    if not 1 <= workers <= MAX_SHARD + 1:
+        raise ValueError(f"Số worker phải từ 1 tới {MAX_SHARD + 1} (giới hạn bởi số bit shard trong mã đặt vé)")
+    worker_base_port = worker_base_port or port + 1
+    worker_ports = [worker_base_port + i for i in range(workers)]
+    processes = [multiprocessing.Process(target=run_worker, name=f"booking-shard-{i}", daemon=True,
+                                         args=(i, '127.0.0.1', worker_port, mode, db, journal,
+                                               journal_durable, slow_ms, profile_slow))
+                 for i, worker_port in enumerate(worker_ports)]
+    for process in processes:
+        process.start()
+    # SIGTERM cũng đi qua finally để không bỏ lại worker mồ côi giữ cổng
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        ClusterFront(host, port, worker_ports, connections_per_worker=connections_per_worker,
+                     address_limit=address_limit, phone_limit=phone_limit).start_server()
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cụm server đặt vé chạy nhiều tiến trình (mỗi core một worker)")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9999)
+    parser.add_argument('--workers', type=int, default=None, help="Số tiến trình worker (mặc định: số core)")
+    parser.add_argument('--worker-base-port', type=int, default=None,
+                        help="Cổng của worker đầu tiên, các worker sau dùng cổng kế tiếp (mặc định: port + 1)")
+    parser.add_argument('--mode', choices=['threaded', 'async'], default='threaded', help="Chế độ của từng worker")
+    parser.add_argument('--connections-per-worker', type=int, default=8)
+    parser.add_argument('--db', help="Mỗi worker lưu vào file SQLite riêng: booking.db -> booking-shard0.db, ...")
+    parser.add_argument('--journal', help="Mỗi worker ghi nhật ký vào thư mục con shard-<n> của thư mục này")
+    parser.add_argument('--journal-async', action='store_true',
+                        help="Worker trả lời trước khi nhật ký fsync xong (nhanh hơn, crash có thể mất booking vừa đặt)")
+    parser.add_argument('--slow-ms', type=float, metavar='MS',
+                        help="Mỗi worker ghi lại yêu cầu chạy lâu hơn MS mili-giây vào stats (mặc định 100)")
+    parser.add_argument('--profile-slow', type=float, metavar='MS',
+                        help="Bật bộ lấy mẫu ngăn xếp ở mỗi worker cho yêu cầu chạy lâu hơn MS mili-giây")
+    parser.add_argument('--rate-limit-ip', type=parse_rate, default=None, metavar='RATE[/BURST]',
+                        help="Giới hạn yêu cầu mỗi giây của một địa chỉ client (áp ở front)")
+    parser.add_argument('--rate-limit-phone', type=parse_rate, default=None, metavar='RATE[/BURST]',
+                        help="Giới hạn yêu cầu mỗi giây của một số điện thoại (áp ở front, chung cho mọi worker)")
+    args = parser.parse_args()
+
+    try:
+        start_cluster(args.host, args.port, args.workers, args.worker_base_port, args.mode,
+                      args.db, args.journal, args.connections_per_worker, args.rate_limit_ip, args.rate_limit_phone,
+                      not args.journal_async, args.slow_ms, args.profile_slow)
+    except KeyboardInterrupt:
+        print("\n🛑 Đang tắt cụm server...")
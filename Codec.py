@@ -0,0 +1,453 @@
+# Codec.py
+# Cách mã hóa nội dung thông điệp, chọn riêng cho từng kết nối bằng yêu cầu 'hello':
+#   json   - mặc định, client cũ không phải đổi gì
+#   binary - nhị phân kiểu MessagePack (client ở ngôn ngữ khác dùng được thư viện msgpack),
+#            thêm một kiểu ext cho danh sách bản ghi cùng cấu trúc (danh mục xe / phim,
+#            danh sách vé): tên trường ghi một lần, dữ liệu ghi theo cột - số đóng gói
+#            bằng struct, chuỗi nối thành một khối UTF-8 - nên phần lớn việc mã hóa /
+#            giải mã chạy trong C thay vì lặp từng giá trị trong Python.
+
+import json
+import struct
+from itertools import accumulate, chain, repeat
+from operator import itemgetter
+
+# Mã ext (MessagePack) của bảng bản ghi, và số dòng tối thiểu để ghi theo cột
+TABLE_EXT = 1
+MIN_TABLE_ROWS = 4
+
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_U64 = struct.Struct('>Q')
+_I16 = struct.Struct('>h')
+_I32 = struct.Struct('>i')
+_I64 = struct.Struct('>q')
+_F32 = struct.Struct('>f')
+_F64 = struct.Struct('>d')
+_TABLE_HEADER = struct.Struct('>HI')
+
+# Mã hóa sẵn của các tên trường hay gặp (khóa dict lặp lại ở mọi phản hồi)
+_key_cache = {}
+MAX_CACHED_KEYS = 4096
+
+
+class JsonCodec:
+    name = 'json'
+
+    def encode(self, message):
+        return json.dumps(message, ensure_ascii=False).encode('utf-8')
+
+    def decode(self, payload):
+        return json.loads(payload.decode('utf-8'))
+
+
+class BinaryCodec:
+    name = 'binary'
+
+    def encode(self, message):
+        out = bytearray()
+        _pack(message, out)
+        return bytes(out)
+
+    def decode(self, payload):
+        """bytes -> giá trị, ném ValueError nếu dữ liệu hỏng (như json.loads)"""
+        try:
+            value, end = _unpack(payload, 0)
+        except (IndexError, struct.error, TypeError, RecursionError, OverflowError) as e:
+            raise ValueError(f"Dữ liệu nhị phân hỏng: {e}") from None
+        if end != len(payload):
+            raise ValueError("Dữ liệu nhị phân thừa byte ở cuối")
+        return value
+
+
+JSON = JsonCodec()
+BINARY = BinaryCodec()
+CODECS = {codec.name: codec for codec in (JSON, BINARY)}
+
+
+def negotiate(offered):
+    """Codec đầu tiên client đề nghị mà server hỗ trợ, hoặc None"""
+    for name in offered:
+        if isinstance(name, str) and name in CODECS:
+            return CODECS[name]
+    return None
+
+
+# --- Mã hóa ---
+def _pack(obj, out):
+    t = type(obj)
+    if t is str:
+        _pack_str(obj, out)
+    elif t is int:
+        _pack_int(obj, out)
+    elif t is dict:
+        _pack_map(obj, out)
+    elif t is list or t is tuple:
+        _pack_array(obj, out)
+    elif obj is None:
+        out.append(0xc0)
+    elif t is bool:
+        out.append(0xc3 if obj else 0xc2)
+    elif t is float:
+        out.append(0xcb)
+        out += _F64.pack(obj)
+    # Lớp con (PreEncoded, IntEnum...) mã hóa như kiểu gốc, giống json.dumps
+    elif isinstance(obj, dict):
+        _pack_map(obj, out)
+    elif isinstance(obj, (list, tuple)):
+        _pack_array(obj, out)
+    elif isinstance(obj, str):
+        _pack_str(str(obj), out)
+    elif isinstance(obj, int):
+        _pack_int(int(obj), out)
+    elif isinstance(obj, float):
+        _pack(float(obj), out)
+    else:
+        raise TypeError(f"Object of type {t.__name__} is not serializable")
+
+
+def _str_header(n):
+    if n < 0x20:
+        return bytes((0xa0 | n,))
+    if n < 0x100:
+        return bytes((0xd9, n))
+    if n < 0x10000:
+        return b'\xda' + _U16.pack(n)
+    return b'\xdb' + _U32.pack(n)
+
+
+def _pack_str(s, out):
+    data = s.encode('utf-8')
+    out += _str_header(len(data))
+    out += data
+
+
+def _pack_key(key, out):
+    encoded = _key_cache.get(key)
+    if encoded is None:
+        if type(key) is not str:
+            # Như json.dumps: khóa số / bool / None được đổi thành chuỗi
+            if key is None or isinstance(key, (bool, int, float)):
+                key = json.dumps(key)
+            else:
+                raise TypeError(f"keys must be str, int, float, bool or None, not {type(key).__name__}")
+        data = key.encode('utf-8')
+        encoded = _str_header(len(data)) + data
+        if len(_key_cache) < MAX_CACHED_KEYS:
+            _key_cache[key] = encoded
+    out += encoded
+
+
+def _pack_int(n, out):
+    if 0 <= n < 0x80:
+        out.append(n)
+    elif -0x20 <= n < 0:
+        out.append(n & 0xff)
+    elif n > 0:
+        if n < 0x100:
+            out.append(0xcc)
+            out.append(n)
+        elif n < 0x10000:
+            out.append(0xcd)
+            out += _U16.pack(n)
+        elif n < 0x100000000:
+            out.append(0xce)
+            out += _U32.pack(n)
+        elif n < 0x10000000000000000:
+            out.append(0xcf)
+            out += _U64.pack(n)
+        else:
+            raise ValueError(f"Số nguyên quá lớn: {n}")
+    elif n >= -0x8000:
+        out.append(0xd1)
+        out += _I16.pack(n)
+    elif n >= -0x80000000:
+        out.append(0xd2)
+        out += _I32.pack(n)
+    elif n >= -0x8000000000000000:
+        out.append(0xd3)
+        out += _I64.pack(n)
+    else:
+        raise ValueError(f"Số nguyên quá lớn: {n}")
+
+
+def _pack_map(obj, out):
+    n = len(obj)
+    if n < 0x10:
+        out.append(0x80 | n)
+    elif n < 0x10000:
+        out.append(0xde)
+        out += _U16.pack(n)
+    else:
+        out.append(0xdf)
+        out += _U32.pack(n)
+    for key, value in obj.items():
+        _pack_key(key, out)
+        _pack(value, out)
+
+
+def _pack_array(items, out):
+    n = len(items)
+    if n >= MIN_TABLE_ROWS and type(items[0]) is dict and _pack_table(items, out):
+        return
+    if n < 0x10:
+        out.append(0x90 | n)
+    elif n < 0x10000:
+        out.append(0xdc)
+        out += _U16.pack(n)
+    else:
+        out.append(0xdd)
+        out += _U32.pack(n)
+    for item in items:
+        _pack(item, out)
+
+
+def _pack_table(rows, out):
+    """Ghi danh sách dict cùng bộ khóa (cùng thứ tự) theo cột; False nếu không đủ điều kiện.
+
+    ext32 TABLE_EXT: số cột (u16), số dòng (u32), rồi mỗi cột: tên (str), kiểu (1 byte), dữ liệu
+      s: u32 độ dài + các chuỗi UTF-8 nối bằng '\\0'    i / q: số nguyên 4 / 8 byte
+      d: số thực 8 byte    b: mỗi giá trị 1 byte    o: mảng giá trị bất kỳ
+      l: danh sách số nguyên (số ghế...): u32 tổng số phần tử, độ dài từng dòng (u32), rồi các số (4 byte)
+    """
+    keys = tuple(rows[0])
+    if not keys or len(keys) > 0xffff or len(rows) > 0xffffffff:
+        return False
+    if not all(type(key) is str for key in keys):
+        return False
+    if set(map(type, rows)) != {dict} or not all(map(keys.__eq__, map(tuple, rows))):
+        return False
+
+    n = len(rows)
+    columns = [list(map(itemgetter(keys[0]), rows))] if len(keys) == 1 else zip(*map(itemgetter(*keys), rows))
+    out += b'\xc9\x00\x00\x00\x00'
+    out.append(TABLE_EXT)
+    start = len(out)
+    out += _TABLE_HEADER.pack(len(keys), n)
+    for key, column in zip(keys, columns):
+        _pack_key(key, out)
+        _pack_column(column, n, out)
+    _U32.pack_into(out, start - 5, len(out) - start)
+    return True
+
+
+def _pack_column(column, n, out):
+    types = set(map(type, column))
+    if len(types) == 1:
+        t = types.pop()
+        if t is str:
+            text = '\0'.join(column)
+            if text.count('\0') == n - 1:
+                data = text.encode('utf-8')
+                out.append(0x73)  # 's'
+                out += _U32.pack(len(data))
+                out += data
+                return
+        elif t is int:
+            low, high = min(column), max(column)
+            if -0x80000000 <= low and high < 0x80000000:
+                out.append(0x69)  # 'i'
+                out += struct.pack(f'>{n}i', *column)
+                return
+            if -0x8000000000000000 <= low and high < 0x8000000000000000:
+                out.append(0x71)  # 'q'
+                out += struct.pack(f'>{n}q', *column)
+                return
+        elif t is float:
+            out.append(0x64)  # 'd'
+            out += struct.pack(f'>{n}d', *column)
+            return
+        elif t is bool:
+            out.append(0x62)  # 'b'
+            out += bytes(column)
+            return
+        elif t is list:
+            flat = list(chain.from_iterable(column))
+            if not flat or (set(map(type, flat)) == {int} and -0x80000000 <= min(flat) and max(flat) < 0x80000000):
+                out.append(0x6c)  # 'l'
+                out += _U32.pack(len(flat))
+                out += struct.pack(f'>{n}I', *map(len, column))
+                out += struct.pack(f'>{len(flat)}i', *flat)
+                return
+    out.append(0x6f)  # 'o'
+    _pack_array(list(column), out)
+
+
+# --- Giải mã ---
+def _unpack(data, pos):
+    tag = data[pos]
+    pos += 1
+    if tag < 0x80:
+        return tag, pos
+    if tag >= 0xe0:
+        return tag - 0x100, pos
+    if tag >= 0xa0 and tag < 0xc0:
+        end = pos + (tag & 0x1f)
+        if end > len(data):
+            raise IndexError("chuỗi bị cắt")
+        return data[pos:end].decode('utf-8'), end
+    if tag < 0x90:
+        return _unpack_map(data, pos, tag & 0x0f)
+    if tag < 0xa0:
+        return _unpack_array(data, pos, tag & 0x0f)
+    reader = _READERS.get(tag)
+    if reader is None:
+        raise ValueError(f"Kiểu dữ liệu nhị phân không hỗ trợ: 0x{tag:02x}")
+    return reader(data, pos)
+
+
+def _unpack_map(data, pos, n):
+    result = {}
+    for _ in range(n):
+        # Khóa gần như luôn là fixstr, giá trị hay là fixstr / số nhỏ: đọc tại chỗ, không gọi hàm
+        tag = data[pos]
+        if 0xa0 <= tag < 0xc0:
+            end = pos + 1 + (tag & 0x1f)
+            if end > len(data):
+                raise IndexError("chuỗi bị cắt")
+            key = data[pos + 1:end].decode('utf-8')
+            pos = end
+        else:
+            key, pos = _unpack(data, pos)
+            if type(key) is not str:
+                raise ValueError("Khóa phải là chuỗi")
+        tag = data[pos]
+        if tag < 0x80:
+            result[key] = tag
+            pos += 1
+        elif 0xa0 <= tag < 0xc0:
+            end = pos + 1 + (tag & 0x1f)
+            if end > len(data):
+                raise IndexError("chuỗi bị cắt")
+            result[key] = data[pos + 1:end].decode('utf-8')
+            pos = end
+        else:
+            result[key], pos = _unpack(data, pos)
+    return result, pos
+
+
+def _unpack_array(data, pos, n):
+    result = []
+    append = result.append
+    for _ in range(n):
+        value, pos = _unpack(data, pos)
+        append(value)
+    return result, pos
+
+
+def _read_str(size):
+    def read(data, pos):
+        (n,) = size.unpack_from(data, pos)
+        pos += size.size
+        if pos + n > len(data):
+            raise IndexError("chuỗi bị cắt")
+        return data[pos:pos + n].decode('utf-8'), pos + n
+    return read
+
+
+def _read_number(fmt):
+    def read(data, pos):
+        return fmt.unpack_from(data, pos)[0], pos + fmt.size
+    return read
+
+
+def _read_container(size, unpack):
+    def read(data, pos):
+        (n,) = size.unpack_from(data, pos)
+        return unpack(data, pos + size.size, n)
+    return read
+
+
+def _read_ext32(data, pos):
+    (length,) = _U32.unpack_from(data, pos)
+    kind = data[pos + 4]
+    pos += 5
+    end = pos + length
+    if kind != TABLE_EXT or end > len(data):
+        raise ValueError(f"Kiểu ext không hỗ trợ: {kind}")
+    rows, pos = _unpack_table(data, pos)
+    if pos != end:
+        raise ValueError("Độ dài bảng không khớp")
+    return rows, pos
+
+
+def _unpack_table(data, pos):
+    ncols, n = _TABLE_HEADER.unpack_from(data, pos)
+    pos += _TABLE_HEADER.size
+    if not ncols:
+        raise ValueError("Bảng không có cột")
+    keys = []
+    columns = []
+    for _ in range(ncols):
+        key, pos = _unpack(data, pos)
+        if type(key) is not str:
+            raise ValueError("Khóa phải là chuỗi")
+        kind = data[pos]
+        pos += 1
+        if kind == 0x73:  # 's'
+            (length,) = _U32.unpack_from(data, pos)
+            pos += 4
+            if pos + length > len(data):
+                raise IndexError("cột chuỗi bị cắt")
+            column = data[pos:pos + length].decode('utf-8').split('\0')
+            pos += length
+        elif kind in (0x69, 0x71, 0x64):  # 'i', 'q', 'd'
+            if pos + n * (4 if kind == 0x69 else 8) > len(data):
+                raise IndexError("cột số bị cắt")
+            fmt = struct.Struct(f'>{n}{chr(kind)}')
+            column = fmt.unpack_from(data, pos)
+            pos += fmt.size
+        elif kind == 0x62:  # 'b'
+            if pos + n > len(data):
+                raise IndexError("cột bool bị cắt")
+            column = [value != 0 for value in data[pos:pos + n]]
+            pos += n
+        elif kind == 0x6c:  # 'l'
+            (total,) = _U32.unpack_from(data, pos)
+            pos += 4
+            if pos + (n + total) * 4 > len(data):
+                raise IndexError("cột danh sách bị cắt")
+            lengths = struct.unpack_from(f'>{n}I', data, pos)
+            pos += n * 4
+            flat = struct.unpack_from(f'>{total}i', data, pos)
+            pos += total * 4
+            ends = list(accumulate(lengths))
+            if ends and ends[-1] != total:
+                raise ValueError("Độ dài cột danh sách không khớp")
+            column = [list(flat[end - length:end]) for length, end in zip(lengths, ends)]
+        elif kind == 0x6f:  # 'o'
+            column, pos = _unpack(data, pos)
+            if type(column) is not list:
+                raise ValueError("Cột phải là mảng")
+        else:
+            raise ValueError(f"Kiểu cột không hỗ trợ: {kind}")
+        if len(column) != n:
+            raise ValueError("Số dòng của cột không khớp")
+        keys.append(key)
+        columns.append(column)
+    return list(map(dict, map(zip, repeat(tuple(keys)), zip(*columns)))), pos
+
+
+_READERS = {
+    0xc0: lambda data, pos: (None, pos),
+    0xc2: lambda data, pos: (False, pos),
+    0xc3: lambda data, pos: (True, pos),
+    0xc9: _read_ext32,
+    0xca: _read_number(_F32),
+    0xcb: _read_number(_F64),
+    0xcc: _read_number(struct.Struct('>B')),
+    0xcd: _read_number(_U16),
+    0xce: _read_number(_U32),
+    0xcf: _read_number(_U64),
+    0xd0: _read_number(struct.Struct('>b')),
+    0xd1: _read_number(_I16),
+    0xd2: _read_number(_I32),
+    0xd3: _read_number(_I64),
+    0xd9: _read_str(struct.Struct('>B')),
+    0xda: _read_str(_U16),
+    0xdb: _read_str(_U32),
+    0xdc: _read_container(_U16, _unpack_array),
+    0xdd: _read_container(_U32, _unpack_array),
+    0xde: _read_container(_U16, _unpack_map),
+    0xdf: _read_container(_U32, _unpack_map),
+}
@@ -1,9 +1,24 @@
+import json
+import queue
 import sqlite3
+import threading
 
 DB_NAME = "booking.db"
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
+# Cột bổ sung cho schema gốc; DB cũ được nâng cấp bằng ALTER TABLE
+EXTRA_COLUMNS = {
+    'movies': [('code', 'TEXT'), ('showtime', 'TEXT'), ('cinema', 'TEXT'),
+               ('price', 'INTEGER'), ('total_seats', 'INTEGER')],
+    'buses': [('code', 'TEXT'), ('departure', 'TEXT'), ('arrival', 'TEXT'),
+              ('price', 'INTEGER')],
+    'bookings': [('code', 'TEXT'), ('service_code', 'TEXT'), ('seats', 'TEXT'),
+                 ('total_price', 'INTEGER'), ('customer_name', 'TEXT'),
+                 ('customer_phone', 'TEXT'), ('customer_email', 'TEXT'),
+                 ('booking_time', 'TEXT'), ('travel_date', 'TEXT')],
+}
+
+def init_db(db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS movies (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -18,5 +33,203 @@ def init_db():
                     user TEXT,
                     type TEXT,
                     ref_id INTEGER)''')
+
+    for table, columns in EXTRA_COLUMNS.items():
+        existing = {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+        for name, sql_type in columns:
+            if name not in existing:
+                c.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_movies_code ON movies(code)")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_buses_code ON buses(code)")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_bookings_code ON bookings(code)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_phone ON bookings(customer_phone)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_date ON bookings(travel_date)")
+    # Booking cũ (trước khi có ngày đi) tính theo ngày đặt
+    c.execute("UPDATE bookings SET travel_date = substr(booking_time, 1, 10) "
+              "WHERE travel_date IS NULL AND booking_time IS NOT NULL")
     conn.commit()
     conn.close()
+
+
+# --- Câu lệnh cố định: sqlite3 giữ sẵn bản đã biên dịch trong cache của mỗi kết nối ---
+SQL_SEED_BUS = '''INSERT OR IGNORE INTO buses (code, route, departure, arrival, price, seats)
+                  VALUES (?, ?, ?, ?, ?, ?)'''
+SQL_SEED_MOVIE = '''INSERT OR IGNORE INTO movies (code, title, showtime, duration, cinema, price, total_seats)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)'''
+SQL_LOAD_BUSES = "SELECT code, route, departure, arrival, price, seats FROM buses WHERE code IS NOT NULL ORDER BY id"
+SQL_LOAD_MOVIES = '''SELECT code, title, showtime, duration, price, cinema, total_seats
+                     FROM movies WHERE code IS NOT NULL ORDER BY id'''
+SQL_LOAD_BOOKINGS = '''SELECT code, type, service_code, seats, total_price, customer_name,
+                              customer_phone, customer_email, booking_time, travel_date
+                       FROM bookings WHERE code IS NOT NULL AND travel_date >= ? ORDER BY id'''
+SQL_INSERT_BOOKING = {
+    'bus': '''INSERT INTO bookings (user, type, ref_id, code, service_code, seats, total_price,
+                                    customer_name, customer_phone, customer_email, booking_time, travel_date)
+              VALUES (?, 'bus', (SELECT id FROM buses WHERE code = ?), ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+    'movie': '''INSERT INTO bookings (user, type, ref_id, code, service_code, seats, total_price,
+                                      customer_name, customer_phone, customer_email, booking_time, travel_date)
+                VALUES (?, 'movie', (SELECT id FROM movies WHERE code = ?), ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+}
+SQL_DELETE_BOOKING = "DELETE FROM bookings WHERE code = ?"
+
+
+def _booking_params(booking):
+    customer = booking.customer_info()
+    customer = customer if isinstance(customer, dict) else {}
+    return (customer.get('name'), booking.service_id, booking.booking_id, booking.service_id,
+            json.dumps(list(booking.seats), ensure_ascii=False), booking.total_price,
+            customer.get('name'), customer.get('phone'), customer.get('email'), booking.booking_time,
+            booking.date)
+
+
+class BookingStore:
+    """Lưu booking bền vững vào SQLite (chế độ WAL).
+
+    Mỗi thread có kết nối riêng để đọc; mọi lệnh ghi đi qua một thread ghi duy nhất
+    gom nhiều booking vào một transaction (group commit) nên chỉ tốn một lần fsync
+    cho cả nhóm. Các hàm ghi chờ tới khi nhóm của mình được commit rồi mới trả về.
+    """
+
+    def __init__(self, path=DB_NAME, batch_size=512, synchronous='FULL'):
+        self.path = path
+        self.batch_size = batch_size
+        self.synchronous = synchronous
+        self.commits = 0
+        self.writes = 0
+        self._local = threading.local()
+        self._queue = queue.Queue()
+
+        init_db(path)
+        self._writer = threading.Thread(target=self._write_loop, name="booking-store-writer", daemon=True)
+        self._writer.start()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return conn
+
+    def connection(self):
+        """Kết nối riêng của thread hiện tại (tạo khi cần)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return conn
+
+    # --- Nạp dữ liệu khi khởi động ---
+    def seed_catalog(self, buses, movies):
+        """Ghi danh mục xe / phim mặc định nếu DB chưa có"""
+        conn = self.connection()
+        with conn:
+            conn.executemany(SQL_SEED_BUS, [
+                (b['id'], b['route'], b['departure'], b['arrival'], b['price'], b['total_seats'])
+                for b in buses.values()
+            ])
+            conn.executemany(SQL_SEED_MOVIE, [
+                (m['id'], m['title'], m['showtime'], m['duration'], m['cinema'], m['price'], m['total_seats'])
+                for m in movies.values()
+            ])
+
+    def load_catalog(self):
+        conn = self.connection()
+        buses = {}
+        for code, route, departure, arrival, price, seats in conn.execute(SQL_LOAD_BUSES):
+            buses[code] = {'id': code, 'route': route, 'departure': departure, 'arrival': arrival,
+                           'price': price, 'total_seats': seats}
+        movies = {}
+        for code, title, showtime, duration, price, cinema, seats in conn.execute(SQL_LOAD_MOVIES):
+            movies[code] = {'id': code, 'title': title, 'showtime': showtime, 'duration': duration,
+                            'price': price, 'cinema': cinema, 'total_seats': seats}
+        return buses, movies
+
+    def load_bookings(self, since=''):
+        """Booking có ngày đi từ `since` ('YYYY-MM-DD') trở đi; ngày cũ hơn vẫn nằm trong DB"""
+        for row in self.connection().execute(SQL_LOAD_BOOKINGS, (since,)):
+            code, btype, service_code, seats, total_price, name, phone, email, booking_time, date = row
+            yield {
+                'booking_id': code,
+                'type': btype,
+                'service_id': service_code,
+                'service_name': None,
+                'date': date,
+                'customer': {'name': name, 'phone': phone, 'email': email or ""},
+                'seats': json.loads(seats),
+                'total_price': total_price,
+                'booking_time': booking_time
+            }
+
+    def bind(self, snapshot_source):
+        """SQLite luôn có trạng thái đầy đủ, không cần chụp snapshot"""
+
+    def archive(self, date, bookings):
+        """Booking của ngày đã gỡ khỏi bộ nhớ vẫn nằm nguyên trong DB, không cần ghi thêm"""
+
+    # --- Ghi ---
+    def save_booking(self, booking):
+        self._submit([(SQL_INSERT_BOOKING[booking.type], _booking_params(booking))])
+
+    def delete_booking(self, booking_id):
+        self._submit([(SQL_DELETE_BOOKING, (booking_id,))])
+
+    def write_batch(self, saved, deleted):
+        """Ghi nhiều booking / lượt hủy, chỉ chờ một lần commit"""
+        self._submit([(SQL_INSERT_BOOKING[b.type], _booking_params(b)) for b in saved] +
+                     [(SQL_DELETE_BOOKING, (booking_id,)) for booking_id in deleted])
+
+    def _submit(self, statements):
+        """Xếp các lệnh vào hàng đợi như một khối: cùng commit hoặc cùng rollback.
+        Ném lại sqlite3.Error nếu khối không ghi được."""
+        item = [statements, threading.Event(), None]
+        self._queue.put(item)
+        item[1].wait()
+        if item[2] is not None:
+            raise item[2]
+
+    def _write_loop(self):
+        conn = self._open()
+        stop = False
+        while not stop:
+            # Chờ khối đầu tiên, rồi gom mọi khối đang xếp hàng vào cùng transaction
+            batch = []
+            statements = 0
+            item = self._queue.get()
+            while True:
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                statements += len(item[0])
+                if statements >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if not batch:
+                continue
+
+            try:
+                with conn:
+                    for item in batch:
+                        for sql, params in item[0]:
+                            conn.execute(sql, params)
+            except sqlite3.Error:
+                # Cả nhóm bị rollback: chạy lại từng khối trong transaction riêng để chỉ khối lỗi
+                # nhận lỗi (một batch của server không bao giờ bị ghi một nửa)
+                for item in batch:
+                    try:
+                        with conn:
+                            for sql, params in item[0]:
+                                conn.execute(sql, params)
+                    except sqlite3.Error as e:
+                        item[2] = e
+            self.commits += 1
+            self.writes += statements
+            for item in batch:
+                item[1].set()
+        conn.close()
+
+    def close(self):
+        """Ghi nốt các lệnh còn trong hàng đợi rồi dừng thread ghi"""
+        self._queue.put(None)
+        self._writer.join()
@@ -0,0 +1,54 @@
+# Holds.py
+# Bộ hẹn giờ cho các lượt giữ chỗ có thời hạn (TTL): một heap sắp theo thời điểm hết hạn
+# và một thread duy nhất ngủ tới hạn gần nhất. Không tạo thread cho từng lượt giữ chỗ,
+# cũng không quét toàn bộ định kỳ: mỗi lượt thêm / hết hạn tốn O(log n).
+
+import heapq
+import threading
+import time
+
+
+class ExpiryScheduler:
+    """Gọi on_expire(key) khi tới hạn của key.
+
+    Hủy hẹn giờ theo kiểu "lười": mục đã xác nhận / trả chỗ vẫn nằm trong heap,
+    on_expire tự kiểm tra key còn hiệu lực hay không.
+    """
+
+    def __init__(self, on_expire, clock=time.time):
+        self.on_expire = on_expire
+        self.clock = clock
+        self.fired = 0
+        self._heap = []
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="hold-expiry", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, key, expires_at):
+        with self._cond:
+            heapq.heappush(self._heap, (expires_at, key))
+            # Chỉ đánh thức thread khi hạn mới sớm hơn hạn nó đang chờ
+            if self._heap[0][1] == key:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > self.clock():
+                    timeout = self._heap[0][0] - self.clock() if self._heap else None
+                    self._cond.wait(timeout)
+                due = []
+                now = self.clock()
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[1])
+
+            # Gọi callback ngoài khóa để schedule() không phải chờ
+            for key in due:
+                try:
+                    self.on_expire(key)
+                    self.fired += 1
+                except Exception as e:
+                    print(f"❌ Lỗi khi hết hạn giữ chỗ {key}: {e}")
@@ -0,0 +1,107 @@
+# Idempotency.py
+# Chống xử lý trùng khi client gửi lại yêu cầu ghi (đặt / hủy vé...) sau khi bị timeout.
+# Client gắn một idempotency_key cho mỗi thao tác; server nhớ khóa -> phản hồi trong một
+# cache LRU có hạn (TTL). Lần gửi lại trả đúng phản hồi cũ trong O(1), không đụng tới ghế.
+
+import threading
+import time
+from collections import OrderedDict
+
+MAX_KEY_LENGTH = 128
+
+
+class _Pending:
+    """Yêu cầu mang khóa này đang được xử lý; các lần gửi lại chờ trên event"""
+    __slots__ = ('request', 'done', 'response')
+
+    def __init__(self, request):
+        self.request = request
+        self.done = threading.Event()
+        self.response = None
+
+
+class IdempotencyCache:
+    """Cache khóa -> (hạn, yêu cầu, phản hồi), tối đa max_entries khóa, mỗi khóa sống ttl giây.
+
+    Yêu cầu được so khớp cùng khóa: dùng lại khóa cho một yêu cầu khác là lỗi của client.
+    """
+
+    def __init__(self, max_entries=100000, ttl=600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def run(self, key, request, handler):
+        """Trả phản hồi đã lưu cho khóa này, hoặc gọi handler() đúng một lần rồi lưu lại"""
+        request = {k: v for k, v in request.items() if k != 'idempotency_key'}
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and not isinstance(entry, _Pending) and entry[0] <= self.clock():
+                    del self._entries[key]
+                    entry = None
+                if entry is None:
+                    pending = self._entries[key] = _Pending(request)
+                    self.misses += 1
+                    break
+                if isinstance(entry, _Pending):
+                    if entry.request != request:
+                        return _key_reused()
+                else:
+                    if entry[1] != request:
+                        return _key_reused()
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+
+            # Lần gửi đầu vẫn đang chạy: chờ nó xong rồi dùng chung phản hồi
+            entry.done.wait()
+            if entry.response is not None:
+                with self._lock:
+                    self.hits += 1
+                return entry.response
+            # Lần đầu lỗi bất ngờ và không lưu gì: thử giành quyền xử lý lại
+
+        try:
+            response = handler()
+        except BaseException:
+            with self._lock:
+                self._entries.pop(key, None)
+            pending.done.set()
+            raise
+
+        with self._lock:
+            if isinstance(response, dict) and response.get('retryable'):
+                # Lỗi tạm thời (ghi store lỗi...): không lưu, gửi lại cùng khóa sẽ được xử lý lại
+                self._entries.pop(key, None)
+            else:
+                self._entries[key] = (self.clock() + self.ttl, request, response)
+                self._entries.move_to_end(key)
+                self._evict()
+        pending.response = response
+        pending.done.set()
+        return response
+
+    def _evict(self):
+        # Khóa ít dùng nhất nằm đầu; bỏ khóa hết hạn và khóa vượt sức chứa.
+        # Dừng ở khóa đang xử lý: số khóa như vậy không vượt quá số yêu cầu đang chạy
+        now = self.clock()
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if isinstance(entry, _Pending):
+                break
+            if len(self._entries) > self.max_entries or entry[0] <= now:
+                del self._entries[key]
+            else:
+                break
+
+
+def _key_reused():
+    return {"status": "error", "message": "Khóa idempotency đã được dùng cho một yêu cầu khác"}
@@ -0,0 +1,101 @@
+# Ids.py
+# Sinh mã đặt vé duy nhất, ngắn và tăng dần theo thời gian (kiểu Snowflake):
+#   32 bit giây kể từ 2024-01-01 | 5 bit shard | 13 bit số thứ tự trong giây
+# = 50 bit, viết bằng Crockford base32 thành đúng 10 ký tự (ví dụ 0KZ3M8Q2A4).
+# Bảng chữ cái tăng dần theo ASCII nên so sánh chuỗi cũng là so sánh thời gian.
+
+import threading
+import time
+
+ID_EPOCH = 1704067200  # 2024-01-01 00:00:00 UTC
+SHARD_BITS = 5
+SEQUENCE_BITS = 13
+MAX_SHARD = (1 << SHARD_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+ID_LENGTH = 10
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_DECODE = {ch: i for i, ch in enumerate(ALPHABET)}
+# Ký tự dễ gõ nhầm khi khách nhập tay
+_CONFUSABLE = str.maketrans({'O': '0', 'I': '1', 'L': '1', '-': None, ' ': None})
+
+
+def encode_id(value):
+    chars = []
+    for _ in range(ID_LENGTH):
+        value, rem = divmod(value, 32)
+        chars.append(ALPHABET[rem])
+    return ''.join(reversed(chars))
+
+
+def decode_id(text):
+    """Mã -> số nguyên; ném ValueError nếu không phải mã do IdGenerator sinh ra"""
+    if len(text) != ID_LENGTH:
+        raise ValueError(f"Mã không hợp lệ: {text}")
+    value = 0
+    for ch in text:
+        if ch not in _DECODE:
+            raise ValueError(f"Mã không hợp lệ: {text}")
+        value = value * 32 + _DECODE[ch]
+    return value
+
+
+def normalize_id(text):
+    """Chuẩn hóa mã khách nhập: chữ hoa, bỏ gạch ngang / khoảng trắng, O->0, I/L->1"""
+    return text.strip().upper().translate(_CONFUSABLE)
+
+
+def id_timestamp(text):
+    """Thời điểm (epoch giây) tạo ra mã"""
+    return (decode_id(text) >> (SHARD_BITS + SEQUENCE_BITS)) + ID_EPOCH
+
+
+def id_shard(text):
+    return (decode_id(text) >> SEQUENCE_BITS) & MAX_SHARD
+
+
+def min_id_at(timestamp):
+    """Mã nhỏ nhất có thể sinh ra tại thời điểm này: dùng làm cận dưới khi tìm theo khoảng thời gian"""
+    return encode_id(max(0, int(timestamp) - ID_EPOCH) << (SHARD_BITS + SEQUENCE_BITS))
+
+
+class IdGenerator:
+    """Bộ sinh mã cho một shard. Không bao giờ trùng trong cùng shard:
+    hết số thứ tự trong giây thì mượn giây kế tiếp, đồng hồ chạy lùi thì giữ mốc cũ."""
+
+    def __init__(self, shard=0, clock=time.time):
+        if not 0 <= shard <= MAX_SHARD:
+            raise ValueError(f"Shard phải từ 0 tới {MAX_SHARD}")
+        self.shard = shard
+        self.clock = clock
+        self._last = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            now = int(self.clock()) - ID_EPOCH
+            if now > self._last:
+                self._last = now
+                self._sequence = 0
+            elif self._sequence < MAX_SEQUENCE:
+                self._sequence += 1
+            else:
+                self._last += 1
+                self._sequence = 0
+            value = (self._last << (SHARD_BITS + SEQUENCE_BITS)) | (self.shard << SEQUENCE_BITS) | self._sequence
+        return encode_id(value)
+
+    def observe(self, text):
+        """Ghi nhận một mã đã dùng (khi nạp lại dữ liệu) để không sinh lại mã đó sau khi khởi động lại"""
+        try:
+            value = decode_id(text)
+        except ValueError:
+            return  # mã kiểu cũ
+        if (value >> SEQUENCE_BITS) & MAX_SHARD != self.shard:
+            return
+        seconds = value >> (SHARD_BITS + SEQUENCE_BITS)
+        sequence = value & MAX_SEQUENCE
+        with self._lock:
+            if (seconds, sequence) > (self._last, self._sequence):
+                self._last, self._sequence = seconds, sequence
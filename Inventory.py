@@ -0,0 +1,150 @@
+# Inventory.py
+# Tồn kho ghế theo từng chuyến xe / suất chiếu. Danh mục chỉ là lịch chạy lặp lại mỗi ngày
+# (tuyến + giờ khởi hành, phim + rạp + giờ chiếu); mỗi ngày chạy là một chuyến riêng với
+# sơ đồ ghế riêng, tạo khi có người đặt lần đầu.
+# Sơ đồ ghế được chia theo ngày (partition): tra một chuyến là hai lần tra dict, không phụ
+# thuộc lượng lịch sử đã tích lũy; ngày đã qua được gỡ nguyên cả partition (lưu trữ rồi bỏ
+# khỏi bộ nhớ) mà không chạm tới các ngày đang bán.
+
+import datetime
+import threading
+import time
+
+DEFAULT_HORIZON_DAYS = 90
+# Giữ lại hôm qua: chuyến đêm (22:00 -> 06:00+1) vẫn còn chạy sau nửa đêm
+DEFAULT_RETENTION_DAYS = 1
+MAX_EVICT_SLEEP = 3600
+
+
+def booking_date(booking):
+    """Ngày đi / ngày chiếu của booking; booking cũ (trước khi có ngày) tính theo ngày đặt"""
+    return booking.get('date') or booking['booking_time'][:10]
+
+
+class DayPartition:
+    """Các chuyến của một ngày: (loại, mã dịch vụ) -> sơ đồ ghế, cùng mã đặt vé của ngày đó"""
+
+    __slots__ = ('date', 'seat_maps', 'bookings', 'catalogs', 'lock')
+
+    def __init__(self, date):
+        self.date = date
+        self.seat_maps = {}
+        self.bookings = {}  # mã đặt vé -> None (dict giữ thứ tự đặt)
+        self.catalogs = {}  # loại -> cache danh mục của ngày này (server tạo khi cần)
+        self.lock = threading.Lock()
+
+
+class Inventory:
+    """Sơ đồ ghế của mọi chuyến, chia theo ngày 'YYYY-MM-DD'.
+
+    services: loại ('bus' / 'movie') -> dict mã -> dịch vụ;
+    make_seat_map(loại, dịch vụ) -> sơ đồ ghế trống cho một chuyến;
+    on_evict(partition): gọi khi một ngày bị gỡ khỏi bộ nhớ (để lưu trữ booking của ngày đó).
+    Bán vé từ hôm nay tới horizon_days ngày sau; giữ retention_days ngày đã qua để tra cứu.
+    """
+
+    def __init__(self, services, make_seat_map, horizon_days=DEFAULT_HORIZON_DAYS,
+                 retention_days=DEFAULT_RETENTION_DAYS, on_evict=None, clock=datetime.date.today):
+        self.services = services
+        self.make_seat_map = make_seat_map
+        self.horizon_days = horizon_days
+        self.retention_days = retention_days
+        self.on_evict = on_evict
+        self.clock = clock
+        self.partitions = {}
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def today(self):
+        return self.clock().isoformat()
+
+    def cutoff(self):
+        """Ngày sớm nhất còn giữ trong bộ nhớ"""
+        return (self.clock() - datetime.timedelta(days=self.retention_days)).isoformat()
+
+    def check_date(self, value, past=False):
+        """(ngày, None) nếu hợp lệ, (None, phản hồi lỗi) nếu không; None là hôm nay.
+
+        past=True (xem danh mục, tìm kiếm): cho phép cả các ngày đã qua còn giữ lại.
+        """
+        today = self.clock()
+        if value is None:
+            return today.isoformat(), None
+        try:
+            date = datetime.date.fromisoformat(value)
+            if date.isoformat() != value:
+                raise ValueError(value)
+        except (TypeError, ValueError):
+            return None, {"status": "error", "message": "Ngày không hợp lệ (định dạng YYYY-MM-DD)"}
+        first = today - datetime.timedelta(days=self.retention_days) if past else today
+        last = today + datetime.timedelta(days=self.horizon_days)
+        if not first <= date <= last:
+            return None, {"status": "error", "message": f"Chỉ nhận ngày từ {first.isoformat()} tới {last.isoformat()}"}
+        return value, None
+
+    # --- Tra cứu: O(1) theo ngày ---
+    def get(self, date):
+        """Partition của ngày, hoặc None nếu ngày đó chưa có gì"""
+        return self.partitions.get(date)
+
+    def partition(self, date):
+        partition = self.partitions.get(date)
+        if partition is None:
+            with self._lock:
+                partition = self.partitions.get(date)
+                if partition is None:
+                    partition = self.partitions[date] = DayPartition(date)
+        return partition
+
+    def find(self, kind, service_id, date):
+        """Sơ đồ ghế của chuyến nếu đã có, không tạo mới"""
+        partition = self.partitions.get(date)
+        return partition.seat_maps.get((kind, service_id)) if partition is not None else None
+
+    def seat_map(self, kind, service_id, date):
+        """Sơ đồ ghế của chuyến (tạo khi cần); dịch vụ phải tồn tại"""
+        partition = self.partition(date)
+        key = (kind, service_id)
+        seat_map = partition.seat_maps.get(key)
+        if seat_map is None:
+            with partition.lock:
+                seat_map = partition.seat_maps.get(key)
+                if seat_map is None:
+                    seat_map = partition.seat_maps[key] = self.make_seat_map(kind, self.services[kind][service_id])
+        return seat_map
+
+    def available(self, kind, service_id, date):
+        """Số ghế trống; chuyến chưa ai đặt thì còn nguyên"""
+        seat_map = self.find(kind, service_id, date)
+        if seat_map is not None:
+            return seat_map.free_count
+        return self.services[kind][service_id]['total_seats']
+
+    # --- Gỡ các ngày đã qua ---
+    def evict_before(self, date):
+        """Gỡ mọi partition trước ngày `date`; trả về danh sách partition đã gỡ"""
+        with self._lock:
+            expired = sorted(day for day in self.partitions if day < date)
+            removed = [self.partitions.pop(day) for day in expired]
+        for partition in removed:
+            self.evicted += 1
+            if self.on_evict is not None:
+                self.on_evict(partition)
+        return removed
+
+    def start(self):
+        """Chạy thread gỡ ngày cũ mỗi khi qua nửa đêm"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="inventory-eviction", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            now = datetime.datetime.now()
+            midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+            time.sleep(min(MAX_EVICT_SLEEP, (midnight - now).total_seconds() + 1))
+            try:
+                self.evict_before(self.cutoff())
+            except Exception as e:
+                print(f"❌ Lỗi khi gỡ ngày cũ khỏi bộ nhớ: {e}")
@@ -0,0 +1,319 @@
+# Journal.py
+# Nhật ký booking chỉ-ghi-thêm (append-only) dạng nhị phân + ảnh chụp (snapshot) định kỳ.
+# Khi khởi động: nạp snapshot mới nhất rồi chỉ phát lại hai đoạn nhật ký cuối (đoạn ngay
+# trước snapshot và đoạn sau nó), nên thời gian khởi động không tăng theo lịch sử.
+#
+# Thư mục nhật ký:
+#   snapshot-<G>.snap   trạng thái đầy đủ (zlib + JSON) tại lúc bắt đầu thế hệ G
+#   journal-<G>.log     các thay đổi sau snapshot G, mỗi bản ghi: độ dài | crc32 | loại | dữ liệu
+#
+# Snapshot G chụp bộ nhớ của server ngay sau khi chuyển sang đoạn G, lúc đó booking vừa fsync
+# ở cuối đoạn G-1 có thể chưa kịp vào bảng của server. Vì vậy đoạn G-1 được giữ lại và luôn
+# phát lại lên snapshot G (phát lại là idempotent: bản ghi theo đúng thứ tự, mã không trùng).
+#   archive-<ngày>.snap booking của một ngày đã gỡ khỏi bộ nhớ (zlib + JSON), không còn được nạp lại
+
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from Inventory import booking_date
+
+RECORD_HEADER = struct.Struct('!IIB')
+OP_BOOK = 1
+OP_CANCEL = 2
+
+
+def _encode_record(op, payload):
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload), op) + payload
+
+
+def _book_record(booking):
+    """booking: Booking của server; ghi ở dạng dict như client nhận"""
+    return _encode_record(OP_BOOK, json.dumps(booking.to_dict(), ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def _read_records(path):
+    """Đọc các bản ghi hợp lệ; dừng ở bản ghi bị ghi dở (crash giữa chừng).
+
+    Trả về (danh sách (op, payload), số byte hợp lệ).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    records = []
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        length, crc, op = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        records.append((op, payload))
+        offset = start + length
+    return records, offset
+
+
+class BookingJournal:
+    """Lưu booking bằng nhật ký append-only, dùng thay cho BookingStore (SQLite).
+
+    Thread ghi gom các bản ghi đang chờ và chỉ fsync một lần cho cả nhóm.
+    durable=True (mặc định): chờ tới khi nhóm của mình đã fsync xong, ghi lỗi thì ném OSError;
+    durable=False: lượt đặt vé không chờ fsync, độ trễ không phụ thuộc đĩa nhưng crash có thể
+    mất các booking đã trả lời khách.
+    """
+
+    def __init__(self, directory='journal', snapshot_every=100000, flush_interval=0.005, durable=True):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.flush_interval = flush_interval
+        self.durable = durable
+        self.records = 0
+        self.fsyncs = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue()
+        self._snapshot_source = None
+        self._snapshot_thread = None
+        self._since_snapshot = 0
+        self._state = None
+        self._file = None
+        self._writer = None
+
+    def _path(self, kind, generation):
+        ext = 'snap' if kind == 'snapshot' else 'log'
+        return os.path.join(self.directory, f"{kind}-{generation:06d}.{ext}")
+
+    def _generations(self, kind):
+        prefix = kind + '-'
+        return sorted(int(name[len(prefix):].split('.')[0]) for name in os.listdir(self.directory)
+                      if name.startswith(prefix) and not name.endswith('.tmp'))
+
+    # --- Khôi phục khi khởi động ---
+    def _recover(self):
+        if self._state is not None:
+            return self._state
+
+        snapshots = self._generations('snapshot')
+        state = {'generation': 0, 'buses': None, 'movies': None, 'bookings': []}
+        if snapshots:
+            with open(self._path('snapshot', snapshots[-1]), 'rb') as f:
+                state = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+
+        # Phát lại các đoạn nhật ký từ đoạn ngay trước snapshot trở đi
+        bookings = {b['booking_id']: b for b in state['bookings']}
+        generation = state['generation']
+        for segment in self._generations('journal'):
+            if segment < state['generation'] - 1:
+                continue
+            path = self._path('journal', segment)
+            records, valid_bytes = _read_records(path)
+            for op, payload in records:
+                if op == OP_BOOK:
+                    booking = json.loads(payload.decode('utf-8'))
+                    bookings[booking['booking_id']] = booking
+                elif op == OP_CANCEL:
+                    bookings.pop(payload.decode('utf-8'), None)
+            if valid_bytes < os.path.getsize(path):
+                with open(path, 'r+b') as f:
+                    f.truncate(valid_bytes)
+            generation = max(generation, segment)
+            self._since_snapshot += len(records)
+
+        state['bookings'] = list(bookings.values())
+        self._state = state
+        self._open_segment(generation)
+        return state
+
+    def _reopen_segment(self, offset):
+        path = self._file.name
+        try:
+            self._file.close()
+        except OSError:
+            pass  # phần đệm chưa ghi được bị bỏ
+        try:
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+        except OSError as e:
+            print(f"❌ Không cắt được nhật ký {path}: {e}")
+        self._file = open(path, 'ab')
+
+    def _open_segment(self, generation):
+        self.generation = generation
+        self._file = open(self._path('journal', generation), 'ab')
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="booking-journal-writer", daemon=True)
+            self._writer.start()
+
+    # --- Giao diện giống BookingStore ---
+    def seed_catalog(self, buses, movies):
+        state = self._recover()
+        if state['buses'] is None:
+            state['buses'] = [_catalog_entry(b) for b in buses.values()]
+            state['movies'] = [_catalog_entry(m) for m in movies.values()]
+            self._write_snapshot(state['generation'], state['buses'], state['movies'], state['bookings'])
+
+    def load_catalog(self):
+        state = self._recover()
+        return ({b['id']: dict(b) for b in state['buses']},
+                {m['id']: dict(m) for m in state['movies']})
+
+    def load_bookings(self, since=''):
+        """Booking có ngày đi từ `since` trở đi; booking cũ hơn được chuyển vào file lưu trữ"""
+        bookings = self._recover()['bookings']
+        self._state['bookings'] = []
+        current = []
+        stale = {}
+        for booking in bookings:
+            date = booking_date(booking)
+            if date < since:
+                stale.setdefault(date, []).append(booking)
+            else:
+                current.append(booking)
+        for date, old in stale.items():
+            self.archive(date, old)
+        return current
+
+    def archive(self, date, bookings):
+        """Ghi booking của một ngày đã gỡ khỏi bộ nhớ vào archive-<ngày>.snap (gộp với bản đã có).
+
+        Phải ghi xong trước khi booking rời bộ nhớ: snapshot sau đó không còn chứa chúng.
+        """
+        path = os.path.join(self.directory, f"archive-{date}.snap")
+        merged = {}
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                merged = {b['booking_id']: b for b in json.loads(zlib.decompress(f.read()).decode('utf-8'))}
+        merged.update((b['booking_id'], b) for b in bookings)
+        _write_atomic(path, zlib.compress(json.dumps(list(merged.values()), ensure_ascii=False,
+                                                     separators=(',', ':')).encode('utf-8')))
+
+    def bind(self, snapshot_source):
+        """snapshot_source() -> (buses, movies, bookings): trạng thái hiện tại của server"""
+        self._snapshot_source = snapshot_source
+
+    def save_booking(self, booking):
+        self._submit([_book_record(booking)])
+
+    def delete_booking(self, booking_id):
+        self._submit([_encode_record(OP_CANCEL, booking_id.encode('utf-8'))])
+
+    def write_batch(self, saved, deleted):
+        """Ghi nhiều booking / lượt hủy vào cùng một nhóm fsync"""
+        self._submit([_book_record(b) for b in saved] +
+                     [_encode_record(OP_CANCEL, booking_id.encode('utf-8')) for booking_id in deleted])
+
+    def _submit(self, records):
+        item = [b''.join(records), len(records), threading.Event() if self.durable else None, None]
+        self._queue.put(item)
+        if item[2] is not None:
+            item[2].wait()
+            if item[3] is not None:
+                raise item[3]
+
+    # --- Thread ghi ---
+    def _write_loop(self):
+        stop = False
+        while not stop:
+            batch = []
+            item = self._queue.get()
+            if item is not None and self.flush_interval:
+                time.sleep(self.flush_interval)  # đợi thêm chút để gom nhóm lớn hơn
+            while True:
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if not batch:
+                continue
+
+            count = sum(item[1] for item in batch)
+            offset = self._file.tell()
+            try:
+                self._file.write(b''.join(item[0] for item in batch))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                # Cả nhóm coi như chưa ghi: cắt phần ghi dở để bản ghi sau không nằm sau bản ghi hỏng
+                print(f"❌ Lỗi khi ghi nhật ký: {e}")
+                self._reopen_segment(offset)
+                for item in batch:
+                    item[3] = e
+                count = 0
+            else:
+                self.fsyncs += 1
+                self.records += count
+            for item in batch:
+                if item[2] is not None:
+                    item[2].set()
+
+            self._since_snapshot += count
+            if self._since_snapshot >= self.snapshot_every:
+                self._start_snapshot()
+        self._file.close()
+
+    # --- Snapshot ---
+    def _start_snapshot(self):
+        if self._snapshot_source is None:
+            return
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            return
+
+        # Chuyển sang đoạn nhật ký mới trước rồi mới chụp trạng thái: mọi thay đổi sau điểm
+        # chuyển đều nằm trong đoạn mới, phát lại chúng lên snapshot là an toàn (idempotent)
+        old_file = self._file
+        generation = self.generation + 1
+        self._open_segment(generation)
+        old_file.close()
+        self._since_snapshot = 0
+
+        self._snapshot_thread = threading.Thread(target=self._take_snapshot, args=(generation,),
+                                                 name="booking-journal-snapshot", daemon=True)
+        self._snapshot_thread.start()
+
+    def _take_snapshot(self, generation):
+        buses, movies, bookings = self._snapshot_source()
+        self._write_snapshot(generation, [_catalog_entry(b) for b in buses.values()],
+                             [_catalog_entry(m) for m in movies.values()], [b.to_dict() for b in bookings])
+
+        # Snapshot mới đã an toàn trên đĩa: xóa snapshot cũ hơn và các đoạn nhật ký trước
+        # đoạn G-1 (đoạn G-1 còn cần để phát lại các booking snapshot có thể chưa thấy)
+        for old in self._generations('snapshot'):
+            if old < generation:
+                os.remove(self._path('snapshot', old))
+        for old in self._generations('journal'):
+            if old < generation - 1:
+                os.remove(self._path('journal', old))
+
+    def _write_snapshot(self, generation, buses, movies, bookings):
+        state = {'generation': generation, 'buses': buses, 'movies': movies, 'bookings': bookings}
+        data = zlib.compress(json.dumps(state, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        _write_atomic(self._path('snapshot', generation), data)
+
+    def close(self):
+        """Ghi nốt các bản ghi còn chờ rồi dừng thread ghi"""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+
+
+def _write_atomic(path, data):
+    """Ghi ra file tạm, fsync rồi mới đổi tên: file đích luôn đầy đủ kể cả khi crash giữa chừng"""
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def _catalog_entry(service):
+    """Bỏ sơ đồ ghế khỏi bản ghi danh mục: ghế được dựng lại từ các booking"""
+    return {key: value for key, value in service.items() if key != 'seat_map'}
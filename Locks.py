@@ -0,0 +1,87 @@
+# Locks.py
+# Khóa đồng bộ cho BookingServer: mỗi chuyến xe / suất chiếu có một khóa riêng để các
+# lượt đặt vé cho những chuyến khác nhau không bao giờ phải chờ nhau; bảng booking
+# được chia thành nhiều "sọc" khóa theo mã đặt vé.
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TimedLock:
+    """threading.Lock đo thời gian chờ: thử lấy khóa không chờ trước, chỉ khi khóa
+    đang bị giữ mới bấm giờ và báo on_wait(số giây đã chờ)"""
+
+    __slots__ = ('_lock', '_on_wait')
+
+    def __init__(self, on_wait):
+        self._lock = threading.Lock()
+        self._on_wait = on_wait
+
+    def acquire(self):
+        if not self._lock.acquire(blocking=False):
+            started = time.perf_counter()
+            self._lock.acquire()
+            self._on_wait(time.perf_counter() - started)
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+class ServiceLocks:
+    """Sổ khóa theo chuyến ((XE001, '2026-01-31')...) hoặc mã dịch vụ, tạo khóa khi cần.
+
+    on_wait: nếu có, mỗi lượt phải chờ khóa được báo về (đo tranh chấp khóa).
+    """
+
+    def __init__(self, on_wait=None):
+        self._locks = {}
+        self._guard = threading.Lock()
+        self._on_wait = on_wait
+
+    def get(self, service_id):
+        lock = self._locks.get(service_id)
+        if lock is None:
+            with self._guard:
+                lock = self._locks.get(service_id)
+                if lock is None:
+                    lock = self._locks[service_id] = (threading.Lock() if self._on_wait is None
+                                                      else TimedLock(self._on_wait))
+        return lock
+
+    def discard(self, service_ids):
+        """Bỏ khóa không còn dùng tới (các chuyến của ngày đã gỡ khỏi bộ nhớ)"""
+        with self._guard:
+            for service_id in service_ids:
+                self._locks.pop(service_id, None)
+
+    @contextmanager
+    def hold(self, service_ids):
+        """Giữ cùng lúc khóa của nhiều dịch vụ; luôn khóa theo thứ tự mã để tránh deadlock"""
+        locks = [self.get(service_id) for service_id in sorted(set(service_ids))]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+class StripedLock:
+    """Một nhóm khóa cố định, mỗi khóa bảo vệ một phần của bảng băm theo key"""
+
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def get(self, key):
+        return self._locks[hash(key) % len(self._locks)]
@@ -0,0 +1,232 @@
+# Metrics.py
+# Số liệu vận hành của BookingServer: đếm yêu cầu / lỗi theo hành động, histogram độ trễ,
+# số yêu cầu đang xử lý, thời gian chờ khóa, thời gian mã hóa / giải mã, số kết nối.
+# Mỗi lần ghi chỉ là vài phép cộng dưới một khóa nhỏ nên có thể bật thường trực.
+# Có thêm bộ lấy mẫu ngăn xếp (tùy chọn) cho các yêu cầu chạy quá lâu.
+
+import bisect
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+# Cận trên (giây) của các ô histogram, ô cuối chứa mọi giá trị lớn hơn
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+           0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+
+class Histogram:
+    """Histogram với các ô cố định: ghi O(log số ô), không giữ từng giá trị"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        """Ước lượng phân vị: cận trên của ô chứa phân vị đó"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return bound if bound != float('inf') else self.buckets[-2]
+        return self.buckets[-2]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 3),
+            'p99_ms': round(self.quantile(0.99) * 1000, 3)
+        }
+
+
+class Metrics:
+    """Sổ số liệu của một server. actions: các hành động hợp lệ; hành động lạ gộp vào 'other'
+    để số nhãn không tăng theo dữ liệu client gửi lên."""
+
+    def __init__(self, actions):
+        self.actions = frozenset(actions)
+        self.started_at = time.time()
+        self.errors = Counter()
+        self.latency = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections_open = 0
+        self.connections_total = 0
+        self.lock_wait = Histogram()
+        self.decode = Histogram()
+        self.encode = Histogram()
+        self.slow = deque(maxlen=100)
+        self.slow_threshold = 0.1
+        self.profiler = None
+        self._active = {}
+        self._lock = threading.Lock()
+
+    # --- Yêu cầu ---
+    def begin(self, action):
+        """Gọi khi bắt đầu xử lý; trả về token để đưa lại cho finish()"""
+        if not isinstance(action, str) or action not in self.actions:
+            action = 'other'
+        # Yêu cầu lồng nhau (đọc trong batch) chạy trên cùng thread: nhớ yêu cầu ngoài để trả lại
+        ident = threading.get_ident()
+        outer = self._active.get(ident)
+        started = time.perf_counter()
+        self._active[ident] = (action, started)
+        with self._lock:
+            self.in_flight += 1
+            if self.in_flight > self.max_in_flight:
+                self.max_in_flight = self.in_flight
+        return action, started, outer
+
+    def finish(self, token, response):
+        action, started, outer = token
+        elapsed = time.perf_counter() - started
+        if outer is None:
+            del self._active[threading.get_ident()]
+        else:
+            self._active[threading.get_ident()] = outer
+        histogram = self.latency.get(action)
+        if histogram is None:
+            histogram = self.latency.setdefault(action, Histogram())
+        i = bisect.bisect_left(histogram.buckets, elapsed)
+        failed = response is None or response.get('status') == 'error'
+        # Một lần lấy khóa cho cả bộ đếm lẫn histogram của hành động
+        with self._lock:
+            self.in_flight -= 1
+            histogram.counts[i] += 1
+            histogram.count += 1
+            histogram.sum += elapsed
+            if failed:
+                self.errors[action] += 1
+        if elapsed >= self.slow_threshold:
+            self.slow.append({'action': action, 'ms': round(elapsed * 1000, 3),
+                              'at': time.strftime('%Y-%m-%d %H:%M:%S')})
+
+    def lock_waited(self, seconds):
+        """Gọi khi một lượt lấy khóa dịch vụ phải chờ (khóa đang bị giữ)"""
+        self.lock_wait.observe(seconds)
+
+    # --- Kết nối ---
+    def connection_opened(self):
+        with self._lock:
+            self.connections_open += 1
+            self.connections_total += 1
+
+    def connection_closed(self):
+        with self._lock:
+            self.connections_open -= 1
+
+    # --- Trình bày ---
+    def snapshot(self):
+        return {
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'connections_open': self.connections_open,
+            'connections_total': self.connections_total,
+            'actions': {action: dict(self.latency[action].summary(), errors=self.errors[action])
+                        for action in sorted(self.latency)},
+            'lock_wait': self.lock_wait.summary(),
+            'decode': self.decode.summary(),
+            'encode': self.encode.summary(),
+            'slow_requests': list(self.slow),
+            'profile': self.profiler.report() if self.profiler is not None else None
+        }
+
+    def render_text(self, extra=None):
+        """Dạng văn bản từng dòng 'tên{nhãn} giá trị' (kiểu Prometheus) để máy đọc / grep"""
+        lines = [
+            f"booking_uptime_seconds {time.time() - self.started_at:.1f}",
+            f"booking_in_flight {self.in_flight}",
+            f"booking_connections_open {self.connections_open}",
+            f"booking_connections_total {self.connections_total}",
+        ]
+        for action in sorted(self.latency):
+            label = f'action="{action}"'
+            lines.append(f"booking_requests_total{{{label}}} {self.latency[action].count}")
+            lines.append(f"booking_request_errors_total{{{label}}} {self.errors[action]}")
+            lines.extend(_histogram_lines('booking_request_seconds', self.latency[action], label))
+        lines.extend(_histogram_lines('booking_lock_wait_seconds', self.lock_wait))
+        lines.extend(_histogram_lines('booking_decode_seconds', self.decode))
+        lines.extend(_histogram_lines('booking_encode_seconds', self.encode))
+        for name, value in (extra or {}).items():
+            lines.append(f"booking_{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+    # --- Bộ lấy mẫu ---
+    def set_profiling(self, enabled, threshold=None):
+        """Bật / tắt bộ lấy mẫu ngăn xếp của các yêu cầu chạy lâu hơn ngưỡng"""
+        if threshold is not None:
+            self.slow_threshold = threshold
+        if enabled and self.profiler is None:
+            self.profiler = SlowRequestProfiler(self)
+        elif not enabled and self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+
+
+def _histogram_lines(name, histogram, label=''):
+    lines = []
+    cumulative = 0
+    prefix = label + ',' if label else ''
+    for bound, n in zip(histogram.buckets, histogram.counts):
+        cumulative += n
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(f'{name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+    suffix = f'{{{label}}}' if label else ''
+    lines.append(f"{name}_sum{suffix} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{suffix} {histogram.count}")
+    return lines
+
+
+class SlowRequestProfiler:
+    """Thread lấy mẫu: định kỳ xem các yêu cầu đang chạy, yêu cầu nào đã quá ngưỡng
+    slow_threshold thì chụp ngăn xếp của thread xử lý nó. Chỉ tốn chi phí khi bật,
+    và chỉ chụp thread đang chậm nên không làm chậm các yêu cầu bình thường."""
+
+    def __init__(self, metrics, interval=0.005, depth=8):
+        self.metrics = metrics
+        self.interval = interval
+        self.depth = depth
+        self.samples = Counter()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            slow = [(ident, action) for ident, (action, started) in list(self.metrics._active.items())
+                    if now - started >= self.metrics.slow_threshold]
+            if not slow:
+                continue
+            frames = sys._current_frames()
+            for ident, action in slow:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = tuple(f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})"
+                              for entry in traceback.extract_stack(frame, limit=self.depth))
+                self.samples[(action, stack)] += 1
+
+    def report(self, top=10):
+        return [{'action': action, 'samples': n, 'stack': list(stack)}
+                for (action, stack), n in self.samples.most_common(top)]
+
+    def stop(self):
+        self._running = False
@@ -0,0 +1,203 @@
+# Protocol.py
+# Giao thức truyền tin giữa client và server: mỗi thông điệp (JSON, hoặc nhị phân nếu
+# hai bên đã thỏa thuận bằng 'hello', xem Codec.py) được đóng khung bằng 4 byte độ dài
+# (big-endian) ở đầu, đọc tăng dần qua bộ đệm.
+# Chế độ cũ (legacy: JSON thô, không có tiền tố) vẫn được hỗ trợ để client cũ chạy được.
+
+import json
+import socket
+import struct
+from collections import deque
+
+from Codec import CODECS, JSON
+
+FRAMED = 'framed'
+LEGACY = 'legacy'
+
+HEADER = struct.Struct('!I')
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+RECV_SIZE = 65536
+
+
+class ProtocolError(Exception):
+    """Lỗi giao thức: khung quá lớn, kết nối đóng giữa chừng..."""
+
+
+class PreEncoded(dict):
+    """Phản hồi đã được mã hóa sẵn (ví dụ lấy từ cache): vẫn dùng được như dict,
+    nhưng khi gửi đi thì dùng luôn payload thay vì mã hóa lại.
+
+    payload: bản JSON; bản của codec khác được mã hóa ở lần gửi đầu tiên rồi giữ lại.
+    """
+
+    def __init__(self, message, payload):
+        super().__init__(message)
+        self.payload = payload
+        self.payloads = {JSON.name: payload}
+
+    def encoded(self, codec):
+        payload = self.payloads.get(codec.name)
+        if payload is None:
+            payload = self.payloads[codec.name] = codec.encode(dict(self))
+        return payload
+
+
+# --- Mã hóa / giải mã ---
+def encode_message(message, codec=JSON):
+    """dict -> bytes (mặc định JSON UTF-8)"""
+    if isinstance(message, PreEncoded):
+        return message.encoded(codec)
+    return codec.encode(message)
+
+
+def decode_message(payload, codec=JSON):
+    """bytes -> dict, ném ValueError nếu dữ liệu hỏng"""
+    return codec.decode(payload)
+
+
+def pack_frame(payload, mode=FRAMED):
+    """Đóng khung payload đã mã hóa theo chế độ của kết nối"""
+    if mode == LEGACY:
+        return payload
+    if len(payload) > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Thông điệp quá lớn: {len(payload)} bytes")
+    return HEADER.pack(len(payload)) + payload
+
+
+def detect_mode(first_byte):
+    """Khung hợp lệ luôn bắt đầu bằng byte 0 (độ dài < 16MB), JSON thô thì không"""
+    return FRAMED if first_byte == 0 else LEGACY
+
+
+class FrameReader:
+    """Bộ đệm đọc tăng dần: nhận byte thô từ socket, tách ra từng thông điệp hoàn chỉnh.
+
+    mode=None: tự nhận diện chế độ theo byte đầu tiên (dùng phía server).
+    """
+
+    def __init__(self, mode=None):
+        self.mode = mode
+        self.buffer = bytearray()
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, data):
+        if self.mode is None and data:
+            self.mode = detect_mode(data[0])
+        self.buffer += data
+
+    def messages(self):
+        """Sinh ra payload (bytes) của các thông điệp đã nhận đủ.
+
+        Ở chế độ legacy, payload hỏng được trả về nguyên dạng để phía gọi
+        báo lỗi "Dữ liệu không hợp lệ" như trước.
+        """
+        if self.mode == LEGACY:
+            yield from self._legacy_messages()
+            return
+
+        buffer = self.buffer
+        offset = 0
+        while len(buffer) - offset >= HEADER.size:
+            (length,) = HEADER.unpack_from(buffer, offset)
+            if length > MAX_MESSAGE_SIZE:
+                raise ProtocolError(f"Khung quá lớn: {length} bytes")
+            end = offset + HEADER.size + length
+            if len(buffer) < end:
+                break
+            yield bytes(buffer[offset + HEADER.size:end])
+            offset = end
+        if offset:
+            del buffer[:offset]
+
+    def _legacy_messages(self):
+        # Các object JSON có thể bị dính liền nhau hoặc bị cắt ngang giữa 2 lần recv
+        try:
+            text = self.buffer.decode('utf-8')
+        except UnicodeDecodeError as e:
+            if e.start >= len(self.buffer) - 3:
+                return  # ký tự nhiều byte bị cắt ở cuối, chờ thêm dữ liệu
+            payload = bytes(self.buffer)
+            self.buffer.clear()
+            yield payload
+            return
+
+        pos = 0
+        while True:
+            while pos < len(text) and text[pos].isspace():
+                pos += 1
+            if pos >= len(text):
+                break
+            try:
+                _, end = self._decoder.raw_decode(text, pos)
+            except json.JSONDecodeError as e:
+                if e.pos >= len(text):
+                    break  # chưa nhận đủ, chờ thêm
+                yield text[pos:].encode('utf-8')
+                pos = len(text)
+                break
+            yield text[pos:end].encode('utf-8')
+            pos = end
+
+        if pos:
+            del self.buffer[:len(text[:pos].encode('utf-8'))]
+
+
+class Connection:
+    """Một kết nối tới server. Hỗ trợ gửi nhiều yêu cầu liên tiếp (pipelining)
+    trên cùng socket; server trả lời theo đúng thứ tự nhận."""
+
+    def __init__(self, sock, mode=FRAMED):
+        self.socket = sock
+        self.mode = mode
+        self.codec = JSON
+        self.reader = FrameReader(mode)
+        self._pending = deque()
+
+    @classmethod
+    def open(cls, host, port, mode=FRAMED, timeout=None, codec=None):
+        """codec: tên codec muốn dùng thay JSON (thỏa thuận ngay khi kết nối)"""
+        sock = socket.create_connection((host, port), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = cls(sock, mode)
+        if codec is not None and codec != JSON.name:
+            try:
+                conn.negotiate([codec, JSON.name])
+            except BaseException:
+                conn.close()
+                raise
+        return conn
+
+    def negotiate(self, codecs):
+        """Gửi 'hello' đề nghị các codec (theo thứ tự ưu tiên) và chờ server chọn;
+        server cũ không hiểu 'hello' thì tiếp tục dùng JSON. Trả về tên codec đang dùng."""
+        response = self.request({'action': 'hello', 'codecs': list(codecs)})
+        if response.get('status') == 'success' and response.get('codec') in CODECS:
+            self.codec = CODECS[response['codec']]
+        return self.codec.name
+
+    def send(self, requests):
+        """Gửi một loạt yêu cầu trong một lần ghi"""
+        codec = self.codec
+        self.socket.sendall(b''.join(pack_frame(encode_message(r, codec), self.mode) for r in requests))
+
+    def receive(self):
+        """Đọc đúng một thông điệp trả về"""
+        while not self._pending:
+            data = self.socket.recv(RECV_SIZE)
+            if not data:
+                raise ProtocolError("Server đã đóng kết nối")
+            self.reader.feed(data)
+            self._pending.extend(self.reader.messages())
+        return decode_message(self._pending.popleft(), self.codec)
+
+    def request(self, request):
+        self.send([request])
+        return self.receive()
+
+    def pipeline(self, requests):
+        """Gửi tất cả yêu cầu rồi mới đọc lần lượt các phản hồi"""
+        self.send(requests)
+        return [self.receive() for _ in requests]
+
+    def close(self):
+        self.socket.close()
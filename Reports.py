@@ -0,0 +1,148 @@
+# Reports.py
+# Báo cáo doanh thu cộng dồn: mỗi lượt đặt / hủy vé cộng vào vài bộ đếm (theo dịch vụ,
+# theo loại, theo giờ và loại, tổng) ngay lúc xảy ra, nên đọc báo cáo không phải duyệt bảng booking.
+# Mỗi lượt ghi tốn một lần lấy khóa và bốn bộ đếm, bất kể có bao nhiêu booking.
+
+import threading
+import time
+
+DEFAULT_HOURS = 24
+MAX_HOURS = 24 * 31
+
+
+class Tally:
+    """Bộ đếm của một nhóm: vé bán ra và tiền hoàn do hủy vé"""
+
+    __slots__ = ('bookings', 'seats', 'revenue', 'cancellations', 'refunded_seats', 'refunds')
+
+    def __init__(self):
+        self.bookings = 0
+        self.seats = 0
+        self.revenue = 0
+        self.cancellations = 0
+        self.refunded_seats = 0
+        self.refunds = 0
+
+    def add(self, other):
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def to_dict(self):
+        return {
+            'bookings': self.bookings,
+            'seats': self.seats,
+            'revenue': self.revenue,
+            'cancellations': self.cancellations,
+            'refunded_seats': self.refunded_seats,
+            'refunds': self.refunds,
+            'net_revenue': self.revenue - self.refunds
+        }
+
+
+def hour_bucket(epoch):
+    """Giây epoch -> ô giờ 'YYYY-MM-DD HH' (so chuỗi đúng bằng so thời gian)"""
+    return time.strftime('%Y-%m-%d %H', time.localtime(epoch))
+
+
+class SalesReport:
+    """Bộ đếm doanh thu của một server.
+
+    Chỉ giữ MAX_HOURS ô giờ gần nhất; tổng theo dịch vụ / loại không bị cắt.
+    Mỗi ô giờ đếm riêng từng loại để báo cáo lọc theo loại vẫn đúng theo giờ.
+    """
+
+    def __init__(self):
+        self.totals = Tally()
+        self.by_type = {}
+        self.by_service = {}
+        self.by_hour = {}
+        self._lock = threading.Lock()
+
+    def _tallies(self, kind, service_id, bucket):
+        """Bốn bộ đếm một lượt ghi phải cập nhật (phía gọi giữ khóa)"""
+        by_type = self.by_type.get(kind)
+        if by_type is None:
+            by_type = self.by_type[kind] = Tally()
+        by_service = self.by_service.get(service_id)
+        if by_service is None:
+            by_service = self.by_service[service_id] = (kind, Tally())
+        by_hour = self.by_hour.get(bucket)
+        if by_hour is None:
+            by_hour = self.by_hour[bucket] = {}
+            if len(self.by_hour) > MAX_HOURS:
+                del self.by_hour[min(self.by_hour)]  # mỗi giờ một lần
+        hour = by_hour.get(kind)
+        if hour is None:
+            hour = by_hour[kind] = Tally()
+        return self.totals, by_type, by_service[1], hour
+
+    def sale(self, booking):
+        """Gọi khi một booking được tạo (hoặc nạp lại lúc khởi động)"""
+        seats = len(booking.seats)
+        amount = booking.total_price
+        with self._lock:
+            for tally in self._tallies(booking.type, booking.service_id, hour_bucket(booking.booked_at)):
+                tally.bookings += 1
+                tally.seats += seats
+                tally.revenue += amount
+
+    def refund(self, booking):
+        """Gọi khi booking bị hủy; tiền hoàn tính vào giờ hủy"""
+        seats = len(booking.seats)
+        amount = booking.total_price
+        bucket = hour_bucket(time.time())
+        with self._lock:
+            for tally in self._tallies(booking.type, booking.service_id, bucket):
+                tally.cancellations += 1
+                tally.refunded_seats += seats
+                tally.refunds += amount
+
+    def report(self, kind=None, service_id=None, hours=DEFAULT_HOURS):
+        """Báo cáo: tổng, theo loại, theo dịch vụ và `hours` ô giờ gần nhất. kind lọc mọi phần,
+        service_id chỉ lọc phần theo dịch vụ. Chi phí theo số dịch vụ / số ô giờ, không theo số booking."""
+        with self._lock:
+            if service_id is not None:
+                entry = self.by_service.get(service_id)
+                services = {service_id: entry} if entry is not None else {}
+            else:
+                services = self.by_service
+            by_service = {sid: dict(tally.to_dict(), type=skind) for sid, (skind, tally) in services.items()
+                          if kind is None or skind == kind}
+            totals = self.totals if kind is None else self.by_type.get(kind, Tally())
+            buckets = sorted(bucket for bucket, tallies in self.by_hour.items() if kind is None or kind in tallies)
+            return {
+                'totals': totals.to_dict(),
+                'by_type': {name: tally.to_dict() for name, tally in self.by_type.items()
+                            if kind is None or name == kind},
+                'by_service': by_service,
+                'by_hour': {bucket: _hour_total(self.by_hour[bucket], kind).to_dict()
+                            for bucket in buckets[-hours:]}
+            }
+
+
+def _hour_total(tallies, kind):
+    """Bộ đếm của một ô giờ: của một loại, hoặc cộng mọi loại"""
+    if kind is not None:
+        return tallies[kind]
+    total = Tally()
+    for tally in tallies.values():
+        total.add(tally)
+    return total
+
+
+def merge_reports(reports):
+    """Gộp báo cáo của nhiều server (cụm nhiều worker): cộng các bộ đếm cùng khóa"""
+    def add(target, source):
+        for key, value in source.items():
+            if isinstance(value, dict):
+                add(target.setdefault(key, {}), value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                target[key] = target.get(key, 0) + value
+            else:
+                target[key] = value
+        return target
+
+    merged = {}
+    for report in reports:
+        add(merged, report)
+    return merged
@@ -0,0 +1,191 @@
+# Search.py
+# Tìm kiếm danh mục xe / phim bằng chỉ mục trong bộ nhớ thay vì duyệt cả danh sách:
+#   - chỉ mục từ cho các trường chữ (tuyến, tên phim, rạp): mỗi từ khớp theo tiền tố,
+#     không phân biệt hoa thường và dấu ("ha noi" khớp "Hà Nội")
+#   - chỉ mục sắp xếp cho giờ khởi hành / giờ chiếu / giá: lọc khoảng bằng bisect,
+#     trả kết quả theo thứ tự đó và phân trang
+# Danh mục cố định sau khi khởi động (chỉ số ghế thay đổi) nên chỉ mục dựng một lần;
+# số ghế trống được đọc lúc tìm.
+
+import bisect
+import re
+import unicodedata
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_CACHED_PREFIXES = 1024
+
+_WORD = re.compile(r'\w+')
+
+
+def fold(text):
+    """Chữ thường, bỏ dấu tiếng Việt: 'Hà Nội' -> 'ha noi'"""
+    text = unicodedata.normalize('NFD', text.replace('đ', 'd').replace('Đ', 'D'))
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    return _WORD.findall(fold(text))
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class TokenIndex:
+    """Từ (đã bỏ dấu) -> tập mã dịch vụ, cùng danh sách từ đã sắp xếp để tìm theo tiền tố"""
+
+    def __init__(self, services, field):
+        self.postings = {}
+        for service_id, service in services.items():
+            for token in set(tokenize(str(service[field]))):
+                self.postings.setdefault(token, set()).add(service_id)
+        self.postings = {token: frozenset(ids) for token, ids in self.postings.items()}
+        self.tokens = sorted(self.postings)
+        self._prefixes = {}
+
+    def prefix(self, prefix):
+        """Mã dịch vụ có ít nhất một từ bắt đầu bằng prefix"""
+        ids = self._prefixes.get(prefix)
+        if ids is None:
+            i = bisect.bisect_left(self.tokens, prefix)
+            end = bisect.bisect_left(self.tokens, prefix + '\U0010ffff', i)
+            ids = frozenset().union(*[self.postings[token] for token in self.tokens[i:end]])
+            if len(self._prefixes) < MAX_CACHED_PREFIXES:
+                self._prefixes[prefix] = ids
+        return ids
+
+
+class SortedIndex:
+    """(giá trị, mã) đã sắp xếp theo một trường: lọc khoảng và duyệt theo thứ tự"""
+
+    def __init__(self, services, field):
+        entries = sorted((service[field], service_id) for service_id, service in services.items())
+        self.keys = [value for value, _ in entries]
+        self.ids = [service_id for _, service_id in entries]
+        self.values = {service_id: value for value, service_id in entries}
+        self.rank = {service_id: i for i, service_id in enumerate(self.ids)}
+
+    def bounds(self, low, high):
+        start = 0 if low is None else bisect.bisect_left(self.keys, low)
+        end = len(self.keys) if high is None else bisect.bisect_right(self.keys, high)
+        return start, max(start, end)
+
+
+class CatalogIndex:
+    """Chỉ mục tìm kiếm của một danh mục.
+
+    services: dict mã -> dịch vụ (có các trường cần đánh chỉ mục);
+    text_fields: trường tìm theo từ; range_fields: trường lọc khoảng / sắp xếp.
+    """
+
+    def __init__(self, services, text_fields, range_fields):
+        self.text = {field: TokenIndex(services, field) for field in text_fields}
+        self.ranges = {field: SortedIndex(services, field) for field in range_fields}
+        self.ranges['id'] = SortedIndex({service_id: {'id': service_id} for service_id in services}, 'id')
+
+    def search(self, params, available, describe):
+        """params: yêu cầu 'search' của client; available(mã) -> số ghế trống;
+        describe(mã) -> dict trả cho client. Trả về phản hồi (kể cả lỗi tham số)."""
+        offset = params.get('offset', 0)
+        limit = params.get('limit', DEFAULT_LIMIT)
+        min_available = params.get('min_available')
+        sort = params.get('sort') or 'id'
+        if not _is_int(offset) or offset < 0:
+            return _error("offset phải là số nguyên không âm")
+        if not _is_int(limit) or not 1 <= limit <= MAX_LIMIT:
+            return _error(f"limit phải từ 1 tới {MAX_LIMIT}")
+        if min_available is not None and not _is_int(min_available):
+            return _error("min_available phải là số nguyên")
+        if not isinstance(sort, str) or sort.lstrip('-') not in self.ranges:
+            return _error(f"Chỉ sắp xếp được theo: {', '.join(sorted(self.ranges))}")
+        descending = sort.startswith('-')
+        order = self.ranges[sort.lstrip('-')]
+
+        # Lọc từ tập nhỏ nhất: mỗi điều kiện thu hẹp tập ứng viên (None: chưa lọc gì)
+        candidates = None
+        query = params.get('q')
+        if query is not None:
+            if not isinstance(query, str):
+                return _error("q phải là chuỗi")
+            for token in tokenize(query):
+                matches = [index.prefix(token) for index in self.text.values()]
+                ids = matches[0] if len(matches) == 1 else frozenset().union(*matches)
+                candidates = ids if candidates is None else candidates & ids
+        for field, index in self.text.items():
+            value = params.get(field)
+            if value is None:
+                continue
+            if not isinstance(value, str):
+                return _error(f"{field} phải là chuỗi")
+            for token in tokenize(value):
+                ids = index.prefix(token)
+                candidates = ids if candidates is None else candidates & ids
+
+        for field, index in self.ranges.items():
+            bounds = params.get(field)
+            if bounds is None or field == 'id':
+                continue
+            error = _check_bounds(field, bounds, index.keys)
+            if error is not None:
+                return error
+            low, high = bounds
+            start, end = index.bounds(low, high)
+            if candidates is None:
+                candidates = frozenset(index.ids[start:end])
+            elif len(candidates) < end - start:
+                values = index.values
+                candidates = frozenset(service_id for service_id in candidates
+                                       if (low is None or values[service_id] >= low)
+                                       and (high is None or values[service_id] <= high))
+            else:
+                candidates = candidates.intersection(index.ids[start:end])
+
+        filter_seats = min_available is not None and min_available > 0
+        if candidates is None and not filter_seats:
+            # Không lọc gì: cắt trang thẳng từ chỉ mục, không duyệt cả danh mục
+            total = len(order.ids)
+            if descending:
+                page = order.ids[max(0, total - offset - limit):max(0, total - offset)][::-1]
+            else:
+                page = order.ids[offset:offset + limit]
+        elif candidates is None:
+            ordered = [service_id for service_id in (reversed(order.ids) if descending else order.ids)
+                       if available(service_id) >= min_available]
+            total = len(ordered)
+            page = ordered[offset:offset + limit]
+        else:
+            if filter_seats:
+                candidates = [service_id for service_id in candidates if available(service_id) >= min_available]
+            total = len(candidates)
+            # Sắp xếp thứ hạng (số nguyên) thay vì so giá trị của từng mục
+            ranks = sorted(map(order.rank.__getitem__, candidates), reverse=descending)
+            page = [order.ids[rank] for rank in ranks[offset:offset + limit]]
+
+        return {
+            "status": "success",
+            "data": [describe(service_id) for service_id in page],
+            "total": total,
+            "offset": offset,
+            "limit": limit
+        }
+
+
+def _check_bounds(field, bounds, keys):
+    """bounds: [từ, đến], mỗi đầu có thể là null; phải cùng kiểu với giá trị của trường"""
+    if not isinstance(bounds, list) or len(bounds) != 2:
+        return _error(f"{field} phải có dạng [từ, đến]")
+    if keys:
+        sample = keys[0]
+        for value in bounds:
+            if value is None:
+                continue
+            if isinstance(sample, str) and not isinstance(value, str):
+                return _error(f"{field} phải là chuỗi, ví dụ [\"06:00\", \"12:00\"]")
+            if not isinstance(sample, str) and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                return _error(f"{field} phải là số")
+    return None
+
+
+def _error(message):
+    return {"status": "error", "message": message}
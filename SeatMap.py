@@ -0,0 +1,236 @@
+# SeatMap.py
+# Sơ đồ ghế gọn nhẹ cho một xe / suất chiếu: mỗi ghế là 1 byte trạng thái trong
+# bytearray, đếm ghế trống O(1) và tìm ghế trống thấp nhất bằng bytearray.find (chạy ở C).
+# Sân vận động 50.000 chỗ chỉ tốn ~50KB.
+
+FREE = 0
+BOOKED = 1
+HELD = 2  # đang giữ chỗ chờ thanh toán: không trống nhưng chưa bán
+
+_FREE_BYTE = bytes([FREE])
+
+
+def row_label(row):
+    """0 -> A, 25 -> Z, 26 -> AA... (giống tên cột bảng tính)"""
+    label = ''
+    row += 1
+    while row:
+        row, rem = divmod(row - 1, 26)
+        label = chr(65 + rem) + label
+    return label
+
+
+def row_index(label):
+    """Ngược lại với row_label: A -> 0, AA -> 26"""
+    row = 0
+    for ch in label:
+        row = row * 26 + (ord(ch) - 64)
+    return row - 1
+
+
+class SeatMap:
+    """Sơ đồ ghế đánh số từ 1 (xe khách) hoặc theo hàng/cột A1, A2... (rạp phim).
+
+    seats_per_row=None: nhãn là số ghế (int); ngược lại nhãn là 'hàng + cột'.
+    Không tự khóa: phía gọi giữ khóa của dịch vụ khi thay đổi.
+    """
+
+    __slots__ = ('total', 'seats_per_row', 'free_count', '_state', '_hint')
+
+    def __init__(self, total_seats, seats_per_row=None):
+        self.total = total_seats
+        self.seats_per_row = seats_per_row
+        self.free_count = total_seats
+        self._state = bytearray(total_seats)
+        self._hint = 0  # mọi ghế có chỉ số < _hint đều đã có người
+
+    # --- Nhãn ghế ---
+    def label(self, index):
+        if self.seats_per_row is None:
+            return index + 1
+        row, col = divmod(index, self.seats_per_row)
+        return f"{row_label(row)}{col + 1}"
+
+    def index_of(self, label):
+        """Nhãn -> chỉ số ghế, ném ValueError nếu nhãn không thuộc sơ đồ"""
+        if self.seats_per_row is None:
+            index = int(label) - 1
+        else:
+            split = len(label.rstrip('0123456789'))
+            if not 0 < split < len(label):
+                raise ValueError(f"Nhãn ghế không hợp lệ: {label}")
+            col = int(label[split:]) - 1
+            if not 0 <= col < self.seats_per_row:
+                raise ValueError(f"Nhãn ghế không hợp lệ: {label}")
+            index = row_index(label[:split]) * self.seats_per_row + col
+        if not 0 <= index < self.total:
+            raise ValueError(f"Nhãn ghế không hợp lệ: {label}")
+        return index
+
+    def labels(self, indices):
+        return [self.label(i) for i in indices]
+
+    # --- Trạng thái ---
+    def is_free(self, index):
+        return self._state[index] == FREE
+
+    def lowest_free(self):
+        """Chỉ số ghế trống thấp nhất, -1 nếu đã hết chỗ"""
+        if not self.free_count:
+            return -1
+        index = self._state.find(_FREE_BYTE, self._hint)
+        self._hint = index
+        return index
+
+    def allocate(self, count, state=BOOKED):
+        """Lấy `count` ghế trống thấp nhất; trả về None (không đổi gì) nếu không đủ chỗ"""
+        if count > self.free_count:
+            return None
+        seats = self._state
+        indices = []
+        index = self._hint
+        for _ in range(count):
+            index = seats.find(_FREE_BYTE, index)
+            seats[index] = state
+            indices.append(index)
+        self.free_count -= count
+        self._hint = index + 1 if count else self._hint
+        return indices
+
+    def take(self, indices, state=BOOKED):
+        """Đánh dấu các ghế cụ thể (ví dụ khi nạp lại dữ liệu); False nếu có ghế đã bị chiếm"""
+        indices = set(indices)
+        if any(self._state[i] != FREE for i in indices):
+            return False
+        for i in indices:
+            self._state[i] = state
+        self.free_count -= len(indices)
+        return True
+
+    def confirm(self, indices):
+        """Chuyển các ghế đang giữ chỗ thành đã bán (số ghế trống không đổi)"""
+        for i in indices:
+            self._state[i] = BOOKED
+
+    def release(self, indices):
+        """Trả lại ghế; bỏ qua ghế vốn đang trống"""
+        state = self._state
+        for i in indices:
+            if state[i] != FREE:
+                state[i] = FREE
+                self.free_count += 1
+                if i < self._hint:
+                    self._hint = i
+
+
+# Mọi trạng thái khác FREE đều coi là "có người" khi tìm dãy ghế trống
+_OCCUPIED = bytes([0] + [1] * 255)
+
+
+class SeatGrid(SeatMap):
+    """Sơ đồ ghế theo hàng (rạp phim) ưu tiên xếp nhóm ngồi liền nhau.
+
+    Chỉ mục dãy trống: mỗi hàng lưu độ dài dãy ghế trống dài nhất, và một cây phân đoạn
+    (max) trên các hàng. Tìm hàng đầu tiên có đủ N ghế liền nhau tốn O(log số hàng),
+    sau đó tìm vị trí trong hàng bằng bytearray.find (chạy ở C).
+    """
+
+    __slots__ = ('rows', '_size', '_tree')
+
+    def __init__(self, total_seats, seats_per_row):
+        super().__init__(total_seats, seats_per_row)
+        self.rows = -(-total_seats // seats_per_row)
+        size = 1
+        while size < self.rows:
+            size *= 2
+        self._size = size
+        self._tree = [0] * (2 * size)
+        for row in range(self.rows):
+            start, end = self._row_bounds(row)
+            self._tree[size + row] = end - start
+        for i in range(size - 1, 0, -1):
+            self._tree[i] = max(self._tree[2 * i], self._tree[2 * i + 1])
+
+    def _row_bounds(self, row):
+        start = row * self.seats_per_row
+        return start, min(start + self.seats_per_row, self.total)
+
+    def _runs(self, row):
+        """Các dãy ghế trống trong hàng: danh sách (độ dài, chỉ số ghế đầu)"""
+        start, end = self._row_bounds(row)
+        runs = []
+        pos = start
+        for piece in self._state[start:end].translate(_OCCUPIED).split(b'\x01'):
+            if piece:
+                runs.append((len(piece), pos))
+            pos += len(piece) + 1
+        return runs
+
+    def _update_rows(self, indices):
+        tree = self._tree
+        for row in {i // self.seats_per_row for i in indices}:
+            i = self._size + row
+            tree[i] = max((length for length, _ in self._runs(row)), default=0)
+            i //= 2
+            while i:
+                tree[i] = max(tree[2 * i], tree[2 * i + 1])
+                i //= 2
+
+    def longest_run(self):
+        """Số ghế liền nhau nhiều nhất còn trống trong một hàng"""
+        return self._tree[1]
+
+    def find_block(self, count):
+        """Chỉ số ghế đầu của dãy `count` ghế trống liền nhau ở hàng thấp nhất có thể, -1 nếu không có"""
+        tree = self._tree
+        if count <= 0 or tree[1] < count:
+            return -1
+        i = 1
+        while i < self._size:
+            i = 2 * i if tree[2 * i] >= count else 2 * i + 1
+        start, end = self._row_bounds(i - self._size)
+        return self._state.find(bytes(count), start, end)
+
+    def allocate(self, count, state=BOOKED):
+        """Ưu tiên `count` ghế liền nhau trong cùng hàng; nếu không có thì lấy các dãy trống
+        dài nhất trước để nhóm bị chia thành ít phần nhất"""
+        if count > self.free_count:
+            return None
+        seats = self._state
+        first = self.find_block(count)
+        if first >= 0:
+            indices = list(range(first, first + count))
+            for index in indices:
+                seats[index] = state
+            self._update_rows(indices)
+        else:
+            indices = []
+            while len(indices) < count:
+                length, begin = max(self._runs(self._widest_row()), key=lambda run: (run[0], -run[1]))
+                block = range(begin, begin + min(length, count - len(indices)))
+                for index in block:
+                    seats[index] = state
+                self._update_rows(block)
+                indices.extend(block)
+        self.free_count -= count
+        return indices
+
+    def _widest_row(self):
+        """Hàng có dãy trống dài nhất (đi xuống cây theo nhánh giữ giá trị max)"""
+        tree = self._tree
+        i = 1
+        while i < self._size:
+            i = 2 * i if tree[2 * i] == tree[i] else 2 * i + 1
+        return i - self._size
+
+    def take(self, indices, state=BOOKED):
+        indices = set(indices)
+        if not super().take(indices, state):
+            return False
+        self._update_rows(indices)
+        return True
+
+    def release(self, indices):
+        indices = list(indices)
+        super().release(indices)
+        self._update_rows(indices)
@@ -1,15 +1,139 @@
-﻿import socket
+﻿import argparse
+import socket
+import sqlite3
 import threading
-import json
-import datetime
-import uuid
+import time
+
+from Admission import AdmissionControl, WorkQueue, parse_rate
+from AsyncServer import AsyncBookingServer
+from Bookings import Booking
+from Cache import CatalogCache
+from Codec import CODECS, JSON, negotiate
+from Database import BookingStore
+from Holds import ExpiryScheduler
+from Idempotency import MAX_KEY_LENGTH, IdempotencyCache
+from Ids import IdGenerator, normalize_id
+from Inventory import DEFAULT_HORIZON_DAYS, DEFAULT_RETENTION_DAYS, Inventory, booking_date
+from Journal import BookingJournal
+from Locks import ServiceLocks, StripedLock
+from Metrics import Metrics
+from Protocol import (FRAMED, LEGACY, RECV_SIZE, FrameReader, ProtocolError,
+                      decode_message, encode_message, pack_frame)
+from Reports import DEFAULT_HOURS, MAX_HOURS, SalesReport
+from Search import CatalogIndex
+from SeatMap import HELD, SeatGrid, SeatMap
+from Subscriptions import AvailabilityHub, SocketChannel
+from Utils import log_event
+
+MOVIE_SEATS_PER_ROW = 10
+MAX_BATCH_SIZE = 1000
+
+BOOK_ACTIONS = {'book_bus': 'bus', 'book_movie': 'movie'}
+HOLD_ACTIONS = {'hold_bus': 'bus', 'hold_movie': 'movie'}
+DEFAULT_HOLD_TTL = 300
+MAX_HOLD_TTL = 1800
+SERVICE_KEYS = {'bus': 'bus_id', 'movie': 'movie_id'}
+BOOKED_MESSAGES = {'bus': "Đặt vé xe thành công!", 'movie': "Đặt vé phim thành công!"}
+# Lỗi ghi của store (SQLite / nhật ký): yêu cầu được trả lỗi, bộ nhớ giữ nguyên như trước yêu cầu
+STORE_ERRORS = (sqlite3.Error, OSError)
+STORE_FAILED = {"status": "error", "message": "Không lưu được dữ liệu, vui lòng thử lại", "retryable": True}
+# Yêu cầu ghi: chống xử lý trùng khi client gửi kèm idempotency_key, và được ưu tiên khi quá tải
+WRITE_ACTIONS = frozenset(['book_bus', 'book_movie', 'cancel_booking', 'hold_bus', 'hold_movie',
+                           'confirm_hold', 'release_hold', 'batch'])
+# Mọi hành động process_request hiểu (để đếm số liệu theo từng hành động)
+ACTIONS = ('get_buses', 'get_movies', 'book_bus', 'book_movie', 'get_bookings', 'cancel_booking',
+           'hold_bus', 'hold_movie', 'confirm_hold', 'release_hold', 'batch', 'stats', 'search', 'report')
+# Đăng ký nhận tin đẩy gắn với kết nối nên được xử lý ngoài process_request
+SUBSCRIPTION_ACTIONS = ('subscribe', 'unsubscribe')
+# Chọn codec cho kết nối, cũng xử lý ngoài process_request
+HELLO_ACTION = 'hello'
+# Yêu cầu chỉ đọc được phép nằm trong batch (chạy sau khi các lượt đặt / hủy đã áp dụng)
+BATCH_READ_ACTIONS = ('get_buses', 'get_movies', 'get_bookings', 'search')
+# Tìm kiếm: (trường tìm theo từ, trường lọc khoảng / sắp xếp) của từng loại dịch vụ
+SEARCH_FIELDS = {'bus': (('route',), ('departure', 'price')),
+                 'movie': (('title', 'cinema'), ('showtime', 'price'))}
+
+
+def is_valid_seat_count(num_seats):
+    return isinstance(num_seats, int) and not isinstance(num_seats, bool) and num_seats > 0
+
+
+def make_seat_map(kind, service):
+    """Sơ đồ ghế trống của một chuyến: xe đánh số 1, 2, 3...; rạp phim 10 ghế mỗi hàng (A1..A10, B1...),
+    nhóm đặt vé phim được xếp ngồi liền nhau trong cùng hàng nếu còn chỗ"""
+    if kind == 'bus':
+        return SeatMap(service['total_seats'])
+    return SeatGrid(service['total_seats'], MOVIE_SEATS_PER_ROW)
+
+
+def describe_bus(bus, available_seats):
+    """Thông tin xe trả cho client (số ghế trống của chuyến trong ngày được hỏi)"""
+    return {
+        'id': bus['id'],
+        'route': bus['route'],
+        'departure': bus['departure'],
+        'arrival': bus['arrival'],
+        'price': bus['price'],
+        'available_seats': available_seats,
+        'total_seats': bus['total_seats']
+    }
+
+
+def describe_movie(movie, available_seats):
+    """Thông tin phim trả cho client (số ghế trống của suất chiếu trong ngày được hỏi)"""
+    return {
+        'id': movie['id'],
+        'title': movie['title'],
+        'showtime': movie['showtime'],
+        'duration': movie['duration'],
+        'cinema': movie['cinema'],
+        'price': movie['price'],
+        'available_seats': available_seats,
+        'total_seats': movie['total_seats']
+    }
+
+
+DESCRIBE = {'bus': describe_bus, 'movie': describe_movie}
+
+
+def service_name(kind, service):
+    """Tên dịch vụ ghi trong booking: tuyến xe, hoặc 'tên phim - giờ chiếu'"""
+    if kind == 'bus':
+        return service['route']
+    return f"{service['title']} - {service['showtime']}"
+
+
+def request_phone(request):
+    """Số điện thoại khách trong yêu cầu (để giới hạn tốc độ theo khách), nếu có"""
+    customer = request.get('customer')
+    if isinstance(customer, dict):
+        return customer.get('phone')
+    return request.get('customer_phone')
+
+def _lookup_id(value):
+    """Mã đặt vé / giữ chỗ khách gửi lên, đã chuẩn hóa (khách có thể gõ chữ thường, O thay 0...);
+    None nếu không phải chuỗi (ví dụ {} hay [] không dùng làm khóa tra được)"""
+    return normalize_id(value) if isinstance(value, str) else None
+
 
 class BookingServer:
-    def __init__(self, host='localhost', port=9999):
+    def __init__(self, host='localhost', port=9999, backlog=128, store=None, shard=0,
+                 max_connections=10000, workers=32, max_pending=1024, address_limit=None, phone_limit=None,
+                 horizon_days=DEFAULT_HORIZON_DAYS, retention_days=DEFAULT_RETENTION_DAYS):
         self.host = host
         self.port = port
+        self.backlog = backlog
+        self.store = store
+        self.ids = IdGenerator(shard)
         self.clients = []
         
+        # Kiểm soát tải: số kết nối tối đa, giới hạn tốc độ, hàng đợi công việc (tạo khi chạy server)
+        self.max_connections = max_connections
+        self.workers = workers
+        self.max_pending = max_pending
+        self.admission = AdmissionControl(address_limit, phone_limit)
+        self.work_queue = None
+        
         self.buses = {
             'XE001': {
                 'id': 'XE001',
@@ -17,8 +141,7 @@ class BookingServer:
                 'departure': '08:00',
                 'arrival': '10:30',
                 'price': 120000,
-                'total_seats': 40,
-                'booked_seats': []
+                'total_seats': 40
             },
             'XE002': {
                 'id': 'XE002',
@@ -26,8 +149,7 @@ class BookingServer:
                 'departure': '06:00',
                 'arrival': '12:00',
                 'price': 200000,
-                'total_seats': 35,
-                'booked_seats': []
+                'total_seats': 35
             },
             'XE003': {
                 'id': 'XE003',
@@ -35,8 +157,7 @@ class BookingServer:
                 'departure': '22:00',
                 'arrival': '06:00+1',
                 'price': 300000,
-                'total_seats': 30,
-                'booked_seats': []
+                'total_seats': 30
             }
         }
         
@@ -48,8 +169,7 @@ class BookingServer:
                 'duration': '181 phút',
                 'price': 80000,
                 'cinema': 'CGV Vincom',
-                'total_seats': 100,
-                'booked_seats': []
+                'total_seats': 100
             },
             'PHIM002': {
                 'id': 'PHIM002',
@@ -58,8 +178,7 @@ class BookingServer:
                 'duration': '148 phút',
                 'price': 75000,
                 'cinema': 'Lotte Cinema',
-                'total_seats': 80,
-                'booked_seats': []
+                'total_seats': 80
             },
             'PHIM003': {
                 'id': 'PHIM003',
@@ -68,12 +187,57 @@ class BookingServer:
                 'duration': '142 phút',
                 'price': 85000,
                 'cinema': 'Galaxy Cinema',
-                'total_seats': 90,
-                'booked_seats': []
+                'total_seats': 90
             }
         }
         
+        if store is not None:
+            # DB là nguồn dữ liệu chính: ghi danh mục mặc định nếu DB còn trống rồi nạp lại từ DB
+            store.seed_catalog(self.buses, self.movies)
+            self.buses, self.movies = store.load_catalog()
+        
+        # Xe / phim trong danh mục chạy lặp lại mỗi ngày; mỗi ngày chạy là một chuyến có sơ đồ ghế
+        # riêng, chia theo ngày để ngày đã qua được gỡ khỏi bộ nhớ nguyên khối
+        self.inventory = Inventory({'bus': self.buses, 'movie': self.movies}, make_seat_map,
+                                   horizon_days, retention_days, on_evict=self._evict_day)
+        
         self.bookings = {}
+        
+        # Số liệu vận hành (bật thường trực): độ trễ theo hành động, chờ khóa, kết nối...
+        self.metrics = Metrics(ACTIONS)
+        
+        # Mỗi chuyến (mã dịch vụ, ngày) một khóa riêng, bảng booking chia sọc khóa theo mã đặt vé
+        self.service_locks = ServiceLocks(on_wait=self.metrics.lock_waited)
+        self.booking_locks = StripedLock()
+        
+        # Chỉ mục phụ: số điện thoại -> các mã đặt vé (dict giữ thứ tự đặt)
+        self.bookings_by_phone = {}
+        self.phone_locks = StripedLock()
+        
+        # Mã đặt vé đang hủy (chờ store ghi xong); đọc / ghi khi giữ khóa chuyến của booking
+        self.cancelling = set()
+        
+        # Giữ chỗ chờ thanh toán: mã giữ chỗ -> thông tin; hết hạn do một bộ hẹn giờ dùng heap
+        self.holds = {}
+        self.hold_expiry = ExpiryScheduler(self._expire_hold)
+        
+        # Doanh thu cộng dồn theo dịch vụ / loại / giờ, cập nhật ngay trong mỗi lượt đặt / hủy vé
+        self.report = SalesReport()
+        
+        # Phản hồi gần đây theo idempotency_key: client gửi lại sau timeout không bị đặt trùng
+        self.idempotency = IdempotencyCache()
+        
+        if store is not None:
+            # Chỉ nạp các ngày còn giữ trong bộ nhớ, ngày cũ hơn nằm ở phần lưu trữ của store
+            self._restore_bookings(store.load_bookings(self.inventory.cutoff()))
+            store.bind(self._snapshot_state)
+        self.inventory.start()
+        
+        # Chỉ mục tìm kiếm theo tuyến / tên phim / rạp, giờ và giá (danh mục cố định nên dựng một lần)
+        self.search_indexes = {kind: CatalogIndex(self.buses if kind == 'bus' else self.movies, *fields)
+                               for kind, fields in SEARCH_FIELDS.items()}
+        # Kết nối đăng ký nhận số ghế trống thay đổi (thay cho việc hỏi lại danh mục liên tục)
+        self.availability = AvailabilityHub(self._available_seats)
     
     def start_server(self):
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -81,14 +245,21 @@ class BookingServer:
         
         try:
             server_socket.bind((self.host, self.port))
-            server_socket.listen(5)
+            server_socket.listen(self.backlog)
+            # Thread kết nối chỉ đọc / ghi socket; xử lý yêu cầu do một nhóm thread cố định đảm nhận
+            self.work_queue = WorkQueue(self.workers, self.max_pending)
             print(f"🎫 Server đặt vé đang chạy tại {self.host}:{self.port}")
             print("Đang chờ khách hàng kết nối...")
             
             while True:
                 client_socket, client_address = server_socket.accept()
+                if self.metrics.connections_open >= self.max_connections:
+                    self.admission.rejected['connections'] += 1
+                    client_socket.close()
+                    continue
                 print(f"🎭 Khách hàng {client_address} đã kết nối")
                 
+                self.metrics.connection_opened()
                 self.clients.append(client_socket)
                 client_thread = threading.Thread(
                     target=self.handle_client,
@@ -103,168 +274,383 @@ class BookingServer:
             server_socket.close()
     
     def handle_client(self, client_socket, client_address):
+        reader = FrameReader()
+        channel = SocketChannel(client_socket)
         try:
             while True:
-                data = client_socket.recv(4096).decode('utf-8')
+                data = client_socket.recv(RECV_SIZE)
                 if not data:
                     break
+                
+                # Xử lý hết các yêu cầu đã nhận đủ (pipelining), trả lời theo đúng thứ tự
+                reader.feed(data)
+                replies = [self.handle_message(payload, reader.mode, channel, client_address[0], self.work_queue)
+                           for payload in reader.messages()]
+                if replies:
+                    channel.send(b''.join(replies))
                     
-                try:
-                    request = json.loads(data)
-                    response = self.process_request(request)
-                    client_socket.send(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-                except json.JSONDecodeError:
-                    error_response = {"status": "error", "message": "Dữ liệu không hợp lệ"}
-                    client_socket.send(json.dumps(error_response, ensure_ascii=False).encode('utf-8'))
-                    
+        except ProtocolError as e:
+            print(f"❌ Lỗi giao thức từ client {client_address}: {e}")
         except Exception as e:
             print(f"❌ Lỗi xử lý client {client_address}: {e}")
         finally:
+            self.metrics.connection_closed()
+            self.availability.unsubscribe(channel)
+            channel.close()
             if client_socket in self.clients:
                 self.clients.remove(client_socket)
             client_socket.close()
             print(f"👋 Khách hàng {client_address} đã ngắt kết nối")
     
+    def handle_message(self, payload, mode=FRAMED, channel=None, address=None, queue=None):
+        """Giải mã một thông điệp, xử lý và trả về phản hồi đã đóng khung.
+        
+        channel: kết nối gửi yêu cầu, dùng cho subscribe (đẩy tin về sau)
+        address: địa chỉ client để giới hạn tốc độ
+        queue: WorkQueue để xử lý qua hàng đợi ưu tiên; None thì xử lý ngay trên thread gọi
+        """
+        # Phản hồi của 'hello' vẫn dùng codec cũ, codec mới áp dụng từ thông điệp sau
+        codec = channel.codec if channel is not None else JSON
+        request, response = self.admit(payload, mode, channel, address)
+        if response is None:
+            if queue is None:
+                response = self.process_request(request)
+            else:
+                response = queue.run(lambda: self.process_request(request), self.is_write(request))
+        return self.encode_response(response, mode, codec)
+    
+    def admit(self, payload, mode=FRAMED, channel=None, address=None):
+        """Giải mã và kiểm tra giới hạn tốc độ; trả về (yêu cầu, phản hồi).
+        
+        Phản hồi khác None nghĩa là đã trả lời xong (lỗi, bị giới hạn, subscribe, hello),
+        ngược lại yêu cầu cần được đưa vào process_request.
+        """
+        try:
+            started = time.perf_counter()
+            request = decode_message(payload, channel.codec if channel is not None else JSON)
+            self.metrics.decode.observe(time.perf_counter() - started)
+            if not isinstance(request, dict):
+                raise ValueError("Yêu cầu phải là một object JSON")
+        except ValueError:
+            return None, {"status": "error", "message": "Dữ liệu không hợp lệ"}
+        
+        rejection = self.admission.check(address, request_phone(request))
+        if rejection is not None:
+            return request, rejection
+        if request.get('action') in SUBSCRIPTION_ACTIONS:
+            return request, self.subscription(request, None if mode == LEGACY else channel)
+        if request.get('action') == HELLO_ACTION:
+            return request, self.hello(request.get('codecs'), mode, channel)
+        return request, None
+    
+    def is_write(self, request):
+        """Yêu cầu đặt / hủy / giữ chỗ: được ưu tiên trong hàng đợi khi quá tải"""
+        return request.get('action') in WRITE_ACTIONS
+    
+    def encode_response(self, response, mode=FRAMED, codec=JSON):
+        started = time.perf_counter()
+        frame = pack_frame(encode_message(response, codec), mode)
+        self.metrics.encode.observe(time.perf_counter() - started)
+        return frame
+    
     def process_request(self, request):
+        token = self.metrics.begin(request.get('action'))
+        response = None
+        try:
+            key = request.get('idempotency_key')
+            if key is not None and request.get('action') in WRITE_ACTIONS:
+                if not isinstance(key, str) or not 0 < len(key) <= MAX_KEY_LENGTH:
+                    response = {"status": "error", "message": f"Khóa idempotency phải là chuỗi 1-{MAX_KEY_LENGTH} ký tự"}
+                else:
+                    response = self.idempotency.run(key, request, lambda: self._dispatch(request))
+            else:
+                response = self._dispatch(request)
+            return response
+        finally:
+            self.metrics.finish(token, response)
+    
+    def _dispatch(self, request):
         action = request.get('action')
         
         if action == 'get_buses':
-            return self.get_buses()
+            return self.get_buses(request.get('if_version'), request.get('date'))
         elif action == 'get_movies':
-            return self.get_movies()
+            return self.get_movies(request.get('if_version'), request.get('date'))
         elif action == 'book_bus':
-            return self.book_bus(request.get('bus_id'), request.get('seats'), request.get('customer'))
+            return self.book_bus(request.get('bus_id'), request.get('seats'), request.get('customer'),
+                                 request.get('date'))
         elif action == 'book_movie':
-            return self.book_movie(request.get('movie_id'), request.get('seats'), request.get('customer'))
+            return self.book_movie(request.get('movie_id'), request.get('seats'), request.get('customer'),
+                                   request.get('date'))
         elif action == 'get_bookings':
             return self.get_bookings(request.get('customer_phone'))
         elif action == 'cancel_booking':
             return self.cancel_booking(request.get('booking_id'))
+        elif action in HOLD_ACTIONS:
+            kind = HOLD_ACTIONS[action]
+            return self.hold_seats(kind, request.get(SERVICE_KEYS[kind]), request.get('seats'),
+                                   request.get('customer'), request.get('ttl'), request.get('date'))
+        elif action == 'confirm_hold':
+            return self.confirm_hold(request.get('hold_id'))
+        elif action == 'release_hold':
+            return self.release_hold(request.get('hold_id'))
+        elif action == 'batch':
+            return self.batch(request.get('requests'), bool(request.get('atomic')))
+        elif action == 'stats':
+            return self.stats(request.get('format'))
+        elif action == 'search':
+            return self.search(request)
+        elif action == 'report':
+            return self.sales_report(request.get('type'), request.get('service_id'), request.get('hours'))
         else:
             return {"status": "error", "message": "Hành động không hợp lệ"}
     
-    def get_buses(self):
-        buses_info = []
-        for bus in self.buses.values():
-            available_seats = bus['total_seats'] - len(bus['booked_seats'])
-            buses_info.append({
-                'id': bus['id'],
-                'route': bus['route'],
-                'departure': bus['departure'],
-                'arrival': bus['arrival'],
-                'price': bus['price'],
-                'available_seats': available_seats,
-                'total_seats': bus['total_seats']
-            })
-        
-        return {"status": "success", "data": buses_info}
-    
-    def get_movies(self):
-        movies_info = []
-        for movie in self.movies.values():
-            available_seats = movie['total_seats'] - len(movie['booked_seats'])
-            movies_info.append({
-                'id': movie['id'],
-                'title': movie['title'],
-                'showtime': movie['showtime'],
-                'duration': movie['duration'],
-                'cinema': movie['cinema'],
-                'price': movie['price'],
-                'available_seats': available_seats,
-                'total_seats': movie['total_seats']
-            })
-        
-        return {"status": "success", "data": movies_info}
-    
-    def book_bus(self, bus_id, num_seats, customer_info):
-        if bus_id not in self.buses:
+    def stats(self, output_format=None):
+        """Số liệu vận hành (chỉ đọc); format='text' trả về dạng từng dòng.
+        
+        Bộ lấy mẫu ngăn xếp và ngưỡng yêu cầu chậm ảnh hưởng mọi client nên chỉ đặt lúc khởi động
+        (--profile-slow, --slow-ms), client không đổi được.
+        """
+        catalogs = [cache for partition in list(self.inventory.partitions.values())
+                    for cache in list(partition.catalogs.values())]
+        components = {
+            'bookings': len(self.bookings),
+            'holds': len(self.holds),
+            'inventory_days': len(self.inventory.partitions),
+            'inventory_trips': sum(len(partition.seat_maps) for partition in list(self.inventory.partitions.values())),
+            'evicted_days': self.inventory.evicted,
+            'catalog_cache_hits': sum(cache.hits for cache in catalogs),
+            'catalog_cache_misses': sum(cache.misses for cache in catalogs),
+            'idempotency_keys': len(self.idempotency),
+            'idempotency_hits': self.idempotency.hits,
+            'subscribers': len(self.availability),
+            'pushes': self.availability.pushed,
+            'dropped_subscribers': self.availability.dropped,
+            'queued': len(self.work_queue) if self.work_queue is not None else 0,
+        }
+        for reason, count in self.admission.rejected.items():
+            components[f'rejected_{reason}'] = count
+        if self.work_queue is not None:
+            for kind, count in self.work_queue.rejected.items():
+                components[f'rejected_queue_{kind}'] = count
+        for name in ('writes', 'commits', 'records', 'fsyncs'):
+            if hasattr(self.store, name):
+                components[f'store_{name}'] = getattr(self.store, name)
+        
+        if output_format == 'text':
+            return {"status": "success", "text": self.metrics.render_text(components)}
+        return {"status": "success", "data": dict(self.metrics.snapshot(), components=components)}
+    
+    def search(self, request):
+        """search: {'type': 'bus' | 'movie', 'date', 'q', 'route' / 'title' / 'cinema' (tìm theo từ),
+        'departure' / 'showtime' / 'price': [từ, đến], 'min_available', 'sort' ('-price'...),
+        'offset', 'limit'}; kết quả kèm 'total' để phân trang"""
+        kind = request.get('type')
+        if not isinstance(kind, str) or kind not in SERVICE_KEYS:
+            return {"status": "error", "message": "Loại dịch vụ không hợp lệ"}
+        date, error = self.inventory.check_date(request.get('date'), past=True)
+        if error is not None:
+            return error
+        available = lambda service_id: self.inventory.available(kind, service_id, date)
+        return self.search_indexes[kind].search(
+            request, available,
+            lambda service_id: DESCRIBE[kind](self._service(kind, service_id), available(service_id)))
+    
+    def sales_report(self, kind=None, service_id=None, hours=None):
+        """report: {'type', 'service_id' (lọc phần theo dịch vụ), 'hours' (số ô giờ gần nhất)};
+        số liệu tính từ các booking đang lưu lúc khởi động và mọi lượt đặt / hủy sau đó"""
+        if kind is not None and (not isinstance(kind, str) or kind not in SERVICE_KEYS):
+            return {"status": "error", "message": "Loại dịch vụ không hợp lệ"}
+        if service_id is not None and not isinstance(service_id, str):
+            return {"status": "error", "message": "Mã dịch vụ không hợp lệ"}
+        if hours is None:
+            hours = DEFAULT_HOURS
+        if isinstance(hours, bool) or not isinstance(hours, int) or not 1 <= hours <= MAX_HOURS:
+            return {"status": "error", "message": f"hours phải từ 1 tới {MAX_HOURS}"}
+        return {"status": "success", "data": self.report.report(kind, service_id, hours)}
+    
+    def get_buses(self, known_version=None, date=None):
+        return self._catalog_response('bus', known_version, date)
+    
+    def get_movies(self, known_version=None, date=None):
+        return self._catalog_response('movie', known_version, date)
+    
+    def _catalog_response(self, kind, known_version, date):
+        date, error = self.inventory.check_date(date, past=True)
+        if error is not None:
+            return error
+        return self._catalog_cache(kind, date).response(known_version)
+    
+    def book_bus(self, bus_id, num_seats, customer_info, date=None):
+        if self._service('bus', bus_id) is None:
             return {"status": "error", "message": "Mã xe không tồn tại"}
         
+        if not is_valid_seat_count(num_seats):
+            return {"status": "error", "message": "Số lượng vé không hợp lệ"}
+        
+        date, error = self.inventory.check_date(date)
+        if error is not None:
+            return error
+        
         bus = self.buses[bus_id]
-        available_seats = bus['total_seats'] - len(bus['booked_seats'])
-        
-        if num_seats > available_seats:
-            return {"status": "error", "message": f"Chỉ còn {available_seats} chỗ trống"}
-        
-        # Tạo số ghế tự động
-        booked_seat_numbers = []
-        for i in range(num_seats):
-            seat_num = len(bus['booked_seats']) + 1
-            bus['booked_seats'].append(seat_num)
-            booked_seat_numbers.append(seat_num)
-        
-        # Tạo mã đặt vé
-        booking_id = str(uuid.uuid4())[:8].upper()
-        total_price = bus['price'] * num_seats
-        
-        booking_info = {
-            'booking_id': booking_id,
-            'type': 'bus',
-            'service_id': bus_id,
-            'service_name': bus['route'],
-            'customer': customer_info,
-            'seats': booked_seat_numbers,
-            'total_price': total_price,
-            'booking_time': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+        seat_map = self.inventory.seat_map('bus', bus_id, date)
+        
+        # Kiểm tra và giữ ghế phải nằm trong cùng một khóa của chuyến để không bán quá số ghế
+        with self.service_locks.get((bus_id, date)):
+            available_seats = seat_map.free_count
+            
+            if num_seats > available_seats:
+                return {"status": "error", "message": f"Chỉ còn {available_seats} chỗ trống"}
+            
+            # Lấy các ghế trống thấp nhất (ghế đã hủy được dùng lại, không bị trùng)
+            booked_seat_numbers = seat_map.labels(seat_map.allocate(num_seats))
+        self._service_changed('bus', bus_id, date)
         
-        self.bookings[booking_id] = booking_info
+        booking_info = self._new_booking('bus', bus, booked_seat_numbers, customer_info, date)
+        error = self._save_booking(booking_info)
+        if error is not None:
+            return error
+        log_event(f"Đặt vé xe {booking_info.booking_id}: {bus_id} x{num_seats} ({booking_info.phone})")
         
         return {
             "status": "success",
-            "message": "Đặt vé xe thành công!",
-            "booking_info": booking_info
+            "message": BOOKED_MESSAGES['bus'],
+            "booking_info": booking_info.to_dict()
         }
     
-    def book_movie(self, movie_id, num_seats, customer_info):
+    def book_movie(self, movie_id, num_seats, customer_info, date=None):
         """Đặt vé phim"""
-        if movie_id not in self.movies:
+        if self._service('movie', movie_id) is None:
             return {"status": "error", "message": "Mã phim không tồn tại"}
         
+        if not is_valid_seat_count(num_seats):
+            return {"status": "error", "message": "Số lượng vé không hợp lệ"}
+        
+        date, error = self.inventory.check_date(date)
+        if error is not None:
+            return error
+        
         movie = self.movies[movie_id]
-        available_seats = movie['total_seats'] - len(movie['booked_seats'])
-        
-        if num_seats > available_seats:
-            return {"status": "error", "message": f"Chỉ còn {available_seats} chỗ trống"}
-        
-        # Tạo số ghế tự động (dạng A1, A2, B1, B2...)
-        booked_seat_numbers = []
-        for i in range(num_seats):
-            seat_num = len(movie['booked_seats']) + 1
-            row = chr(65 + (seat_num - 1) // 10)
-            col = (seat_num - 1) % 10 + 1
-            seat_name = f"{row}{col}"
-            movie['booked_seats'].append(seat_name)
-            booked_seat_numbers.append(seat_name)
-        
-        # Tạo mã đặt vé
-        booking_id = str(uuid.uuid4())[:8].upper()
-        total_price = movie['price'] * num_seats
-        
-        booking_info = {
-            'booking_id': booking_id,
-            'type': 'movie',
-            'service_id': movie_id,
-            'service_name': f"{movie['title']} - {movie['showtime']}",
-            'customer': customer_info,
-            'seats': booked_seat_numbers,
-            'total_price': total_price,
-            'booking_time': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+        seat_map = self.inventory.seat_map('movie', movie_id, date)
+        
+        with self.service_locks.get((movie_id, date)):
+            available_seats = seat_map.free_count
+            
+            if num_seats > available_seats:
+                return {"status": "error", "message": f"Chỉ còn {available_seats} chỗ trống"}
+            
+            # Tạo số ghế tự động (dạng A1, A2, B1, B2...), ưu tiên các ghế liền nhau
+            booked_seat_numbers = seat_map.labels(seat_map.allocate(num_seats))
+        self._service_changed('movie', movie_id, date)
         
-        self.bookings[booking_id] = booking_info
+        booking_info = self._new_booking('movie', movie, booked_seat_numbers, customer_info, date)
+        error = self._save_booking(booking_info)
+        if error is not None:
+            return error
+        log_event(f"Đặt vé phim {booking_info.booking_id}: {movie_id} x{num_seats} ({booking_info.phone})")
         
         return {
             "status": "success",
-            "message": "Đặt vé phim thành công!",
-            "booking_info": booking_info
+            "message": BOOKED_MESSAGES['movie'],
+            "booking_info": booking_info.to_dict()
         }
     
+    def _new_booking(self, kind, service, seats, customer_info, date):
+        """Tạo bản ghi booking mới: mã đặt vé, ngày đi / ngày chiếu, tổng tiền, thời gian đặt"""
+        return Booking(self.ids.next_id(), kind, service['id'], service_name(kind, service), date,
+                       customer_info, seats, service['price'] * len(seats))
+    
+    def _restore_bookings(self, bookings):
+        """Nạp lại booking đã lưu: đánh dấu ghế và dựng lại chỉ mục, không ghi lại vào store"""
+        for booking in bookings:
+            service = self._service(booking['type'], booking['service_id'])
+            if service is None:
+                print(f"⚠️ Bỏ qua booking {booking['booking_id']}: dịch vụ {booking['service_id']} không tồn tại")
+                continue
+            
+            booking['date'] = booking_date(booking)
+            seat_map = self.inventory.seat_map(booking['type'], booking['service_id'], booking['date'])
+            try:
+                taken = seat_map.take([seat_map.index_of(seat) for seat in booking['seats']])
+            except (TypeError, ValueError):
+                taken = False
+            if not taken:
+                # Ghế không hợp lệ hoặc đã thuộc booking nạp trước: không nạp để khỏi bán trùng ghế
+                print(f"⚠️ Bỏ qua booking {booking['booking_id']}: ghế {booking['seats']} không hợp lệ"
+                      f" hoặc trùng với booking khác của {booking['service_id']} ngày {booking['date']}")
+                continue
+            if booking.get('service_name') is None:
+                booking['service_name'] = service_name(booking['type'], service)
+            self.ids.observe(booking['booking_id'])
+            self._add_booking(Booking.from_dict(booking), persist=False)
+    
+    def _snapshot_state(self):
+        """Bản sao danh mục và booking hiện tại (để store chụp snapshot)"""
+        return dict(self.buses), dict(self.movies), list(self.bookings.copy().values())
+    
+    def _add_booking(self, booking_info, persist=True):
+        """Lưu booking vào bảng và cập nhật chỉ mục theo số điện thoại.
+        
+        persist=True: ghi store trước (chờ commit xuống đĩa); ghi lỗi thì ném lỗi, bảng không đổi.
+        """
+        if persist and self.store is not None:
+            self.store.save_booking(booking_info)
+        
+        booking_id = booking_info.booking_id
+        partition = self.inventory.partition(booking_info.date)
+        with self.booking_locks.get(booking_id):
+            self.bookings[booking_id] = booking_info
+            partition.bookings[booking_id] = None
+        
+        phone = booking_info.phone
+        with self.phone_locks.get(phone):
+            self.bookings_by_phone.setdefault(phone, {})[booking_id] = None
+        self.report.sale(booking_info)
+    
+    def _save_booking(self, booking_info):
+        """Ghi booking mới (ghế đã giữ sẵn); ghi lỗi thì trả ghế và trả về phản hồi lỗi, ngược lại None"""
+        try:
+            self._add_booking(booking_info)
+        except STORE_ERRORS as e:
+            print(f"❌ Lỗi khi lưu booking {booking_info.booking_id}: {e}")
+            kind, service_id, date = booking_info.type, booking_info.service_id, booking_info.date
+            with self.service_locks.get((service_id, date)):
+                self._release_seats(kind, service_id, date, booking_info.seats)
+            self._service_changed(kind, service_id, date)
+            return dict(STORE_FAILED)
+        return None
+    
+    def _remove_booking(self, booking_id, persist=True):
+        """Xóa booking khỏi bảng và chỉ mục; trả về booking đã xóa hoặc None"""
+        with self.booking_locks.get(booking_id):
+            booking = self.bookings.pop(booking_id, None)
+        if booking is None:
+            return None
+        partition = self.inventory.get(booking.date)
+        if partition is not None:
+            partition.bookings.pop(booking_id, None)
+        
+        phone = booking.phone
+        with self.phone_locks.get(phone):
+            phone_bookings = self.bookings_by_phone.get(phone)
+            if phone_bookings is not None:
+                phone_bookings.pop(booking_id, None)
+                if not phone_bookings:
+                    del self.bookings_by_phone[phone]
+        
+        if persist and self.store is not None:
+            self.store.delete_booking(booking_id)
+        return booking
+    
     def get_bookings(self, customer_phone):
+        # Chỉ duyệt các booking của khách này qua chỉ mục, không quét toàn bộ bảng
+        with self.phone_locks.get(customer_phone):
+            booking_ids = list(self.bookings_by_phone.get(customer_phone, ()))
         customer_bookings = []
-        for booking in self.bookings.values():
-            if booking['customer']['phone'] == customer_phone:
-                customer_bookings.append(booking)
+        for booking_id in booking_ids:
+            booking = self.bookings.get(booking_id)
+            if booking is not None:
+                customer_bookings.append(booking.to_dict())
         
         return {
             "status": "success",
@@ -273,34 +659,445 @@ class BookingServer:
         }
     
     def cancel_booking(self, booking_id):
-        if booking_id not in self.bookings:
+        booking_id = _lookup_id(booking_id)
+        booking = self.bookings.get(booking_id)
+        if booking is None:
             return {"status": "error", "message": "Mã đặt vé không tồn tại"}
         
-        booking = self.bookings[booking_id]
-        service_id = booking['service_id']
-        seats = booking['seats']
+        service_id = booking.service_id
         
-        # Trả lại ghế
-        if booking['type'] == 'bus':
-            for seat in seats:
-                if seat in self.buses[service_id]['booked_seats']:
-                    self.buses[service_id]['booked_seats'].remove(seat)
-        else:  # movie
-            for seat in seats:
-                if seat in self.movies[service_id]['booked_seats']:
-                    self.movies[service_id]['booked_seats'].remove(seat)
-        
-        # Xóa booking
-        del self.bookings[booking_id]
+        # Đánh dấu đang hủy trong khóa của chuyến: hai lượt hủy cùng một mã chỉ có một lượt thành công,
+        # và batch đang giữ khóa thấy trạng thái ổn định. Booking chỉ rời bảng và trả ghế sau khi
+        # store đã xóa xong (snapshot chụp trong lúc chờ vẫn thấy booking); ghi lỗi thì bỏ đánh dấu
+        trip = (service_id, booking.date)
+        with self.service_locks.get(trip):
+            if booking_id not in self.bookings or booking_id in self.cancelling:
+                return {"status": "error", "message": "Mã đặt vé không tồn tại"}
+            self.cancelling.add(booking_id)
+        if self.store is not None:
+            try:
+                self.store.delete_booking(booking_id)
+            except STORE_ERRORS as e:
+                print(f"❌ Lỗi khi hủy booking {booking_id}: {e}")
+                with self.service_locks.get(trip):
+                    self.cancelling.discard(booking_id)
+                return dict(STORE_FAILED)
+        with self.service_locks.get(trip):
+            self.cancelling.discard(booking_id)
+            self._remove_booking(booking_id, persist=False)
+            self._release_seats(booking.type, service_id, booking.date, booking.seats)
+        self.report.refund(booking)
+        self._service_changed(booking.type, service_id, booking.date)
+        log_event(f"Hủy vé {booking_id}: {service_id}, hoàn {booking.total_price}")
         
         return {
             "status": "success",
             "message": "Hủy vé thành công!",
-            "refund_amount": booking['total_price']
+            "refund_amount": booking.total_price
+        }
+    
+    def _release_seats(self, kind, service_id, date, seats):
+        """Trả ghế của booking / lượt giữ chỗ về sơ đồ ghế (phía gọi giữ khóa của chuyến)"""
+        seat_map = self.inventory.find(kind, service_id, date)
+        if seat_map is None:
+            return  # ngày đó đã được gỡ khỏi bộ nhớ
+        seat_map.release([seat_map.index_of(seat) for seat in seats])
+    
+    def _service(self, kind, service_id):
+        if not isinstance(service_id, str):
+            return None
+        return (self.buses if kind == 'bus' else self.movies).get(service_id)
+    
+    def _catalog_cache(self, kind, date):
+        """Cache danh mục của một ngày (dạng JSON dựng sẵn, chỉ mã hóa lại dịch vụ bị đổi số ghế)"""
+        catalogs = self.inventory.partition(date).catalogs
+        cache = catalogs.get(kind)
+        if cache is None:
+            describe = DESCRIBE[kind]
+            cache = catalogs.setdefault(kind, CatalogCache(
+                self.buses if kind == 'bus' else self.movies,
+                lambda service: describe(service, self.inventory.available(kind, service['id'], date))))
+        return cache
+    
+    def _service_changed(self, kind, service_id, date):
+        """Số ghế của chuyến vừa đổi: bỏ cache danh mục của ngày đó và báo cho các kết nối đã subscribe"""
+        partition = self.inventory.get(date)
+        cache = partition.catalogs.get(kind) if partition is not None else None
+        if cache is not None:
+            cache.invalidate(service_id)
+        self.availability.changed(kind, service_id, date)
+    
+    def _available_seats(self, kind, service_id, date):
+        return self.inventory.available(kind, service_id, date)
+    
+    def _evict_day(self, partition):
+        """Gỡ một ngày đã qua: lưu trữ booking của ngày đó rồi bỏ khỏi bộ nhớ và chỉ mục"""
+        bookings = [booking for booking in map(self.bookings.get, list(partition.bookings)) if booking is not None]
+        if self.store is not None:
+            self.store.archive(partition.date, [booking.to_dict() for booking in bookings])
+        for booking in bookings:
+            self._remove_booking(booking.booking_id, persist=False)
+        self.service_locks.discard([(service_id, partition.date) for _, service_id in partition.seat_maps])
+        log_event(f"Gỡ ngày {partition.date} khỏi bộ nhớ: {len(partition.seat_maps)} chuyến, {len(bookings)} booking")
+    
+    def hello(self, codecs, mode=FRAMED, channel=None):
+        """hello: {'codecs': ['binary', 'json']} - chọn codec đầu tiên server hỗ trợ cho kết nối này.
+        Kết nối legacy (không đóng khung) chỉ dùng được JSON."""
+        if not isinstance(codecs, list):
+            return {"status": "error", "message": "Danh sách codec không hợp lệ"}
+        if mode == LEGACY or channel is None:
+            codecs = [name for name in codecs if name == JSON.name]
+        codec = negotiate(codecs)
+        if codec is None:
+            return {"status": "error", "message": "Không có codec chung", "codecs": list(CODECS)}
+        if channel is not None:
+            channel.codec = codec
+        return {"status": "success", "codec": codec.name, "codecs": list(CODECS)}
+    
+    # --- Đăng ký nhận số ghế trống thay đổi ---
+    def subscription(self, request, channel):
+        """subscribe: {'types': ['bus', 'movie'], 'service_ids': [...], 'dates': ['YYYY-MM-DD', ...]}
+        (đều tùy chọn, không có 'dates' là mọi ngày); trả về số ghế hiện tại của các ngày đó (mặc định
+        hôm nay), sau đó server tự đẩy tin 'availability' mỗi khi có thay đổi"""
+        if channel is None:
+            return {"status": "error", "message": "Chỉ hỗ trợ đăng ký trên kết nối đóng khung (framed)"}
+        if request.get('action') == 'unsubscribe':
+            self.availability.unsubscribe(channel)
+            return {"status": "success", "message": "Đã hủy đăng ký"}
+        
+        kinds = request.get('types') or list(SERVICE_KEYS)
+        service_ids = request.get('service_ids')
+        if not isinstance(kinds, list) or not set(kinds) <= set(SERVICE_KEYS):
+            return {"status": "error", "message": "Loại dịch vụ không hợp lệ"}
+        if service_ids is not None and (not isinstance(service_ids, list) or
+                                        not all(isinstance(service_id, str) for service_id in service_ids)):
+            return {"status": "error", "message": "Danh sách mã dịch vụ không hợp lệ"}
+        dates = request.get('dates')
+        if dates is not None and not isinstance(dates, list):
+            return {"status": "error", "message": "Danh sách ngày không hợp lệ"}
+        checked = []
+        for date in dates or [None]:
+            date, error = self.inventory.check_date(date, past=True)
+            if error is not None:
+                return error
+            checked.append(date)
+        
+        # Đăng ký trước rồi mới chụp số ghế: thay đổi xen giữa sẽ đến sau dưới dạng tin đẩy
+        self.availability.subscribe(channel, kinds, service_ids, checked if dates else None)
+        data = [{'type': kind, 'id': service_id, 'date': date,
+                 'available_seats': self.inventory.available(kind, service_id, date)}
+                for date in checked
+                for kind in kinds
+                for service_id in (self.buses if kind == 'bus' else self.movies)
+                if not service_ids or service_id in service_ids]
+        return {"status": "success", "data": data, "tick": self.availability.tick}
+    
+    # --- Giữ chỗ có thời hạn: giữ ghế trước, xác nhận sau khi thanh toán ---
+    def hold_seats(self, kind, service_id, num_seats, customer_info, ttl=None, date=None):
+        error = self._check_book(kind, service_id, num_seats)
+        if error is not None:
+            return error
+        date, error = self.inventory.check_date(date)
+        if error is not None:
+            return error
+        if ttl is None:
+            ttl = DEFAULT_HOLD_TTL
+        if isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or not 1 <= ttl <= MAX_HOLD_TTL:
+            return {"status": "error", "message": f"Thời gian giữ chỗ phải từ 1 tới {MAX_HOLD_TTL} giây"}
+        
+        service = self._service(kind, service_id)
+        seat_map = self.inventory.seat_map(kind, service_id, date)
+        with self.service_locks.get((service_id, date)):
+            if num_seats > seat_map.free_count:
+                return {"status": "error", "message": f"Chỉ còn {seat_map.free_count} chỗ trống"}
+            seats = seat_map.labels(seat_map.allocate(num_seats, HELD))
+            hold = {
+                'hold_id': 'H' + self.ids.next_id(),
+                'type': kind,
+                'service_id': service_id,
+                'service_name': service_name(kind, service),
+                'date': date,
+                'customer': customer_info,
+                'seats': seats,
+                'total_price': service['price'] * num_seats,
+                'expires_at': time.time() + ttl
+            }
+            self.holds[hold['hold_id']] = hold
+        self.hold_expiry.schedule(hold['hold_id'], hold['expires_at'])
+        self._service_changed(kind, service_id, date)
+        
+        return {
+            "status": "success",
+            "message": f"Đã giữ {num_seats} chỗ trong {ttl} giây, vui lòng xác nhận trước khi hết hạn",
+            "hold": hold
         }
+    
+    def confirm_hold(self, hold_id):
+        """Biến lượt giữ chỗ còn hạn thành booking"""
+        hold_id = _lookup_id(hold_id)
+        hold = self.holds.get(hold_id)
+        if hold is None:
+            return {"status": "error", "message": "Mã giữ chỗ không tồn tại hoặc đã hết hạn"}
+        
+        kind, service_id, date = hold['type'], hold['service_id'], hold['date']
+        service = self._service(kind, service_id)
+        seat_map = self.inventory.seat_map(kind, service_id, date)
+        with self.service_locks.get((service_id, date)):
+            if self.holds.pop(hold_id, None) is None:
+                return {"status": "error", "message": "Mã giữ chỗ không tồn tại hoặc đã hết hạn"}
+            indices = [seat_map.index_of(seat) for seat in hold['seats']]
+            expired = hold['expires_at'] <= time.time()
+            if expired:
+                seat_map.release(indices)
+            else:
+                seat_map.confirm(indices)
+        if expired:
+            self._service_changed(kind, service_id, date)
+            return {"status": "error", "message": "Mã giữ chỗ không tồn tại hoặc đã hết hạn"}
+        
+        booking_info = self._new_booking(kind, service, hold['seats'], hold['customer'], date)
+        error = self._save_booking(booking_info)
+        if error is not None:
+            return error
+        log_event(f"Xác nhận giữ chỗ {hold_id} -> {booking_info.booking_id}: {service_id} x{len(hold['seats'])}")
+        
+        return {"status": "success", "message": BOOKED_MESSAGES[kind], "booking_info": booking_info.to_dict()}
+    
+    def release_hold(self, hold_id):
+        """Khách bỏ giữ chỗ trước khi hết hạn"""
+        if not self._drop_hold(_lookup_id(hold_id)):
+            return {"status": "error", "message": "Mã giữ chỗ không tồn tại hoặc đã hết hạn"}
+        return {"status": "success", "message": "Đã trả lại chỗ đang giữ"}
+    
+    def _expire_hold(self, hold_id):
+        hold = self.holds.get(hold_id)
+        if hold is not None and hold['expires_at'] <= time.time():
+            self._drop_hold(hold_id)
+    
+    def _drop_hold(self, hold_id):
+        hold = self.holds.get(hold_id)
+        if hold is None:
+            return False
+        with self.service_locks.get((hold['service_id'], hold['date'])):
+            if self.holds.pop(hold_id, None) is None:
+                return False
+            self._release_seats(hold['type'], hold['service_id'], hold['date'], hold['seats'])
+        self._service_changed(hold['type'], hold['service_id'], hold['date'])
+        return True
+    
+    # --- Batch: nhiều yêu cầu trong một lượt ---
+    def batch(self, requests, atomic=False):
+        """Xử lý nhiều yêu cầu trong một lượt mạng, khóa mỗi chuyến đúng một lần.
+        
+        atomic=True: hoặc tất cả yêu cầu đặt / hủy đều thành công, hoặc không có gì thay đổi.
+        """
+        if not isinstance(requests, list) or not requests:
+            return {"status": "error", "message": "Danh sách yêu cầu không hợp lệ"}
+        if len(requests) > MAX_BATCH_SIZE:
+            return {"status": "error", "message": f"Tối đa {MAX_BATCH_SIZE} yêu cầu mỗi lượt"}
+        
+        # Bước 1: xác định mỗi yêu cầu ghi vào chuyến nào (mã dịch vụ, ngày);
+        # chuyến của booking không bao giờ đổi
+        plan = []
+        date_errors = {}
+        invalid = {}
+        for i, request in enumerate(requests):
+            action = request.get('action') if isinstance(request, dict) else None
+            if action in BOOK_ACTIONS:
+                kind = BOOK_ACTIONS[action]
+                service_id = request.get(SERVICE_KEYS[kind])
+                if not isinstance(service_id, str):
+                    # Mã không phải chuỗi (ví dụ {} hay []) không tra được: yêu cầu này hỏng, các yêu cầu khác vẫn chạy
+                    invalid[i] = self._check_book(kind, service_id, request.get('seats'))
+                    plan.append((action, None, None))
+                    continue
+                date, date_errors[i] = self.inventory.check_date(request.get('date'))
+                plan.append((action, kind, (service_id, date)))
+            elif action == 'cancel_booking':
+                booking = self.bookings.get(_lookup_id(request.get('booking_id')))
+                if booking is None:
+                    plan.append((action, None, None))
+                else:
+                    plan.append((action, booking.type, (booking.service_id, booking.date)))
+            else:
+                plan.append((action, None, None))
+        trips = {trip for _, kind, trip in plan
+                 if kind and trip[1] is not None and self._service(kind, trip[0]) is not None}
+        
+        # Bước 2: giữ khóa của mọi chuyến liên quan một lần, kiểm tra rồi giữ ghế cho booking mới
+        # và đánh dấu booking sắp hủy (vẫn nằm trong bảng, ghế chưa trả)
+        results = [None] * len(requests)
+        saved = {}
+        cancelled = {}
+        with self.service_locks.hold(trips):
+            if atomic:
+                error = self._check_batch(requests, plan, trips, date_errors, invalid)
+                if error is not None:
+                    return error
+            
+            for i, (request, (action, kind, trip)) in enumerate(zip(requests, plan)):
+                if i in invalid:
+                    results[i] = invalid[i]
+                elif action in BOOK_ACTIONS:
+                    num_seats = request.get('seats')
+                    results[i] = self._check_book(kind, trip[0], num_seats) or date_errors[i]
+                    if results[i] is None:
+                        seat_map = self.inventory.seat_map(kind, *trip)
+                        if num_seats > seat_map.free_count:
+                            results[i] = {"status": "error", "message": f"Chỉ còn {seat_map.free_count} chỗ trống"}
+                        else:
+                            seats = seat_map.labels(seat_map.allocate(num_seats))
+                            saved[i] = self._new_booking(kind, self._service(kind, trip[0]), seats,
+                                                         request.get('customer'), trip[1])
+                elif action == 'cancel_booking':
+                    booking = None
+                    if trip in trips:
+                        booking = self.bookings.get(_lookup_id(request.get('booking_id')))
+                    if booking is None or booking.booking_id in self.cancelling:
+                        results[i] = {"status": "error", "message": "Mã đặt vé không tồn tại"}
+                    else:
+                        self.cancelling.add(booking.booking_id)
+                        cancelled[i] = booking
+        
+        # Ghi store một lần cho cả lượt (một transaction / một nhóm fsync) rồi mới thêm booking mới,
+        # gỡ booking bị hủy và trả ghế của chúng. Ghi lỗi: trả ghế đã giữ, bỏ đánh dấu hủy,
+        # cả lượt báo lỗi như chưa từng chạy
+        failed = False
+        if self.store is not None and (saved or cancelled):
+            try:
+                self.store.write_batch(list(saved.values()), [booking.booking_id for booking in cancelled.values()])
+            except STORE_ERRORS as e:
+                print(f"❌ Lỗi khi lưu batch: {e}")
+                failed = True
+        if saved or cancelled:
+            with self.service_locks.hold(trips):
+                for booking in cancelled.values():
+                    self.cancelling.discard(booking.booking_id)
+                    if not failed:
+                        self._remove_booking(booking.booking_id, persist=False)
+                for booking in (saved if failed else cancelled).values():
+                    self._release_seats(booking.type, booking.service_id, booking.date, booking.seats)
+        if not failed:
+            for booking in saved.values():
+                self._add_booking(booking, persist=False)
+        
+        # Bước 3 (ngoài khóa): báo thay đổi chỗ trống, trả kết quả, chạy các yêu cầu đọc
+        for _, kind, trip in plan:
+            if trip in trips:
+                self._service_changed(kind, *trip)
+        if failed:
+            return dict(STORE_FAILED)
+        
+        for i, (request, (action, kind, trip)) in enumerate(zip(requests, plan)):
+            if i in saved:
+                results[i] = {"status": "success", "message": BOOKED_MESSAGES[kind],
+                              "booking_info": saved[i].to_dict()}
+            elif i in cancelled:
+                self.report.refund(cancelled[i])
+                results[i] = {"status": "success", "message": "Hủy vé thành công!",
+                              "refund_amount": cancelled[i].total_price}
+            elif results[i] is None:
+                if action in BATCH_READ_ACTIONS:
+                    results[i] = self.process_request(request)
+                else:
+                    results[i] = {"status": "error", "message": "Hành động không hợp lệ"}
+        
+        if saved or cancelled:
+            log_event(f"Batch: đặt {len(saved)} vé, hủy {len(cancelled)} vé"
+                      f" ({', '.join(b.booking_id for b in list(saved.values()) + list(cancelled.values()))})")
+        
+        return {"status": "success", "results": results, "count": len(results)}
+    
+    def _check_book(self, kind, service_id, num_seats):
+        """Lỗi của một yêu cầu đặt vé (mã dịch vụ, số ghế) hoặc None nếu hợp lệ"""
+        if self._service(kind, service_id) is None:
+            return {"status": "error", "message": "Mã xe không tồn tại" if kind == 'bus' else "Mã phim không tồn tại"}
+        if not is_valid_seat_count(num_seats):
+            return {"status": "error", "message": "Số lượng vé không hợp lệ"}
+        return None
+    
+    def _check_batch(self, requests, plan, trips, date_errors, invalid):
+        """Chạy thử cả lượt trên số ghế trống hiện tại (đang giữ khóa); trả về lỗi đầu tiên nếu có"""
+        free = {}
+        cancelled = set()
+        for i, (request, (action, kind, trip)) in enumerate(zip(requests, plan)):
+            error = None
+            if i in invalid:
+                error = invalid[i]
+            elif action in BOOK_ACTIONS:
+                error = self._check_book(kind, trip[0], request.get('seats')) or date_errors[i]
+                if error is None:
+                    available = free.get(trip, self.inventory.available(kind, *trip))
+                    if request['seats'] > available:
+                        error = {"status": "error", "message": f"Chỉ còn {available} chỗ trống"}
+                    else:
+                        free[trip] = available - request['seats']
+            elif action == 'cancel_booking':
+                booking_id = _lookup_id(request.get('booking_id'))
+                booking = self.bookings.get(booking_id)
+                if booking is None or booking_id in cancelled or booking_id in self.cancelling or trip not in trips:
+                    error = {"status": "error", "message": "Mã đặt vé không tồn tại"}
+                else:
+                    cancelled.add(booking_id)
+                    free[trip] = free.get(trip, self.inventory.available(kind, *trip)) + len(booking.seats)
+            elif action not in BATCH_READ_ACTIONS:
+                error = {"status": "error", "message": "Hành động không hợp lệ"}
+            
+            if error is not None:
+                return {
+                    "status": "error",
+                    "message": f"Yêu cầu thứ {i + 1}: {error['message']}",
+                    "failed_index": i
+                }
+        return None
 
 if __name__ == "__main__":
-    server = BookingServer()
+    parser = argparse.ArgumentParser(description="Server đặt vé xe khách / xem phim")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9999)
+    parser.add_argument('--mode', choices=['threaded', 'async'], default='threaded',
+                        help="threaded: mỗi kết nối một thread; async: một event loop asyncio")
+    parser.add_argument('--backlog', type=int, default=128)
+    parser.add_argument('--max-connections', type=int, default=10000,
+                        help="Số kết nối đồng thời tối đa")
+    parser.add_argument('--workers', type=int, default=32, help="Số thread xử lý yêu cầu")
+    parser.add_argument('--max-pending', type=int, default=1024,
+                        help="Số yêu cầu chờ tối đa; vượt quá thì từ chối ngay (yêu cầu đọc bị từ chối trước)")
+    parser.add_argument('--rate-limit-ip', type=parse_rate, metavar='RATE[/BURST]',
+                        help="Giới hạn số yêu cầu mỗi giây của mỗi địa chỉ client")
+    parser.add_argument('--rate-limit-phone', type=parse_rate, metavar='RATE[/BURST]',
+                        help="Giới hạn số yêu cầu mỗi giây theo số điện thoại khách")
+    parser.add_argument('--db', help="Lưu booking bền vững vào file SQLite này (ví dụ booking.db)")
+    parser.add_argument('--journal', help="Lưu booking bằng nhật ký append-only trong thư mục này")
+    parser.add_argument('--journal-async', action='store_true',
+                        help="Trả lời trước khi nhật ký fsync xong (nhanh hơn, crash có thể mất booking vừa đặt)")
+    parser.add_argument('--shard', type=int, default=0,
+                        help="Số shard (0-31) ghi vào mã đặt vé, mỗi server chạy song song cần một số khác nhau")
+    parser.add_argument('--profile-slow', type=float, metavar='MS',
+                        help="Bật bộ lấy mẫu ngăn xếp cho yêu cầu chạy lâu hơn MS mili-giây")
+    parser.add_argument('--slow-ms', type=float, metavar='MS',
+                        help="Ghi lại yêu cầu chạy lâu hơn MS mili-giây vào stats (mặc định 100)")
+    parser.add_argument('--horizon-days', type=int, default=DEFAULT_HORIZON_DAYS,
+                        help="Bán vé trước tối đa bao nhiêu ngày")
+    parser.add_argument('--retention-days', type=int, default=DEFAULT_RETENTION_DAYS,
+                        help="Giữ bao nhiêu ngày đã qua trong bộ nhớ trước khi lưu trữ")
+    args = parser.parse_args()
+    
+    store = None
+    if args.db:
+        store = BookingStore(args.db)
+    elif args.journal:
+        store = BookingJournal(args.journal, durable=not args.journal_async)
+    server = BookingServer(args.host, args.port, backlog=args.backlog, store=store, shard=args.shard,
+                           max_connections=args.max_connections, workers=args.workers, max_pending=args.max_pending,
+                           address_limit=args.rate_limit_ip, phone_limit=args.rate_limit_phone,
+                           horizon_days=args.horizon_days, retention_days=args.retention_days)
+    if args.slow_ms:
+        server.metrics.set_profiling(False, args.slow_ms / 1000)
+    if args.profile_slow:
+        server.metrics.set_profiling(True, args.profile_slow / 1000)
+    if args.mode == 'async':
+        server = AsyncBookingServer(server, backlog=args.backlog, max_connections=args.max_connections)
     try:
         server.start_server()
     except KeyboardInterrupt:
@@ -0,0 +1,185 @@
+# Subscriptions.py
+# Đẩy số ghế trống tới các kết nối đã đăng ký (subscribe), thay cho việc kiosk
+# liên tục gọi get_buses / get_movies. Lượt đặt / hủy chỉ đánh dấu dịch vụ "đã đổi"
+# (O(1), không gửi gì); mỗi nhịp (tick) một thread gom các dịch vụ đã đổi thành
+# một tin duy nhất cho mỗi kết nối. Kết nối đọc chậm bị ngắt thay vì làm nghẽn server.
+
+import queue
+import socket
+import threading
+import time
+
+from Codec import JSON
+from Protocol import encode_message, pack_frame
+
+DEFAULT_TICK = 0.2
+MAX_PENDING_PUSHES = 64
+MAX_PENDING_BYTES = 1024 * 1024
+
+
+class AvailabilityHub:
+    """Danh sách kết nối đăng ký và các dịch vụ đổi số ghế trong nhịp hiện tại.
+
+    available(kind, service_id, date) -> số ghế trống hiện tại của chuyến (đọc lúc gửi, nên
+    tin luôn mang giá trị mới nhất dù chuyến đổi nhiều lần trong một nhịp).
+    """
+
+    def __init__(self, available, tick=DEFAULT_TICK):
+        self.available = available
+        self.tick = tick
+        self.sequence = 0
+        self.pushed = 0
+        self.dropped = 0
+        self._dirty = set()
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def changed(self, kind, service_id, date):
+        """Gọi từ luồng đặt / hủy vé: chỉ ghi nhận, không gửi gì"""
+        if self._subscribers:
+            with self._lock:
+                self._dirty.add((kind, service_id, date))
+
+    def subscribe(self, channel, kinds, service_ids=None, dates=None):
+        """Đăng ký (hoặc đổi bộ lọc) cho một kết nối; kinds: các loại 'bus' / 'movie';
+        service_ids / dates: None là mọi dịch vụ / mọi ngày"""
+        with self._lock:
+            self._subscribers[channel] = (frozenset(kinds), frozenset(service_ids) if service_ids else None,
+                                          frozenset(dates) if dates else None)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="availability-push", daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, channel):
+        with self._lock:
+            return self._subscribers.pop(channel, None) is not None
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                subscribers = list(self._subscribers.items())
+            if not dirty or not subscribers:
+                continue
+
+            self.sequence += 1
+            changes = [{'type': kind, 'id': service_id, 'date': date,
+                        'available_seats': self.available(kind, service_id, date)}
+                       for kind, service_id, date in sorted(dirty)]
+            # Mã hóa một lần cho mỗi bộ lọc và codec, không phải mỗi kết nối
+            frames = {}
+            for channel, selector in subscribers:
+                key = (selector, channel.codec.name)
+                if key not in frames:
+                    selected = [c for c in changes if _matches(selector, c['type'], c['id'], c['date'])]
+                    frames[key] = pack_frame(encode_message(
+                        {'event': 'availability', 'seq': self.sequence, 'changes': selected},
+                        channel.codec)) if selected else None
+                frame = frames[key]
+                if frame is None:
+                    continue
+                if channel.push(frame):
+                    self.pushed += 1
+                elif self.unsubscribe(channel):
+                    self.dropped += 1
+                    channel.close()
+
+
+def _matches(selector, kind, service_id, date):
+    kinds, service_ids, dates = selector
+    return (kind in kinds and (service_ids is None or service_id in service_ids)
+            and (dates is None or date in dates))
+
+
+class SocketChannel:
+    """Kết nối của server threaded: phản hồi và tin đẩy dùng chung một khóa gửi nên
+    khung không bị xen nhau. Tin đẩy đi qua hàng đợi có giới hạn và một thread ghi
+    riêng, thread đẩy không bao giờ chờ socket; hàng đợi đầy nghĩa là client đọc
+    quá chậm và kết nối bị ngắt."""
+
+    def __init__(self, sock, max_pending=MAX_PENDING_PUSHES):
+        self.socket = sock
+        self.send_lock = threading.Lock()
+        self.codec = JSON
+        self.closed = False
+        self._queue = queue.Queue(max_pending)
+        self._writer = None
+
+    def send(self, data):
+        with self.send_lock:
+            self.socket.sendall(data)
+
+    def push(self, frame):
+        if self.closed:
+            return False
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="push-writer", daemon=True)
+            self._writer.start()
+        try:
+            self._queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            return False
+
+    def _write_loop(self):
+        while not self.closed:
+            frames = [self._queue.get()]
+            while True:
+                try:
+                    frames.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in frames:
+                break
+            try:
+                self.send(b''.join(frames))
+            except OSError:
+                break
+
+    def close(self):
+        """Ngắt kết nối: recv() của thread phục vụ trả về và nó tự dọn dẹp"""
+        self.closed = True
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass  # thread ghi đang kẹt ở send, sẽ lỗi ngay khi socket bị shutdown
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class StreamChannel:
+    """Kết nối của server asyncio: tin đẩy được chuyển vào event loop; bộ đệm ghi
+    vượt max_bytes nghĩa là client đọc quá chậm và kết nối bị ngắt."""
+
+    def __init__(self, loop, writer, max_bytes=MAX_PENDING_BYTES):
+        self.loop = loop
+        self.writer = writer
+        self.max_bytes = max_bytes
+        self.codec = JSON
+        self.closed = False
+
+    def push(self, frame):
+        if self.closed:
+            return False
+        self.loop.call_soon_threadsafe(self._write, frame)
+        return True
+
+    def _write(self, frame):
+        if self.closed:
+            return
+        if self.writer.transport.get_write_buffer_size() > self.max_bytes:
+            self.closed = True
+            self.writer.transport.abort()
+            return
+        self.writer.write(frame)
+
+    def close(self):
+        self.closed = True
+        self.loop.call_soon_threadsafe(self.writer.transport.abort)
@@ -1,14 +1,147 @@
 # Utils.py
 # Các hàm tiện ích: log, validate dữ liệu, format kết quả
 
+import atexit
 import datetime
+import os
+import queue
+import threading
+import time
 
 # --- Logging ---
+# log_event chỉ đẩy sự kiện vào hàng đợi rồi trả về ngay; một thread nền ghi file
+# theo lô (giữ file mở, ghi có bộ đệm), xoay file theo dung lượng. Khi đĩa chậm và
+# hàng đợi đầy thì bỏ bớt sự kiện mới và ghi lại số sự kiện đã bỏ, không chặn người gọi.
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_QUEUE_SIZE = 10000
+LOG_FLUSH_INTERVAL = 0.5
+
+
+class EventLogger:
+    """Bộ ghi log không chặn cho một file"""
+
+    def __init__(self, logfile, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 queue_size=LOG_QUEUE_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        self.logfile = logfile
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._size = 0
+        self._last_second = None
+        self._last_stamp = ''
+        self._thread = threading.Thread(target=self._run, name=f"event-logger:{logfile}", daemon=True)
+        self._thread.start()
+
+    def log(self, message):
+        """Đưa sự kiện vào hàng đợi; trả về False nếu hàng đợi đầy và sự kiện bị bỏ"""
+        try:
+            self._queue.put_nowait((time.time(), message))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _timestamp(self, when):
+        # Chỉ định dạng lại khi sang giây mới
+        second = int(when)
+        if second != self._last_second:
+            self._last_second = second
+            self._last_stamp = datetime.datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+        return self._last_stamp
+
+    def _open(self):
+        self._file = open(self.logfile, "a", encoding="utf-8", buffering=65536)
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        """events.log -> events.log.1 -> events.log.2 ..., bỏ file cũ nhất"""
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.logfile}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.logfile}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.logfile, f"{self.logfile}.1")
+        else:
+            os.remove(self.logfile)
+        self._open()
+
+    def _write(self, batch):
+        if self._file is None:
+            self._open()
+        reported = self.dropped
+        if reported:
+            self.dropped -= reported
+            batch.append((time.time(), f"⚠️ Đã bỏ {reported} sự kiện do hàng đợi log đầy"))
+        lines = "".join(f"[{self._timestamp(when)}] {message}\n" for when, message in batch)
+        self._file.write(lines)
+        self._size += len(lines.encode("utf-8"))
+        if self._size >= self.max_bytes:
+            self._rotate()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._file is not None:
+                    self._file.flush()
+                continue
+
+            batch = []
+            while item is not None:
+                batch.append(item)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write(batch)
+                except OSError:
+                    self.dropped += len(batch)
+            if item is None:
+                if self._file is not None:
+                    self._file.close()
+                return
+
+    def close(self):
+        """Ghi nốt sự kiện còn trong hàng đợi rồi đóng file"""
+        self._queue.put(None)
+        self._thread.join()
+
+
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+
+def get_event_logger(logfile="events.log"):
+    logger = _loggers.get(logfile)
+    if logger is None:
+        with _loggers_lock:
+            logger = _loggers.get(logfile)
+            if logger is None:
+                logger = _loggers[logfile] = EventLogger(logfile)
+    return logger
+
+
 def log_event(message, logfile="events.log"):
-    """Ghi lại sự kiện vào file log"""
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(logfile, "a", encoding="utf-8") as f:
-        f.write(f"[{timestamp}] {message}\n")
+    """Ghi lại sự kiện vào file log (không chặn: thread nền sẽ ghi)"""
+    get_event_logger(logfile).log(message)
+
+
+@atexit.register
+def close_event_loggers():
+    """Ghi nốt log của mọi file trước khi thoát chương trình"""
+    with _loggers_lock:
+        loggers = list(_loggers.values())
+        _loggers.clear()
+    for logger in loggers:
+        logger.close()
 
 
 # --- Validation ---